@@ -1,40 +1,112 @@
 from .abmnq import abmnq
+from .assemblestokesletmatrices import assemblestokesletmatrices
 from .assemblestokesletmatrix import assemblestokesletmatrix
+from .assemblyprofile import AssemblyProfile
 from .computebasecases import computebasecases
+from .computebasecasesbatch import computebasecasesbatch
+from .computebasisblockspacked import computebasisblockspacked
 from .computeblocks import computeblocks
+from .computeblockspacked import computeblockspacked
+from .computecurvedfaceblocks import computecurvedfaceblocks
+from .computefaceblocks import computefaceblocks
+from .computefaceblocksnumba import computefaceblocksnumba
+from .computefaceblocksquadrature import computefaceblocksquadrature
+from .computefaceblocksquadrature import trianglequadrature
 from .computes0m1 import computes0m1
 from .computes0p1 import computes0p1
 from .computet001side import computet001side
 from .computet003side import computet003side
+from .elementbasis import elementbasis
+from .elementbasis import elementweights
+from .elementbasis import evaluatebasis
+from .evaluatevelocity import evaluatevelocity
+from .incrementalstokesletmatrix import IncrementalStokesletMatrix
+from .incrementalstokesletmatrix import runtimesteps
+from .iterativesolve import iterativesolve
+from .iterativesolve import nearfieldmatrix
+from .iterativesolve import nearfieldpreconditioner
+from .meshlibrary import MeshLibrary
+from .multibodystokesletoperator import MultiBodyStokesletOperator
+from .nearfarsplit import computefaceblocksnearfar
+from .nearfarsplit import nearfieldratio
+from .nearfarsplit import quadratureorder
+from .nearfarsplit import spatialorder
+from .quadraticelements import quadraticelements
 from .sphere_delaunay_python import sphere_delaunay_python
+from .sphere_gridfaces_icos2 import sphere_gridfaces_icos2
 from .sphere_gridpoints_icos2 import sphere_gridpoints_icos2 
 from .sphere_grid_icos_size import sphere_grid_icos_size
+from .stokeslethmatrix import StokesletHMatrix
+from .stokesletmatrixcache import StokesletMatrixCache
+from .stokesletoperator import StokesletOperator
+from .stokesletsolver import StokesletSolver
+from .stokeslettreecode import StokesletTreecode
+from .symmetricstokesletsolver import SymmetricStokesletSolver
 from .test_drag_sphere import test_drag_sphere
 from .test_drag_sphere_colab import test_drag_sphere_colab
+from .tmnqrecursion import tmnqrecursion
+from .tmnqrecursion import tmnqindex
 from .tmp1recursion import tmp1recursion
 from .tnp1recursion import tnp1recursion
 from .tqequals1 import tqequals1
 from .tqequals3 import tqequals3
+from .trianglemesh import TriangleMesh
 from .triangulatesphereicos import triangulatesphereicos
 
 __all__ = [
     "abmnq",
+    "assemblestokesletmatrices",
     "assemblestokesletmatrix",
+    "AssemblyProfile",
     "computebasecases",
+    "computebasecasesbatch",
+    "computebasisblockspacked",
     "computeblocks",
+    "computeblockspacked",
+    "computecurvedfaceblocks",
+    "computefaceblocks",
+    "computefaceblocksnearfar",
+    "computefaceblocksnumba",
+    "computefaceblocksquadrature",
     "computes0m1",
     "computes0p1",
     "computet001side",
     "computet003side",
+    "elementbasis",
+    "elementweights",
+    "evaluatebasis",
+    "evaluatevelocity",
+    "IncrementalStokesletMatrix",
+    "iterativesolve",
+    "MeshLibrary",
+    "MultiBodyStokesletOperator",
+    "nearfieldmatrix",
+    "nearfieldpreconditioner",
+    "nearfieldratio",
+    "quadraticelements",
+    "quadratureorder",
+    "runtimesteps",
+    "spatialorder",
     "sphere_delaunay_python",
+    "sphere_gridfaces_icos2",
     "sphere_gridpoints_icos2",
     "sphere_grid_icos_size",
+    "StokesletHMatrix",
+    "StokesletMatrixCache",
+    "StokesletOperator",
+    "StokesletSolver",
+    "StokesletTreecode",
+    "SymmetricStokesletSolver",
     "test_drag_sphere",
     "test_drag_sphere_colab",
+    "tmnqindex",
+    "tmnqrecursion",
     "tmp1recursion",
     "tnp1recursion",
     "tqequals1",
     "tqequals3",
+    "TriangleMesh",
+    "trianglequadrature",
     "triangulatesphereicos",
 ]
 
@@ -2,6 +2,17 @@ import numpy as np
 from scipy.integrate import dblquad, quad
 
 def abmnq(a001, se10p1, se20p1, sd0p1, se10m1, se20m1, sd0m1, geometryData):
+    # the recursions subtract nearly equal line integrals (R1 - R0, and
+    # a001 + 2 sdp1p1 - sdp2p1 near the sides), so they are evaluated in
+    # float64 even when the inputs are float32. Only the float64 reference
+    # path calls abmnq now; like the one of computet003side, this cast is a
+    # guard for callers passing float32
+    a001, se10p1, se20p1, sd0p1, se10m1, se20m1, sd0m1 = (
+        np.asarray(a, dtype=np.float64)
+        for a in (a001, se10p1, se20p1, sd0p1, se10m1, se20m1, sd0m1))
+    geometryData = {key: np.asarray(value, dtype=np.float64)
+                    for key, value in geometryData.items()}
+
     # Unpackage geometryData (M x 1 vectors)
     x0DotV = geometryData['x0DotV']
     x1DotW = geometryData['x1DotW']
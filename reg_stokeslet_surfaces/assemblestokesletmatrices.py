@@ -0,0 +1,81 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import (DEFAULT_BLOCK_PAIRS,
+                                                            addpackedblockcolumns)
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+
+def assemblestokesletmatrices(xField, TriangleArray, numberTrianglePoints, regularizations, mu,
+                              blockSize=None, stacked=True, sweepSize=None):
+    """
+    ASSEMBLESTOKESLETMATRICES assembles the regularized Stokeslet surface
+    matrices of several regularizations in one sweep: the geometry of every
+    (face, field point) pair is computed once and only the integrals that
+    depend on the regularization are evaluated for each value (see
+    computebasecasesbatch).
+
+    Parameters:
+        xField: 3 x M array of field points
+        TriangleArray: TriangleMesh, or list of Q dictionaries where Q is the number
+        of triangular faces.
+        numberTrianglePoints: number of unique points that make up triangulation
+        regularizations: E values of the blob parameter
+        mu: viscosity parameter
+        blockSize: number of faces per block. By default it is chosen so that
+        a block holds about DEFAULT_BLOCK_PAIRS (face, field point,
+        regularization) triples.
+        stacked: if True (default) return all matrices in one array,
+        otherwise a generator yielding them one at a time
+        sweepSize: for stacked=False, number of regularizations assembled
+        together (all by default); bounds the memory to sweepSize matrices
+
+    Output:
+        A: E x 3M x 3V array, A[e] the matrix of assemblestokesletmatrix with
+        regularizations[e], or a generator of the E matrices
+    """
+    regularizations = np.atleast_1d(np.asarray(regularizations, dtype=float))
+    if stacked:
+        return assemblesweep(xField, TriangleArray, numberTrianglePoints, regularizations, mu,
+                             blockSize)
+
+    if sweepSize is None:
+        sweepSize = regularizations.size
+
+    def generatematrices():
+        for start in range(0, regularizations.size, sweepSize):
+            yield from assemblesweep(xField, TriangleArray, numberTrianglePoints,
+                                     regularizations[start:start + sweepSize], mu, blockSize)
+
+    return generatematrices()
+
+
+def assemblesweep(xField, TriangleArray, numberTrianglePoints, regularizations, mu, blockSize):
+    """
+    E x 3M x 3V matrices of the E regularizations, assembled blockSize faces
+    at a time.
+    """
+    faceData = TriangleMesh.fromdicts(TriangleArray).facedata()
+    numberFieldPoints = xField.shape[1]
+    numberRegularizations = regularizations.size
+    if blockSize is None:
+        blockSize = max(1, DEFAULT_BLOCK_PAIRS // max(numberFieldPoints * numberRegularizations, 1))
+
+    # the stacked matrices are the rows of E M field points, one scatter per
+    # block of faces adds the blocks of all regularizations
+    stokesletMatrices = np.zeros((numberRegularizations, 3 * numberFieldPoints,
+                                  3 * numberTrianglePoints))
+    stokesletRows = stokesletMatrices.reshape(-1, 3 * numberTrianglePoints)
+    numberFaces = faceData['bh'].shape[0]
+    for start in range(0, numberFaces, blockSize):
+        block = slice(start, min(start + blockSize, numberFaces))
+        blockData = {key: value[block] for key, value in faceData.items()}
+
+        # E x Qb x 3 x M x 6 -> Qb x 3 x (E M) x 6
+        packedBlocks = computefaceblocks(xField, blockData, regularizations)
+        packedBlocks = np.moveaxis(packedBlocks, 0, 2).reshape(
+            packedBlocks.shape[1:3] + (-1, 6))
+
+        addpackedblockcolumns(stokesletRows, packedBlocks, blockData['indices'],
+                              blockData['bh'] / (8 * np.pi * mu))
+    return stokesletMatrices
@@ -1,62 +1,361 @@
-import numpy as np 
+from concurrent.futures import ProcessPoolExecutor
+import os
+import tempfile
 
-from reg_stokeslet_surfaces.computebasecases import computebasecases 
-from reg_stokeslet_surfaces.tqequals1 import tqequals1 
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+from reg_stokeslet_surfaces.computebasecases import computebasecases
+from reg_stokeslet_surfaces.tqequals1 import tqequals1
 from reg_stokeslet_surfaces.tqequals3 import tqequals3
 from reg_stokeslet_surfaces.computeblocks import computeblocks
+from reg_stokeslet_surfaces.computefaceblocksnumba import computefaceblocksnumba, faceblocksbackend
+from reg_stokeslet_surfaces.computeblockspacked import PACKED_INDEX
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.computecurvedfaceblocks import computecurvedfaceblocks
+from reg_stokeslet_surfaces.elementbasis import ELEMENT_NODES
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+from reg_stokeslet_surfaces.nearfarsplit import (DEFAULT_QUADRATURE_TOL, computefaceblocksnearfar,
+                                                 facesizes, nearfieldratio, spatialorder)
+
+# number of (face, field point) pairs evaluated together by the batched engine
+DEFAULT_BLOCK_PAIRS = 2**16
+# number of field points per task of the parallel assembly
+DEFAULT_PARALLEL_TILE_POINTS = 256
+
+# precisions the matrix can be stored in
+MATRIX_DTYPES = (np.float32, np.float64)
+
+# shared output and inputs of a parallel assembly worker process
+WORKER_STATE = {}
+# memory-backed file system holding the matrix of a parallel assembly, when there is one
+SHARED_MEMORY_DIRECTORY = '/dev/shm'
 
 
-def assemblestokesletmatrix(xField, TriangleArray, numberTrianglePoints, regularization, mu):
+def assemblestokesletmatrix(xField, TriangleArray, numberTrianglePoints, regularization, mu,
+                            method='batched', blockSize=None, nearRatio=None,
+                            tol=DEFAULT_QUADRATURE_TOL, workers=None,
+                            tileSize=DEFAULT_PARALLEL_TILE_POINTS, backend='numpy',
+                            elements=None, nodes=None, dtype=np.float64):
     """
-    ASSEMBLESTOKESLETMATRIX assembles the regularized Stokeslet surface matrix. 
+    ASSEMBLESTOKESLETMATRIX assembles the regularized Stokeslet surface matrix.
     Parameters:
-        xField: 3 x M array of field points 
-        TriangleArray: list of Q dictionaries where Q is the number of triangular faces. 
+        xField: 3 x M array of field points
+        TriangleArray: TriangleMesh, or list of Q dictionaries where Q is the number
+        of triangular faces.
         numberTrianglePoints: number of unique points that make up triangulation
         regularization: blob parameter
         mu: viscosity parameter
+        method: 'batched' (default) evaluates blocks of faces against all
+        field points at once, 'nearfar' does the same but with the analytic
+        integrals only near every face and quadrature in the far field,
+        'reference' runs the original loop over faces
+        blockSize: number of faces per block for the batched methods. By
+        default it is chosen so that a block holds about DEFAULT_BLOCK_PAIRS
+        (face, field point) pairs.
+        nearRatio: for 'nearfar', distance to face radius ratio below which
+        the analytic integrals are used (nearfieldratio(tol) by default)
+        tol: for 'nearfar', relative error tolerance of the quadrature
+        workers: number of worker processes. By default the assembly runs in
+        this process; otherwise the field points are split into tiles of
+        tileSize points, assembled by a process pool straight into a
+        shared memory-mapped matrix, which is returned (see
+        assembleparallel)
+        tileSize: number of field points per task of the parallel assembly
+        backend: 'numpy' (default) or 'numba', which computes the analytic
+        integrals of every (face, field point) pair in one compiled loop
+        (see computefaceblocksnumba). Falls back to NumPy with a warning
+        when numba is not installed.
+        elements: optional Q x 6 array of node indices of quadratic elements
+        (see quadraticelements). The forces then vary quadratically over
+        every face, numberTrianglePoints counts the nodes, and the columns
+        belong to the nodes. Only assembled by the batched NumPy engine.
+        nodes: optional 3 x V array of the nodes of the elements. The
+        elements are then curved (isoparametric) through their six nodes
+        (see computecurvedfaceblocks) instead of flat faces with the nodes
+        at the midpoints of their sides.
+        dtype: precision of the stored matrix, np.float64 (default) or
+        np.float32, which halves its memory. The integrals are computed in
+        float64 either way and rounded once when added into the matrix.
     Output:
         A: 3M x 3V regularized Stokeslet surface matrix which is related to the
-        velocity U at the field points xf by U = A*F where F are the forces at 
-        the V distinct vertices of the Q triangular faces.
+        velocity U at the field points xf by U = A*F where F are the forces at
+        the V distinct vertices of the Q triangular faces (or at the V nodes
+        of the elements).
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in MATRIX_DTYPES:
+        raise ValueError(f"unsupported matrix dtype {dtype}, only float32 and float64")
+    # field points given in float32 would carry their rounding into the
+    # nearly cancelling terms of the integrals
+    xField = np.asarray(xField, dtype=np.float64)
+
+    if method == 'reference':
+        return assemblestokesletmatrixreference(xField, TriangleArray, numberTrianglePoints,
+                                                regularization, mu).astype(dtype, copy=False)
+    if method not in ('batched', 'nearfar'):
+        raise ValueError(f"unknown assembly method '{method}'")
+    # checked once here, so a missing numba is reported only once
+    if faceblocksbackend(backend) is not computefaceblocksnumba:
+        backend = 'numpy'
+
+    faceData = TriangleMesh.fromdicts(TriangleArray).facedata()
+    numberFieldPoints = xField.shape[1]
+
+    degree = 1
+    if elements is not None:
+        if method != 'batched' or backend != 'numpy':
+            raise ValueError("quadratic elements are only assembled by the batched method "
+                             "with the numpy backend")
+        elements = np.asarray(elements, dtype=int)
+        if elements.shape != (faceData['bh'].shape[0], ELEMENT_NODES[2]):
+            raise ValueError(f"elements must be a Q x {ELEMENT_NODES[2]} array of node indices")
+        faceData['indices'] = elements
+        degree = 2
+        if nodes is not None:
+            faceData['nodes'] = np.moveaxis(np.asarray(nodes, dtype=float)[:, elements], 0, 1)
+    elif nodes is not None:
+        raise ValueError("nodes are only used with the elements they belong to")
+
+    if method == 'nearfar':
+        if nearRatio is None:
+            nearRatio = nearfieldratio(tol)
+        # visit faces and field points in spatially compact blocks and tiles
+        faceOrder = spatialorder(facesizes(faceData)[0].T)
+        faceData = {key: value[faceOrder] for key, value in faceData.items()}
+        pointOrder = spatialorder(xField)
+        xField = xField[:, pointOrder]
+
+    if workers is not None:
+        if blockSize is None:
+            blockSize = max(1, DEFAULT_BLOCK_PAIRS // tileSize)
+        stokesletMatrix = assembleparallel(xField, faceData, numberTrianglePoints, regularization,
+                                           mu, method, blockSize, nearRatio, tol, workers,
+                                           tileSize, backend, degree, dtype)
+    else:
+        if blockSize is None:
+            blockSize = max(1, DEFAULT_BLOCK_PAIRS // max(numberFieldPoints, 1))
+        stokesletMatrix = np.zeros((3 * numberFieldPoints, 3 * numberTrianglePoints), dtype=dtype)
+        assemblerows(stokesletMatrix, xField, faceData, regularization, mu, method, blockSize,
+                     nearRatio, tol, backend, degree)
+
+    if method == 'nearfar':
+        # back to the original order of the field points
+        unsortedMatrix = np.empty_like(stokesletMatrix)
+        unsortedMatrix.reshape(numberFieldPoints, -1)[pointOrder] = \
+            stokesletMatrix.reshape(numberFieldPoints, -1)
+        stokesletMatrix = unsortedMatrix
+
+    return stokesletMatrix
+
+
+def requirelinearelements(options, owner):
+    """
+    Raises ValueError when the assembly options of a class collocating at the
+    vertices of the faces ask for quadratic elements, whose extra nodes it
+    would leave out of its points.
+    """
+    if options.get('elements') is not None or options.get('nodes') is not None:
+        raise ValueError(f"{owner} collocates at the vertices of linear elements, "
+                         "quadratic elements are not supported")
+
+
+def assemblerows(stokesletRows, xField, faceData, regularization, mu, method, blockSize,
+                 nearRatio, tol, backend='numpy', degree=1):
+    """
+    Adds the blocks of all faces, blockSize faces at a time, to the rows of
+    the Stokeslet matrix belonging to the field points xField, in place.
+
+    Parameters:
+        stokesletRows: 3M x 3V rows of the matrix (C contiguous)
+        xField: 3 x M array of field points
+        faceData: dictionary of stacked triangle data
+        method, blockSize, nearRatio, tol, backend: see assemblestokesletmatrix
+        degree: degree of the elements (see computefaceblocks), the nodes of
+        the faces are faceData['indices']; the elements are curved when
+        faceData has their 'nodes' (see computecurvedfaceblocks)
+    """
+    faceblocks = faceblocksbackend(backend)
+    numberFaces = faceData['bh'].shape[0]
+    for start in range(0, numberFaces, blockSize):
+        block = slice(start, min(start + blockSize, numberFaces))
+        blockData = {key: value[block] for key, value in faceData.items()}
+
+        if method == 'nearfar':
+            packedBlocks = computefaceblocksnearfar(xField, blockData, regularization,
+                                                    nearRatio, tol, backend=backend)
+        elif 'nodes' in blockData:
+            packedBlocks = computecurvedfaceblocks(xField, blockData, regularization, tol)
+        elif degree > 1:
+            packedBlocks = computefaceblocks(xField, blockData, regularization, degree)
+        else:
+            packedBlocks = faceblocks(xField, blockData, regularization)
+
+        addpackedblockcolumns(stokesletRows, packedBlocks, blockData['indices'],
+                              blockData['bh'] / (8 * np.pi * mu))
+    return stokesletRows
+
+
+def assembleparallel(xField, faceData, numberTrianglePoints, regularization, mu, method,
+                     blockSize, nearRatio, tol, workers, tileSize, backend='numpy', degree=1,
+                     dtype=np.float64):
+    """
+    Assembles the Stokeslet matrix with a pool of worker processes.
+
+    The output is a np.memmap of a temporary file, in SHARED_MEMORY_DIRECTORY
+    when it exists (so in memory) and in the default temporary directory
+    otherwise. Every task assembles the rows of one tile of tileSize field
+    points with assemblerows and writes them in place through its own
+    mapping of the file, so no worker holds a copy of the matrix. The shared
+    vertex columns are summed within a task over the same face blocks in the
+    same order whatever the number of workers, and no two tasks write the
+    same rows, so the result is bit-for-bit the same for any number of
+    workers.
+
+    The mapping is returned as it is, so the peak memory is one matrix. The
+    file is removed once the workers are done and its memory is freed with
+    the last reference to the matrix. Where a mapped file cannot be removed
+    (Windows), the matrix is copied out of it first, which needs twice the
+    memory of the matrix at the end.
+
+    Output:
+        stokesletMatrix: 3M x 3V np.memmap (or array) of the given dtype
+    """
+    dtype = np.dtype(dtype)
+    numberFieldPoints = xField.shape[1]
+    shape = (3 * numberFieldPoints, 3 * numberTrianglePoints)
+    if shape[0] * shape[1] == 0:
+        return np.zeros(shape, dtype=dtype)
+    tiles = [(start, min(start + tileSize, numberFieldPoints))
+             for start in range(0, numberFieldPoints, tileSize)]
+
+    directory = SHARED_MEMORY_DIRECTORY if os.path.isdir(SHARED_MEMORY_DIRECTORY) else None
+    handle, path = tempfile.mkstemp(dir=directory, suffix='.stokeslet')
+    os.close(handle)
+    try:
+        # a new file maps to zeros
+        stokesletMatrix = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+        with ProcessPoolExecutor(max_workers=workers, initializer=initassemblyworker,
+                                 initargs=(path, shape, xField, faceData, regularization, mu,
+                                           method, blockSize, nearRatio, tol, backend, degree,
+                                           dtype)) as pool:
+            for _ in pool.map(assembletile, tiles):
+                pass
+    except BaseException:
+        os.remove(path)
+        raise
+    try:
+        # the mapping stays valid without the file name
+        os.remove(path)
+    except PermissionError:
+        stokesletMatrix = np.array(stokesletMatrix)
+        os.remove(path)
+    return stokesletMatrix
+
+
+def initassemblyworker(path, shape, xField, faceData, regularization, mu, method, blockSize,
+                       nearRatio, tol, backend, degree, dtype):
+    WORKER_STATE.update(path=path, shape=shape, dtype=dtype, xField=xField,
+                        faceData=faceData, regularization=regularization, mu=mu, method=method,
+                        blockSize=blockSize, nearRatio=nearRatio, tol=tol, backend=backend,
+                        degree=degree)
+
+
+def assembletile(tile):
+    """
+    Task of assembleparallel: assembles the rows of the field points
+    start:stop into the shared matrix.
+    """
+    start, stop = tile
+    state = WORKER_STATE
+    sharedMatrix = np.memmap(state['path'], dtype=state['dtype'], mode='r+',
+                             shape=state['shape'])
+    assemblerows(sharedMatrix[3 * start:3 * stop], state['xField'][:, start:stop],
+                 state['faceData'], state['regularization'], state['mu'], state['method'],
+                 state['blockSize'], state['nearRatio'], state['tol'], state['backend'],
+                 state['degree'])
+    del sharedMatrix
+
+
+@profilestage('addpackedblockcolumns')
+def addpackedblockcolumns(stokesletMatrix, packedBlocks, indices, scale):
+    """
+    Adds the packed blocks of a block of faces into the block columns of the
+    Stokeslet matrix, in place.
+
+    Parameters:
+        stokesletMatrix: 3M x 3V matrix (C contiguous), float64 or float32
+        packedBlocks: Qb x K x M x 6 array of packed blocks, one per node
+        of every face (K = 3, the vertices, for linear elements)
+        indices: Qb x K array of node indices of the faces
+        scale: Qb array multiplying the blocks of every face, bh / (8 pi mu)
+
+    Output:
+        stokesletMatrix
+    """
+    numberBlockFaces, numberNodes, numberFieldPoints, _ = packedBlocks.shape
+    numberTrianglePoints = stokesletMatrix.shape[1] // 3
+
+    # sum the contributions of all faces sharing a node with a sparse
+    # incidence product, so every node column is written only once
+    uniqueIndices, inverse = np.unique(indices.ravel(), return_inverse=True)
+    incidence = csr_matrix((np.repeat(scale, numberNodes),
+                            (inverse.ravel(), np.arange(numberNodes * numberBlockFaces))),
+                           shape=(uniqueIndices.size, numberNodes * numberBlockFaces))
+    columnSums = incidence @ packedBlocks.reshape(numberNodes * numberBlockFaces, -1)
+    columnSums = columnSums.reshape(uniqueIndices.size, numberFieldPoints, 6)
+
+    # expand the six components into the 3 x 3 blocks of the vertex columns
+    stokesletView = stokesletMatrix.reshape(numberFieldPoints, 3, numberTrianglePoints, 3)
+    stokesletView[:, :, uniqueIndices, :] += \
+        columnSums[..., PACKED_INDEX].transpose(1, 2, 0, 3)
+    return stokesletMatrix
+
+
+def assemblestokesletmatrixreference(xField, TriangleArray, numberTrianglePoints, regularization, mu):
     """
-    
+    Reference assembly looping over the faces one at a time. Same parameters
+    and output as assemblestokesletmatrix; kept to check the batched engine.
+    """
+
+    @profilestage('addBlockColumn')
     def addBlockColumn(stokesletMatrix, block, index, bh):
         stokesletMatrix[:, 3 * index: 3 * index + 3] += \
-            block * (bh / (8 * np.pi * mu)) 
-        return stokesletMatrix 
-    
+            block * (bh / (8 * np.pi * mu))
+        return stokesletMatrix
+
     numberFaces = len(TriangleArray)
     numberFieldPoints = xField.shape[1]
 
     stokesletMatrix = np.zeros((3 * numberFieldPoints, 3 * numberTrianglePoints))
-    
+
     #print(f"shape of stokeslet matrix =  {stokesletMatrix.shape}")
 
     for q in range(numberFaces):
         # triangle q
         Triangle = TriangleArray[q]
         bh = Triangle['bh']
-        
+
         #print(f"bh = {Triangle['bh']}")
 
         # compute the base cases
         t003, t001, se1m1, se2m1, sdm1, se1p1, se2p1, sdp1, geometryData = \
-            computebasecases(xField, Triangle, regularization)  
-        
+            computebasecases(xField, Triangle, regularization)
+
 
         # compute the other T_{mnq} recursively
         t101, t011 = tqequals1(se1m1, se2m1, sdm1, t001, geometryData)
         t103, t013, t203, t023, t113, t303, t033, t213, t123 = \
-            tqequals3(se1p1, se2p1, sdp1, se1m1, se2m1, sdm1, t001, t003, 
+            tqequals3(se1p1, se2p1, sdp1, se1m1, se2m1, sdm1, t001, t003,
                        t101, t011, geometryData)
-        
+
         #print(t213)
 
         # compute the block columns for the stokeslet matrix
-        b0, b1, b2 = computeblocks(geometryData, t001, t101, t011, 
-                                    t003, t103, t013, t203, t023, 
-                                    t113, t303, t033, t213, t123, 
+        b0, b1, b2 = computeblocks(geometryData, t001, t101, t011,
+                                    t003, t103, t013, t203, t023,
+                                    t113, t303, t033, t213, t123,
                                     regularization)
 
         # put the blocks into relevant block columns corresponding to indices
@@ -67,4 +366,4 @@ def assemblestokesletmatrix(xField, TriangleArray, numberTrianglePoints, regular
         stokesletMatrix = addBlockColumn(stokesletMatrix, b1.T, index1, bh)
         stokesletMatrix = addBlockColumn(stokesletMatrix, b2.T, index2, bh)
 
-    return stokesletMatrix
\ No newline at end of file
+    return stokesletMatrix
@@ -0,0 +1,135 @@
+import functools
+import json
+import time
+
+import numpy as np
+
+# the profiles collecting the stages, innermost last; empty when profiling is off
+ACTIVE_PROFILES = []
+
+
+def outputbytes(result, arguments=()):
+    """
+    Bytes of the arrays in a stage result (an array, or a tuple or dict of
+    them), except those among the arguments, i.e. updated in place.
+    """
+    if isinstance(result, np.ndarray):
+        return 0 if any(result is argument for argument in arguments) else result.nbytes
+    if isinstance(result, dict):
+        result = result.values()
+    elif not isinstance(result, (tuple, list)):
+        return 0
+    return sum(outputbytes(value, arguments) for value in result)
+
+
+def profilestage(stage):
+    """
+    Decorator recording the calls of a hot path function as the stage of
+    the active AssemblyProfile objects. With no active profile the call
+    goes straight through, at the cost of one list test.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def profiled(*args, **kwargs):
+            if not ACTIVE_PROFILES:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            outputBytes = outputbytes(result, args)
+            for profile in ACTIVE_PROFILES:
+                profile.record(stage, seconds, outputBytes)
+            return result
+        return profiled
+    return decorate
+
+
+def countbranch(branch, mask):
+    """
+    Adds the number of entries of mask that take the special case branch to
+    the active profiles. The mask is not counted when profiling is off.
+    """
+    if ACTIVE_PROFILES:
+        count = int(np.count_nonzero(mask))
+        for profile in ACTIVE_PROFILES:
+            profile.branches[branch] = profile.branches.get(branch, 0) + count
+
+
+class AssemblyProfile:
+    """
+    Opt-in instrumentation of the assembly hot path. Within
+
+        with AssemblyProfile() as profile:
+            A = assemblestokesletmatrix(...)
+        print(profile.report())
+
+    every call of an instrumented stage (see profilestage) adds its wall
+    time, one call and its output bytes to the stage, and the special cases
+    (e.g. x0.n ~ 0 or 1 - gamma/(ell q) ~ 0) count the (face, field point)
+    pairs taking them. Stage times are inclusive: the side integrals are
+    also part of the base cases that call them.
+
+    The output bytes ('outputBytes') only count the new arrays a stage
+    returns, not its temporaries nor its peak memory: they measure the
+    traffic between stages. The peak memory of a whole assembly is the
+    tracemalloc peak recorded by runbenchmarks.
+
+    Only this process is profiled, not the workers of a parallel assembly,
+    nor the inside of the numba kernels (one 'computefaceblocksnumba' stage).
+    """
+
+    def __init__(self, callback=None):
+        """
+        Parameters:
+            callback: optional function callback(stage, seconds, outputBytes)
+            called after every instrumented call, e.g. to stream to a monitor
+        """
+        self.callback = callback
+        self.stages = {}
+        self.branches = {}
+        self.seconds = 0.0
+
+    def __enter__(self):
+        ACTIVE_PROFILES.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.seconds += time.perf_counter() - self.start
+        ACTIVE_PROFILES.remove(self)
+        return False
+
+    def record(self, stage, seconds, outputBytes):
+        """Adds one call of stage."""
+        entry = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0, 'outputBytes': 0})
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        entry['outputBytes'] += outputBytes
+        if self.callback is not None:
+            self.callback(stage, seconds, outputBytes)
+
+    def todict(self):
+        """The totals: 'seconds' profiled, 'stages' and 'branches'."""
+        return {'seconds': self.seconds,
+                'stages': {stage: dict(entry) for stage, entry in self.stages.items()},
+                'branches': dict(self.branches)}
+
+    def tojson(self, path=None):
+        """JSON of todict(), also written to path if given."""
+        text = json.dumps(self.todict(), indent=2)
+        if path is not None:
+            with open(path, 'w') as jsonFile:
+                jsonFile.write(text)
+        return text
+
+    def report(self):
+        """Table of the stages, slowest first, and of the branch counts."""
+        lines = [f"{'stage':28s} {'calls':>8s} {'seconds':>10s} {'share':>7s} {'out MiB':>10s}"]
+        for stage, entry in sorted(self.stages.items(), key=lambda item: -item[1]['seconds']):
+            share = entry['seconds'] / self.seconds if self.seconds > 0 else 0.0
+            lines.append(f"{stage:28s} {entry['calls']:8d} {entry['seconds']:10.4f} "
+                         f"{100 * share:6.1f}% {entry['outputBytes'] / 2**20:10.1f}")
+        lines.append(f"{'total':28s} {'':8s} {self.seconds:10.4f}")
+        for branch, count in sorted(self.branches.items()):
+            lines.append(f"branch {branch:21s} {count:8d}")
+        return '\n'.join(lines)
@@ -1,5 +1,6 @@
 import numpy as np
 
+from reg_stokeslet_surfaces.assemblyprofile import countbranch, profilestage
 from reg_stokeslet_surfaces.computet003side import computet003side 
 from reg_stokeslet_surfaces.computet001side import computet001side 
 from reg_stokeslet_surfaces.computes0p1 import computes0p1 
@@ -7,6 +8,7 @@ from reg_stokeslet_surfaces.computes0m1 import computes0m1
 
 import numpy as np
 
+@profilestage('computebasecases')
 def computebasecases(xField, Triangle, regularization):
     """
     Compute base cases for regularized Stokeslet surface integrals on a triangle.
@@ -42,6 +44,9 @@ def computebasecases(xField, Triangle, regularization):
     x0DotV = np.zeros(M)
     x1DotW = np.zeros(M)
     x2DotD = np.zeros(M)
+    x0DotN1 = np.zeros(M)
+    x1DotN2 = np.zeros(M)
+    x2DotN3 = np.zeros(M)
 
     ell1 = 0
     ell2 = 0
@@ -62,7 +67,9 @@ def computebasecases(xField, Triangle, regularization):
 
         if i == 0:
             r2Proj = np.sum(x0i * x0i, axis=0) - x0DotNi**2 - x0DotVi**2
-            r2Proj[r2Proj < np.finfo(float).eps] = 0
+            r2ProjEq0 = r2Proj < np.finfo(float).eps
+            countbranch('r2Proj=0', r2ProjEq0)
+            r2Proj[r2ProjEq0] = 0
             gamma = np.sqrt(r2Proj + regularization**2)
 
             what = Triangle['directions'][:, i + 1].reshape(3, 1)
@@ -83,18 +90,21 @@ def computebasecases(xField, Triangle, regularization):
             se1m1 += s0m1
             R0 += np.sqrt(np.sum(x0i * x0i, axis=0) + regularization**2)
             x0DotV += x0DotVi
+            x0DotN1 += x0DotNi
             ell1 += sideiLength
         elif i == 1:
             se2p1 += s0p1
             se2m1 += s0m1
             R1 += np.sqrt(np.sum(x0i * x0i, axis=0) + regularization**2)
             x1DotW += x0DotVi
+            x1DotN2 += x0DotNi
             ell2 += sideiLength
         elif i == 2:
             sdp1 += s0p1
             sdm1 += s0m1
             R2 += np.sqrt(np.sum(x0i * x0i, axis=0) + regularization**2)
             x2DotD += x0DotVi
+            x2DotN3 += x0DotNi
             ell3 += sideiLength
 
     t003 = t003 / gamma
@@ -111,6 +121,10 @@ def computebasecases(xField, Triangle, regularization):
         'x0DotW': x0DotW,
         'x1DotW': x1DotW,
         'x2DotD': x2DotD,
+        'x0DotN1': x0DotN1,
+        'x1DotN2': x1DotN2,
+        'x2DotN3': x2DotN3,
+        'gamma': gamma,
         'R0': R0,
         'R1': R1,
         'R2': R2,
@@ -0,0 +1,130 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.computet003side import computet003side
+from reg_stokeslet_surfaces.computet001side import computet001side
+from reg_stokeslet_surfaces.computes0p1 import computes0p1
+from reg_stokeslet_surfaces.computes0m1 import computes0m1
+from reg_stokeslet_surfaces.assemblyprofile import countbranch, profilestage
+
+
+@profilestage('computebasecasesbatch')
+def computebasecasesbatch(xField, faceData, regularization):
+    """
+    Compute base cases for a block of triangles at once. This is the batched
+    counterpart of computebasecases: every output has a leading face axis, so
+    the side integrals and the recursions that follow are evaluated for all
+    (face, field point) pairs of the block in single vectorized calls.
+
+    Parameters:
+        xField : np.ndarray
+            3 x M array of field points shared by all faces, or Qb x 3 x M
+            array with separate field points for every face.
+        faceData : dict
+            Stacked data for Qb triangles with keys 'vertices',
+            'normalstosides', 'directions' (Qb x 3 x 3, columns as in the
+            triangle dictionaries), 'lengths' (Qb x 3) and 'bh' (Qb,).
+        regularization : float or np.ndarray
+            Regularization parameter ε, or an array of E values for a sweep:
+            the geometry that does not depend on ε is computed once and
+            broadcast (without copies) along a leading ε axis.
+
+    Returns:
+        t003, t001, se1m1, se2m1, sdm1, se1p1, se2p1, sdp1 : (Qb, M) arrays,
+            (E, Qb, M) for a sweep
+        geometryData : dict
+            Same keys as in computebasecases. Field point quantities are
+            (Qb, M) arrays, (E, Qb, M) for a sweep ('x0' is Qb x 3 x M),
+            per-face scalars are (Qb, 1) arrays so that they broadcast
+            against the field point axis.
+    """
+
+    def dot3(x, y):
+        # x is Qb x 3 x M, y is Qb x 3; same summation order as np.sum(axis=0)
+        return x[:, 0, :] * y[:, 0:1] + x[:, 1, :] * y[:, 1:2] + x[:, 2, :] * y[:, 2:3]
+
+    if xField.ndim == 2:
+        xField = xField[np.newaxis, :, :]
+
+    if np.ndim(regularization) > 0:
+        # sweep: the regularizations along a leading axis of everything that
+        # depends on them, the geometry broadcast along it as read-only views
+        regularization = np.reshape(np.asarray(regularization, dtype=float), (-1, 1, 1))
+        def sweep(x):
+            return np.broadcast_to(x, regularization.shape[:1] + x.shape)
+    else:
+        def sweep(x):
+            return x
+
+    vertices = faceData['vertices']
+    normalstosides = faceData['normalstosides']
+    directions = faceData['directions']
+    lengths = faceData['lengths']
+    bh = faceData['bh'][:, np.newaxis]
+
+    t003 = 0
+    t001 = 0
+    sideData = []
+
+    for i in range(3):
+        x0i = xField - vertices[:, :, i:i + 1]
+        sideiLength = lengths[:, i:i + 1]
+
+        x0DotNi = dot3(x0i, normalstosides[:, :, i])
+        x0DotVi = dot3(x0i, directions[:, :, i])
+        x0iSquared = x0i[:, 0, :]**2 + x0i[:, 1, :]**2 + x0i[:, 2, :]**2
+
+        if i == 0:
+            r2Proj = x0iSquared - x0DotNi**2 - x0DotVi**2
+            r2ProjEq0 = r2Proj < np.finfo(float).eps
+            countbranch('r2Proj=0', r2ProjEq0)
+            r2Proj[r2ProjEq0] = 0
+            gamma = np.sqrt(r2Proj + regularization**2)
+
+            vhat = directions[:, :, 0]
+            what = directions[:, :, 1]
+            x0DotW = sweep(dot3(x0i, what))
+            vDotW = (vhat[:, np.newaxis, :] @ what[:, :, np.newaxis])[:, 0, :]
+            x0 = x0i
+
+        x0DotNi = sweep(x0DotNi)
+        x0DotVi = sweep(x0DotVi)
+        t003 = t003 + computet003side(x0DotVi, x0DotNi, gamma, sideiLength)
+        s0p1 = computes0p1(x0DotVi, x0DotNi, gamma, sideiLength)
+        t001 = t001 + computet001side(s0p1, x0DotNi, sideiLength)
+        s0m1 = computes0m1(x0DotVi, x0DotNi, gamma, sideiLength)
+
+        Ri = np.sqrt(x0iSquared + regularization**2)
+        sideData.append((s0p1, s0m1, Ri, x0DotVi, x0DotNi, sideiLength))
+
+    (se1p1, se1m1, R0, x0DotV, x0DotN1, ell1), (se2p1, se2m1, R1, x1DotW, x1DotN2, ell2), \
+        (sdp1, sdm1, R2, x2DotD, x2DotN3, ell3) = sideData
+
+    t003 = t003 / gamma
+    t001 = t001 - gamma**2 * t003
+
+    t003 = t003 / bh
+    t001 = t001 / bh
+
+    geometryData = {
+        'x0': x0,
+        'vhat': vhat,
+        'what': what,
+        'x0DotV': x0DotV,
+        'x0DotW': x0DotW,
+        'x1DotW': x1DotW,
+        'x2DotD': x2DotD,
+        'x0DotN1': x0DotN1,
+        'x1DotN2': x1DotN2,
+        'x2DotN3': x2DotN3,
+        'gamma': gamma,
+        'R0': R0,
+        'R1': R1,
+        'R2': R2,
+        'vDotW': vDotW,
+        'ell1': ell1,
+        'ell2': ell2,
+        'ell3': ell3,
+        'bh': bh,
+    }
+
+    return t003, t001, se1m1, se2m1, sdm1, se1p1, se2p1, sdp1, geometryData
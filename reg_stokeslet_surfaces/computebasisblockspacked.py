@@ -0,0 +1,63 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+from reg_stokeslet_surfaces.computeblockspacked import blockvectors, packsymmetricblock
+from reg_stokeslet_surfaces.tmnqrecursion import tmnqindex
+
+
+@profilestage('computebasisblockspacked')
+def computebasisblockspacked(geometryData, T, basis, regularization, out=None):
+    """
+    COMPUTEBASISBLOCKSPACKED computes the packed 3x3 blocks of every node of
+    the elements of basis (see elementbasis) from the T_{mnq} tables of
+    tmnqrecursion. It generalizes computeblockspacked, which is the linear
+    basis written out: with phi = sum c_{mn} s^m t^n the basis function of
+    a node and x - y = x0 + s ell1 v + t ell2 w, its block is
+
+        sum c_{mn} [(T_{m,n,1} + eps^2 T_{m,n,3}) I
+                    + ell1^2 T_{m+2,n,3} vv^T + ell2^2 T_{m,n+2,3} ww^T
+                    + ell1 ell2 T_{m+1,n+1,3} (vw^T + wv^T)
+                    + ell1 T_{m+1,n,3} (x0 v^T + v x0^T)
+                    + ell2 T_{m,n+1,3} (x0 w^T + w x0^T) + T_{m,n,3} x0 x0^T]
+
+    Parameters:
+        geometryData: dictionary from computebasecases or
+        computebasecasesbatch
+        T: the T tables of tmnqrecursion(degree + 2, ...), q -> array
+        basis: K x terms array of elementbasis(degree)
+        regularization: blob parameter (broadcasting against the T_{mnq})
+        out: optional tuple of K arrays to write the blocks into
+
+    Output:
+        blocks: tuple of K M x 6 (or Qb x M x 6) arrays of packed blocks, one
+        per node of the element
+    """
+    # (m, n) of every term in the tmnqindex layout
+    numberTerms = basis.shape[1]
+    order = np.repeat(np.arange(numberTerms), np.arange(1, numberTerms + 1))[:numberTerms]
+    n = np.arange(numberTerms) - order * (order + 1) // 2
+    m = order - n
+
+    t3 = T[3]
+    shape = t3.shape[1:]
+    if out is None:
+        out = tuple(np.empty(shape + (6,)) for _ in range(len(basis)))
+
+    def combine(table):
+        # sum over the terms of every basis function, K x shape
+        return np.tensordot(basis, table, axes=(1, 0))
+
+    ell1 = geometryData['ell1']
+    ell2 = geometryData['ell2']
+    tIdentity = combine(T[1][:numberTerms] + regularization**2 * t3[:numberTerms])
+    tvv = ell1**2 * combine(t3[tmnqindex(m + 2, n)])
+    tww = ell2**2 * combine(t3[tmnqindex(m, n + 2)])
+    tvw = ell1 * ell2 * combine(t3[tmnqindex(m + 1, n + 1)])
+    tx0v = ell1 * combine(t3[tmnqindex(m + 1, n)])
+    tx0w = ell2 * combine(t3[tmnqindex(m, n + 1)])
+    tx0x0 = combine(t3[:numberTerms])
+
+    vectors = blockvectors(geometryData)
+    return tuple(packsymmetricblock(out[k], vectors, tIdentity[k], tvv[k], tww[k], tvw[k],
+                                    tx0v[k], tx0w[k], tx0x0[k])
+                 for k in range(len(basis)))
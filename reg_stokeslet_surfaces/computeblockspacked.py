@@ -0,0 +1,115 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+
+# order of the six independent components of a symmetric 3x3 block
+PACKED_COMPONENTS = ((0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2))
+# position in the packed layout of every entry (i, j) of the full block
+PACKED_INDEX = np.array([[0, 3, 4],
+                         [3, 1, 5],
+                         [4, 5, 2]])
+
+
+def blockvectors(geometryData):
+    """
+    Components of x0, v and w broadcasting against the T_{mnq} arrays: three
+    M (or Qb x M) arrays and two times three scalars (or Qb x 1 arrays).
+    """
+    x0 = geometryData['x0']
+    r = [x0[..., k, :] for k in range(3)]
+
+    # 3 x 1 (or Qb x 3 x 1) vectors
+    vhat = np.reshape(geometryData['vhat'], x0.shape[:-2] + (3, 1))
+    what = np.reshape(geometryData['what'], x0.shape[:-2] + (3, 1))
+    v = [vhat[..., k, :] for k in range(3)]
+    w = [what[..., k, :] for k in range(3)]
+    return r, v, w
+
+
+def packsymmetricblock(block, vectors, tIdentity, tvv, tww, tvw, tx0v, tx0w, tx0x0):
+    """
+    Writes the six packed components of the symmetric block
+
+        tIdentity I + tvv vv^T + tww ww^T + tvw (vw^T + wv^T)
+        + tx0v (x0 v^T + v x0^T) + tx0w (x0 w^T + w x0^T) + tx0x0 x0 x0^T
+
+    into block (... x 6), with vectors = blockvectors(geometryData).
+    """
+    r, v, w = vectors
+    for k, (i, j) in enumerate(PACKED_COMPONENTS):
+        block[..., k] = tvv * (v[i] * v[j]) \
+            + tww * (w[i] * w[j]) \
+            + tvw * (v[i] * w[j] + w[i] * v[j]) \
+            + tx0v * (r[i] * v[j] + v[i] * r[j]) \
+            + tx0w * (r[i] * w[j] + w[i] * r[j]) \
+            + tx0x0 * (r[i] * r[j])
+        if i == j:
+            block[..., k] += tIdentity
+    return block
+
+
+@profilestage('computeblockspacked')
+def computeblockspacked(geometryData, t001, t101, t011,
+                        t003, t103, t013, t203, t023, t113, t303, t033, t213, t123, regularization,
+                        out=None):
+    """
+    COMPUTEBLOCKSPACKED computes the three 3x3 blocks of every field point
+    without forming Kronecker products. The blocks are symmetric, so only the
+    six independent components (xx, yy, zz, xy, xz, yz) are written.
+
+    Parameters:
+        geometryData: dictionary from computebasecases ('x0' is 3 x M) or
+        computebasecasesbatch ('x0' is Qb x 3 x M, per-face scalars Qb x 1)
+        t001, ..., t123: M (or Qb x M) arrays of the T_{mnq} integrals
+        regularization: blob parameter
+        out: optional tuple of three M x 6 (or Qb x M x 6) arrays to write
+        the blocks into
+
+    Output:
+        b0, b1, b2: M x 6 (or Qb x M x 6) arrays of packed blocks for the
+        first, second and third vertex of the face
+    """
+    vectors = blockvectors(geometryData)
+
+    # The rest are scalars (or Qb x 1)
+    ell1 = geometryData['ell1']
+    ell2 = geometryData['ell2']
+
+    if out is None:
+        out = tuple(np.empty(np.shape(t003) + (6,)) for _ in range(3))
+
+    b0 = packsymmetricblock(out[0], vectors,
+                            t001 + regularization**2 * t003 - t101 - regularization**2 * t103,
+                            ell1**2 * t203 - ell1**2 * t303,
+                            ell2**2 * t023 - ell2**2 * t123,
+                            ell1 * ell2 * t113 - ell1 * ell2 * t213,
+                            ell1 * t103 - ell1 * t203,
+                            ell2 * t013 - ell2 * t113,
+                            t003 - t103)
+
+    b1 = packsymmetricblock(out[1], vectors,
+                            t101 + regularization**2 * t103 - t011 - regularization**2 * t013,
+                            ell1**2 * t303 - ell1**2 * t213,
+                            ell2**2 * t123 - ell2**2 * t033,
+                            ell1 * ell2 * t213 - ell1 * ell2 * t123,
+                            ell1 * t203 - ell1 * t113,
+                            ell2 * t113 - ell2 * t023,
+                            t103 - t013)
+
+    b2 = packsymmetricblock(out[2], vectors,
+                            t011 + regularization**2 * t013,
+                            ell1**2 * t213,
+                            ell2**2 * t033,
+                            ell1 * ell2 * t123,
+                            ell1 * t113,
+                            ell2 * t023,
+                            t013)
+
+    return b0, b1, b2
+
+
+def unpacksymmetricblocks(packed):
+    """
+    Expands ... x 6 packed symmetric blocks into ... x 3 x 3 blocks.
+    """
+    return packed[..., PACKED_INDEX]
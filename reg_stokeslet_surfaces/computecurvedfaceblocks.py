@@ -0,0 +1,264 @@
+from functools import lru_cache
+
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+from reg_stokeslet_surfaces.computefaceblocksquadrature import (packedstokesletkernel,
+                                                                trianglequadrature)
+from reg_stokeslet_surfaces.elementbasis import ELEMENT_NODES, evaluatebasis
+from reg_stokeslet_surfaces.nearfarsplit import DEFAULT_QUADRATURE_TOL, quadratureorder
+
+# distance to element radius ratio below which the graded rule is used (the
+# error model of quadratureorder holds above it)
+CURVED_NEAR_RATIO = 2.0
+# Gauss points per direction in every panel of the graded rule
+GRADED_ORDER = 10
+# size ratio of consecutive radial panels of the graded rule, and their
+# largest number
+PANEL_RATIO = 4
+MAX_PANELS = 8
+# Gauss-Newton steps of the nearest point on an element
+NEAREST_POINT_STEPS = 4
+# number of (pair, quadrature node) evaluated together
+DEFAULT_CHUNK_NODES = 2**18
+
+# corners of the parameter domain 0 <= t <= s <= 1
+PARAMETER_CORNERS = np.array([[0.0, 0.0], [1.0, 0.0], [1.0, 1.0]])
+
+
+def curvedgeometry(elementNodes, s, t):
+    """
+    Points and area elements of curved quadratic elements at parameters.
+
+    Parameters:
+        elementNodes: P x 3 x 6 array of the nodes of P elements
+        s, t: P x n arrays of parameters (or n arrays shared by the elements)
+
+    Output:
+        phi: 6 x P x n (or 6 x n) basis functions
+        y: 3 x P x n points
+        J: P x n area elements |y_s x y_t|
+    """
+    phi, phiS, phiT = evaluatebasis(2, s, t)
+    if phi.ndim == 2:
+        phi, phiS, phiT = (f[:, np.newaxis, :] for f in (phi, phiS, phiT))
+    y = np.einsum('pik,kpn->ipn', elementNodes, phi)
+    yS = np.einsum('pik,kpn->ipn', elementNodes, phiS)
+    yT = np.einsum('pik,kpn->ipn', elementNodes, phiT)
+    J = np.linalg.norm(np.cross(yS, yT, axis=0), axis=0)
+    return phi, y, J
+
+
+def nearestparameters(x, elementNodes, tol=1e-10):
+    """
+    Parameters (s, t) of the points of the elements nearest to the field
+    points, from the flat triangle of the vertices refined by Gauss-Newton
+    steps on the curved element, within the parameter domain. Points within
+    tol of a side of the domain are moved onto it, so a collocation node of
+    the element is exactly the corner or side point it is.
+
+    Parameters:
+        x: 3 x P array of field points
+        elementNodes: P x 3 x 6 array of the nodes of their elements
+
+    Output:
+        s, t: P arrays
+    """
+    def clamp(s, t):
+        t = np.maximum(t, 0)
+        s = np.minimum(s, 1)
+        onDiagonal = t > s
+        s[onDiagonal] = t[onDiagonal] = np.clip((s[onDiagonal] + t[onDiagonal]) / 2, 0, 1)
+        return s, t
+
+    P0, P1, P2 = (elementNodes[:, :, k] for k in range(3))
+    tangents = np.stack([P1 - P0, P2 - P1], axis=2)
+    normal = np.einsum('pia,pib->pab', tangents, tangents)
+    rhs = np.einsum('pia,pi->pa', tangents, x.T - P0)
+    s, t = np.linalg.solve(normal, rhs[..., np.newaxis])[..., 0].T
+    s, t = clamp(s, t)
+
+    for _ in range(NEAREST_POINT_STEPS):
+        phi, phiS, phiT = evaluatebasis(2, s, t)
+        y = np.einsum('pik,kp->pi', elementNodes, phi)
+        tangents = np.stack([np.einsum('pik,kp->pi', elementNodes, phiS),
+                             np.einsum('pik,kp->pi', elementNodes, phiT)], axis=2)
+        normal = np.einsum('pia,pib->pab', tangents, tangents)
+        rhs = np.einsum('pia,pi->pa', tangents, x.T - y)
+        step = np.linalg.solve(normal, rhs[..., np.newaxis])[..., 0].T
+        s, t = clamp(s + step[0], t + step[1])
+
+    t[t < tol] = 0
+    s[s > 1 - tol] = 1
+    onDiagonal = s - t < tol
+    t[onDiagonal] = s[onDiagonal]
+    return s, t
+
+
+@lru_cache(maxsize=None)
+def gradedpanels(numberPanels, order):
+    """
+    Gauss-Legendre rule on [0, 1] graded towards 0: numberPanels panels whose
+    sizes grow by PANEL_RATIO, order points in every panel.
+
+    Output:
+        nodes, weights: numberPanels * order arrays
+    """
+    gaussNodes, gaussWeights = np.polynomial.legendre.leggauss(order)
+    edges = np.concatenate([[0.0], float(PANEL_RATIO) ** np.arange(1 - numberPanels, 1)])
+    lengths = np.diff(edges)
+    nodes = (edges[:-1, np.newaxis] + lengths[:, np.newaxis] * (gaussNodes + 1) / 2).ravel()
+    weights = (lengths[:, np.newaxis] * gaussWeights / 2).ravel()
+    for array in (nodes, weights):
+        array.flags.writeable = False
+    return nodes, weights
+
+
+def gradedrule(s0, t0, numberPanels, order=GRADED_ORDER):
+    """
+    Quadrature rule of the parameter domain for integrands nearly singular
+    at (s0, t0): the domain is split into the three triangles joining
+    (s0, t0) to its sides, each mapped from the rays p + alpha (h n + x tau)
+    to the points x of its side (alpha in [0, 1], h the distance of the side,
+    n its normal and tau its direction). The area element alpha h dalpha dx
+    cancels the 1/rho of the kernel; gradedpanels resolve the kernel along
+    the rays, and Gauss-Legendre points in u = asinh(x / h) keep the
+    integrand smooth along the side however close (s0, t0) is to it.
+
+    Parameters:
+        s0, t0: P arrays of centres in the parameter domain
+        numberPanels: number of radial panels
+
+    Output:
+        s, t, weights: P x n arrays, the weights summing to 1/2
+    """
+    radial, radialWeights = gradedpanels(numberPanels, order)
+    sideNodes, sideWeights = np.polynomial.legendre.leggauss(order)
+    alpha = np.repeat(radial, order)
+    alphaWeights = np.repeat(radialWeights, order) * alpha
+    sideNodes = np.tile(sideNodes, radial.size)
+    sideWeights = np.tile(sideWeights, radial.size)
+
+    centre = np.stack([s0, t0], axis=1)
+    s, t, weights = [], [], []
+    for i in range(3):
+        a, b = PARAMETER_CORNERS[i], PARAMETER_CORNERS[(i + 1) % 3]
+        tangent = (b - a) / np.linalg.norm(b - a)
+        normal = np.array([tangent[1], -tangent[0]])
+        height = (a - centre) @ normal
+        # the triangle of a side through the centre is empty
+        empty = height <= 0
+        height[empty] = 1
+        uA = np.arcsinh((a - centre) @ tangent / height)[:, np.newaxis]
+        uB = np.arcsinh((b - centre) @ tangent / height)[:, np.newaxis]
+        u = (uA + uB) / 2 + (uB - uA) / 2 * sideNodes
+        h = height[:, np.newaxis]
+        x = h * np.sinh(u)
+        points = centre[:, :, np.newaxis] + alpha * (h * normal[:, np.newaxis, np.newaxis]
+                                                     + x * tangent[:, np.newaxis, np.newaxis]
+                                                     ).transpose(1, 0, 2)
+        # move the nodes of the empty triangles away from the singularity
+        points[empty] = np.array([2 / 3, 1 / 3])[:, np.newaxis]
+        s.append(points[:, 0])
+        t.append(points[:, 1])
+        weights.append(np.where(empty[:, np.newaxis], 0, (uB - uA) / 2 * sideWeights
+                                * h * h * np.cosh(u) * alphaWeights))
+    return np.concatenate(s, axis=1), np.concatenate(t, axis=1), np.concatenate(weights, axis=1)
+
+
+def pairblocks(x, elementNodes, bh, s, t, weights, regularization):
+    """
+    Packed blocks of P (element, field point) pairs from a quadrature rule of
+    the parameter domain.
+
+    Parameters:
+        x: 3 x P field points
+        elementNodes: P x 3 x 6 nodes of the elements
+        bh: P array dividing the blocks (see computecurvedfaceblocks)
+        s, t, weights: P x n (or n) quadrature rule
+
+    Output:
+        blocks: P x 6 x 6 array, the packed block of every node
+    """
+    phi, y, J = curvedgeometry(elementNodes, s, t)
+    kernel = packedstokesletkernel(list(x[:, :, np.newaxis] - y), regularization)
+    phi = np.broadcast_to(phi, (ELEMENT_NODES[2],) + J.shape)
+    blocks = np.einsum('kpn,pn,cpn->pkc', phi, weights * J / bh[:, np.newaxis], kernel)
+    blocks[..., :3] += blocks[..., 6:]
+    return blocks[..., :6]
+
+
+@profilestage('computecurvedfaceblocks')
+def computecurvedfaceblocks(xField, faceData, regularization, tol=DEFAULT_QUADRATURE_TOL,
+                            chunkNodes=DEFAULT_CHUNK_NODES):
+    """
+    COMPUTECURVEDFACEBLOCKS computes the packed blocks of curved
+    (isoparametric) 6-node quadratic elements against the field points, the
+    curved counterpart of computefaceblocks(..., degree=2). The elements
+    are y(s, t) = sum_k phi_k(s, t) X_k over the parameter domain
+    0 <= t <= s <= 1, with the basis phi_k of elementbasis(2) and nodes X_k
+    on the surface, so the geometry error is of third order instead of the
+    second order of the flat faces.
+
+    The integrals are computed by quadrature: with quadratureorder Gauss
+    points per direction for field points at least CURVED_NEAR_RATIO element
+    radii away from an element, and otherwise with gradedrule about the
+    nearest point of the element, whose radial panels resolve the
+    regularization and the distance to the element.
+
+    Parameters:
+        xField: 3 x M array of field points
+        faceData: dictionary with 'nodes', the Qb x 3 x 6 nodes of the
+        elements, and 'bh' (Qb), by which the blocks are divided so they are
+        scaled like those of computefaceblocks
+        regularization: blob parameter
+        tol: relative error tolerance of the far-field quadrature
+        chunkNodes: number of (pair, quadrature node) evaluated together
+
+    Output:
+        packedBlocks: Qb x 6 x M x 6 array of the packed symmetric blocks;
+        packedBlocks[:, k] belongs to node k of every element
+    """
+    elementNodes = faceData['nodes']
+    bh = faceData['bh']
+    numberElements = elementNodes.shape[0]
+    numberFieldPoints = xField.shape[1]
+    packedBlocks = np.empty((numberElements, ELEMENT_NODES[2], numberFieldPoints, 6))
+
+    centroids = elementNodes.mean(axis=2)
+    radii = np.linalg.norm(elementNodes - centroids[:, :, np.newaxis], axis=1).max(axis=1)
+    distances = np.linalg.norm(xField.T[np.newaxis, :, :] - centroids[:, np.newaxis, :], axis=2)
+    ratios = distances / radii[:, np.newaxis]
+    orders = np.where(ratios < CURVED_NEAR_RATIO, 0,
+                      quadratureorder(np.maximum(ratios, CURVED_NEAR_RATIO), tol))
+
+    def addpairs(elements, points, rule):
+        # rule(pairs) -> s, t, weights of a slice of the pairs
+        chunkSize = max(1, chunkNodes // rule(slice(0, 1))[2].shape[-1])
+        for start in range(0, elements.size, chunkSize):
+            pairs = slice(start, start + chunkSize)
+            e, m = elements[pairs], points[pairs]
+            s, t, weights = rule(pairs)
+            packedBlocks[e, :, m] = pairblocks(xField[:, m], elementNodes[e], bh[e], s, t,
+                                               weights, regularization)
+
+    # far field, grouped by the number of Gauss points
+    for order in np.unique(orders[orders > 0]):
+        elements, points = np.nonzero(orders == order)
+        addpairs(elements, points, lambda pairs: trianglequadrature(order))
+
+    # near field
+    elements, points = np.nonzero(orders == 0)
+    if elements.size:
+        s0, t0 = nearestparameters(xField[:, points], elementNodes[elements])
+        _, nearest, _ = curvedgeometry(elementNodes[elements], s0[:, np.newaxis],
+                                       t0[:, np.newaxis])
+        # relative scale of the near singularity, resolved by the finest panel
+        scale = np.hypot(np.linalg.norm(xField[:, points] - nearest[:, :, 0], axis=0),
+                         regularization) / radii[elements]
+        numberPanels = int(np.clip(1 + np.ceil(-np.log(np.maximum(scale.min(), 1e-300))
+                                               / np.log(PANEL_RATIO)), 1, MAX_PANELS))
+        addpairs(elements, points,
+                 lambda pairs: gradedrule(s0[pairs], t0[pairs], numberPanels))
+
+    return packedBlocks
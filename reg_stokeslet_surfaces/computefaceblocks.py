@@ -0,0 +1,53 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.computebasecasesbatch import computebasecasesbatch
+from reg_stokeslet_surfaces.computebasisblockspacked import computebasisblockspacked
+from reg_stokeslet_surfaces.elementbasis import ELEMENT_NODES, elementbasis
+from reg_stokeslet_surfaces.tmnqrecursion import tmnqrecursion
+from reg_stokeslet_surfaces.computeblockspacked import computeblockspacked
+
+
+def computefaceblocks(xField, faceData, regularization, degree=1):
+    """
+    COMPUTEFACEBLOCKS runs the whole base case -> recursion -> block pipeline
+    for a block of Qb triangles against M field points at once.
+
+    Parameters:
+        xField: 3 x M array of field points (or Qb x 3 x M, one set per face)
+        faceData: dictionary of stacked triangle data for Qb faces
+        (see computebasecasesbatch)
+        regularization: blob parameter, or an array of E values computed in
+        one pass (see computebasecasesbatch)
+        degree: 1 for the linear elements, 2 for the quadratic elements with
+        nodes at the vertices and the midpoints of the sides (see
+        elementbasis)
+
+    Output:
+        packedBlocks: Qb x K x M x 6 array of the (unscaled) packed symmetric
+        blocks; packedBlocks[:, k] belongs to node k of every face, K = 3
+        (the vertices) for degree 1. For E regularizations,
+        E x Qb x K x M x 6.
+    """
+    # compute the base cases
+    t003, t001, se1m1, se2m1, sdm1, se1p1, se2p1, sdp1, geometryData = \
+        computebasecasesbatch(xField, faceData, regularization)
+
+    # compute the other T_{mnq} recursively, up to m + n = degree + 2 for q = 3
+    T = tmnqrecursion(degree + 2, t003, t001, (se1p1, se2p1, sdp1), (se1m1, se2m1, sdm1),
+                      geometryData)['T']
+
+    # compute the blocks straight into one buffer for the nodes of the faces
+    numberNodes = ELEMENT_NODES[degree]
+    packedBlocks = np.empty(t003.shape[:-1] + (numberNodes,) + t003.shape[-1:] + (6,))
+    out = tuple(packedBlocks[..., k, :, :] for k in range(numberNodes))
+    regularization = np.reshape(regularization, np.shape(regularization) + (1, 1))
+    if degree == 1:
+        _, t101, t011 = T[1]
+        _, t103, t013, t203, t113, t023, t303, t213, t123, t033 = T[3]
+        computeblockspacked(geometryData, t001, t101, t011,
+                            t003, t103, t013, t203, t023,
+                            t113, t303, t033, t213, t123, regularization, out=out)
+    else:
+        computebasisblockspacked(geometryData, T, elementbasis(degree), regularization, out=out)
+
+    return packedBlocks
@@ -0,0 +1,321 @@
+import math
+import warnings
+
+import numpy as np
+
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# whether the compiled backend can be used
+NUMBA_AVAILABLE = numba is not None
+BACKENDS = ('numpy', 'numba')
+
+EPS = np.finfo(float).eps
+
+
+def njit(function=None, **options):
+    # compiled when numba is installed, plain Python otherwise
+    if function is None:
+        return lambda function: njit(function, **options)
+    if numba is None:
+        return function
+    return numba.njit(cache=True, **options)(function)
+
+
+@njit
+def t003side(x0DotV, x0DotN, gamma, sideLength):
+    # scalar computet003side
+    if abs(x0DotN) < EPS:
+        return 0.0
+    p = x0DotV / sideLength
+    q = math.sqrt((x0DotN / sideLength) ** 2 + gamma ** 2 / sideLength ** 2)
+    ellq = sideLength * q
+    onePlus = 1 + gamma / ellq
+    # 1 - gamma/ellq without the cancellation
+    oneMinus = x0DotN * x0DotN / (ellq * (ellq + gamma))
+    if oneMinus < EPS:
+        return 0.0
+
+    r1 = math.tan(math.acos(1 / math.sqrt(p ** 2 / q ** 2 + 1)) / 2)
+    r2 = math.tan(math.acos(1 / math.sqrt((1 + p) ** 2 / q ** 2 + 1)) / 2)
+    sqrtOnePlusMinus = math.sqrt(onePlus / oneMinus)
+    sqrtOneMinusPlus = math.sqrt(oneMinus / onePlus)
+    factor = 2 / (q * onePlus) * sqrtOnePlusMinus
+
+    if -1 < p < 0:
+        # formula (2.30)
+        integral = factor * (math.atan(r1 * sqrtOneMinusPlus) + math.atan(r2 * sqrtOneMinusPlus))
+    else:
+        # formula (2.29)
+        sign = -1.0 if 1 + p <= 0 else 1.0
+        integral = sign * factor * (math.atan(r2 * sqrtOneMinusPlus)
+                                    - math.atan(r1 * sqrtOneMinusPlus))
+    return -x0DotN / sideLength * integral
+
+
+@njit
+def sideintegrals(x0DotV, x0DotN, gamma, sideLength):
+    # scalar computes0p1 (formula 2.26) and computes0m1 (formula 2.25)
+    x1DotV = x0DotV + sideLength
+    d2 = x0DotN ** 2 + gamma ** 2
+    R1 = math.sqrt(x1DotV ** 2 + d2)
+    R0 = math.sqrt(x0DotV ** 2 + d2)
+    s0p1 = (math.atanh(x1DotV / R1) - math.atanh(x0DotV / R0)) / sideLength
+    s0m1 = ((x1DotV * R1 + d2 * math.log(x1DotV + R1))
+            - (x0DotV * R0 + d2 * math.log(x0DotV + R0))) / (2 * sideLength)
+    return s0p1, s0m1
+
+
+@njit
+def writeblock(out, tIdentity, tvv, tww, tvw, tx0v, tx0w, tx0x0, r, v, w):
+    # packed tIdentity I + tvv vv^T + tww ww^T + tvw (vw^T + wv^T)
+    # + tx0v (x0 v^T + v x0^T) + tx0w (x0 w^T + w x0^T) + tx0x0 x0 x0^T
+    for k in range(6):
+        if k < 3:
+            i = k
+            j = k
+        elif k == 3:
+            i = 0
+            j = 1
+        elif k == 4:
+            i = 0
+            j = 2
+        else:
+            i = 1
+            j = 2
+        value = tvv * (v[i] * v[j]) \
+            + tww * (w[i] * w[j]) \
+            + tvw * (v[i] * w[j] + w[i] * v[j]) \
+            + tx0v * (r[i] * v[j] + v[i] * r[j]) \
+            + tx0w * (r[i] * w[j] + w[i] * r[j]) \
+            + tx0x0 * (r[i] * r[j])
+        if i == j:
+            value += tIdentity
+        out[k] = value
+
+
+@njit
+def pairblocks(out, x, vertices, normalstosides, directions, lengths, bh, regularization):
+    """
+    Fused base cases -> recursion -> packed blocks for one face and one
+    field point x, written into out (3 x 6).
+    """
+    eps2 = regularization ** 2
+    v = directions[:, 0]
+    w = directions[:, 1]
+    vDotW = v[0] * w[0] + v[1] * w[1] + v[2] * w[2]
+    ell1 = lengths[0]
+    ell2 = lengths[1]
+    ell3 = lengths[2]
+
+    r = np.empty(3)
+    xiDotV = np.empty(3)
+    Ri = np.empty(3)
+    s0p1 = np.empty(3)
+    s0m1 = np.empty(3)
+    t003 = 0.0
+    t001 = 0.0
+    gamma = 0.0
+    x0DotW = 0.0
+
+    for i in range(3):
+        xi0 = x[0] - vertices[0, i]
+        xi1 = x[1] - vertices[1, i]
+        xi2 = x[2] - vertices[2, i]
+        xiDotN = xi0 * normalstosides[0, i] + xi1 * normalstosides[1, i] \
+            + xi2 * normalstosides[2, i]
+        xiDotV[i] = xi0 * directions[0, i] + xi1 * directions[1, i] + xi2 * directions[2, i]
+        xiSquared = xi0 ** 2 + xi1 ** 2 + xi2 ** 2
+
+        if i == 0:
+            r2Proj = xiSquared - xiDotN ** 2 - xiDotV[0] ** 2
+            if r2Proj < EPS:
+                r2Proj = 0.0
+            gamma = math.sqrt(r2Proj + eps2)
+            x0DotW = xi0 * w[0] + xi1 * w[1] + xi2 * w[2]
+            r[0] = xi0
+            r[1] = xi1
+            r[2] = xi2
+
+        t003 += t003side(xiDotV[i], xiDotN, gamma, lengths[i])
+        s0p1[i], s0m1[i] = sideintegrals(xiDotV[i], xiDotN, gamma, lengths[i])
+        if abs(xiDotN) >= EPS:
+            t001 -= lengths[i] * xiDotN * s0p1[i]
+        Ri[i] = math.sqrt(xiSquared + eps2)
+
+    t003 = t003 / gamma
+    t001 = t001 - gamma ** 2 * t003
+    t003 = t003 / bh
+    t001 = t001 / bh
+
+    x0DotV = xiDotV[0]
+    x1DotW = xiDotV[1]
+    x2DotD = xiDotV[2]
+    se1p1, se2p1, sdp1 = s0p1[0], s0p1[1], s0p1[2]
+    se1m1, se2m1, sdm1 = s0m1[0], s0m1[1], s0m1[2]
+    R0, R1, R2 = Ri[0], Ri[1], Ri[2]
+
+    # recursion formulas (2.17), (2.18) with q - 2 = -1 (q = 1) or 1 (q = 3)
+    c = 1 / (vDotW ** 2 - 1)
+    vTerm = (x0DotV - vDotW * x0DotW) / ell1
+    wTerm = (x0DotW - vDotW * x0DotV) / ell2
+
+    # q = 1, formulas (2.22) and (2.23)
+    a00m1 = se2m1 - sdm1
+    b00m1 = -se1m1 + sdm1
+    t101 = c * (-a00m1 / ell1 ** 2 + vDotW * b00m1 / (ell1 * ell2) + vTerm * t001)
+    t011 = c * (-b00m1 / ell2 ** 2 + vDotW * a00m1 / (ell1 * ell2) + wTerm * t001)
+
+    # line integral recursions, formula (2.24) with q = 1
+    se1p1p1 = ((R1 - R0) - ell1 * x0DotV * se1p1) / ell1 ** 2
+    se1p2p1 = (R1 - se1m1 - ell1 * x0DotV * se1p1p1) / ell1 ** 2
+    se2p1p1 = ((R2 - R1) - ell2 * x1DotW * se2p1) / ell2 ** 2
+    se2p2p1 = (R2 - se2m1 - ell2 * x1DotW * se2p1p1) / ell2 ** 2
+    sdp1p1 = ((R0 - R2) - ell3 * x2DotD * sdp1) / ell3 ** 2
+    sdp2p1 = (R0 - sdm1 - ell3 * x2DotD * sdp1p1) / ell3 ** 2
+
+    a001 = se2p1 - sdp1
+    b001 = -se1p1 + sdp1
+    a101 = a001 + sdp1p1
+    a201 = a001 + 2 * sdp1p1 - sdp2p1
+    a011 = se2p1p1 - sdp1 + sdp1p1
+    a021 = se2p2p1 - sdp1 + 2 * sdp1p1 - sdp2p1
+    b101 = -se1p1p1 + sdp1 - sdp1p1
+    b201 = -se1p2p1 + sdp1 - 2 * sdp1p1 + sdp2p1
+    b011 = sdp1 - sdp1p1
+    b021 = sdp1 - 2 * sdp1p1 + sdp2p1
+
+    # q = 3
+    l11 = ell1 ** 2
+    l22 = ell2 ** 2
+    l12 = ell1 * ell2
+    t103 = c * (a001 / l11 - vDotW * b001 / l12 + vTerm * t003)
+    t013 = c * (b001 / l22 - vDotW * a001 / l12 + wTerm * t003)
+    t203 = c * (a101 / l11 - vDotW * b101 / l12 - t001 / l11 + vTerm * t103)
+    t113 = c * (b101 / l22 - vDotW * a101 / l12 + vDotW * t001 / l12 + wTerm * t103)
+    t023 = c * (b011 / l22 - vDotW * a011 / l12 - t001 / l22 + wTerm * t013)
+    t303 = c * (a201 / l11 - vDotW * b201 / l12 - 2 * t101 / l11 + vTerm * t203)
+    t213 = c * (b201 / l22 - vDotW * a201 / l12 + 2 * vDotW * t101 / l12 + wTerm * t203)
+    t033 = c * (b021 / l22 - vDotW * a021 / l12 - 2 * t011 / l22 + wTerm * t023)
+    t123 = c * (a021 / l11 - vDotW * b021 / l12 + 2 * vDotW * t011 / l12 + vTerm * t023)
+
+    # blocks of the three vertices, as in computeblockspacked
+    writeblock(out[0], t001 + eps2 * t003 - t101 - eps2 * t103,
+               l11 * t203 - l11 * t303, l22 * t023 - l22 * t123, l12 * t113 - l12 * t213,
+               ell1 * t103 - ell1 * t203, ell2 * t013 - ell2 * t113, t003 - t103, r, v, w)
+    writeblock(out[1], t101 + eps2 * t103 - t011 - eps2 * t013,
+               l11 * t303 - l11 * t213, l22 * t123 - l22 * t033, l12 * t213 - l12 * t123,
+               ell1 * t203 - ell1 * t113, ell2 * t113 - ell2 * t023, t103 - t013, r, v, w)
+    writeblock(out[2], t011 + eps2 * t013, l11 * t213, l22 * t033, l12 * t123,
+               ell1 * t113, ell2 * t023, t013, r, v, w)
+
+
+@njit
+def faceblockskernel(out, xField, vertices, normalstosides, directions, lengths, bh,
+                     regularization):
+    # serial: threads are left to the process pool of assemblestokesletmatrix,
+    # a numba thread pool in the parent does not survive its fork
+    numberBlockFaces = vertices.shape[0]
+    numberFieldPoints = xField.shape[2]
+    sharedPoints = xField.shape[0] == 1
+    for q in range(numberBlockFaces):
+        xFace = xField[0] if sharedPoints else xField[q]
+        pairOut = np.empty((3, 6))
+        for m in range(numberFieldPoints):
+            pairblocks(pairOut, xFace[:, m], vertices[q], normalstosides[q], directions[q],
+                       lengths[q], bh[q], regularization)
+            out[q, :, m, :] = pairOut
+
+
+@profilestage('computefaceblocksnumba')
+def computefaceblocksnumba(xField, faceData, regularization):
+    """
+    COMPUTEFACEBLOCKSNUMBA computes the same packed blocks as
+    computefaceblocks with one compiled loop over the (face, field point)
+    pairs. The base cases, the T_{mnq} recursion and the blocks of every
+    pair are evaluated in scalars, without temporary arrays. Needs numba;
+    without it the loop runs as (very slow) plain Python.
+
+    Parameters:
+        xField: 3 x M array of field points (or Qb x 3 x M, one set per face)
+        faceData: dictionary of stacked triangle data for Qb faces
+        regularization: blob parameter
+
+    Output:
+        packedBlocks: Qb x 3 x M x 6 array of the (unscaled) packed blocks
+    """
+    if xField.ndim == 2:
+        xField = xField[np.newaxis]
+    xField = np.ascontiguousarray(xField, dtype=float)
+    numberBlockFaces = faceData['bh'].shape[0]
+    packedBlocks = np.empty((numberBlockFaces, 3, xField.shape[2], 6))
+    faceblockskernel(packedBlocks, xField,
+                     *(np.ascontiguousarray(faceData[key], dtype=float)
+                       for key in ('vertices', 'normalstosides', 'directions', 'lengths', 'bh')),
+                     float(regularization))
+    return packedBlocks
+
+
+@njit
+def velocitykernel(velocity, xField, vertices, normalstosides, directions, lengths, bh,
+                   regularization, weightedForces):
+    pairOut = np.empty((3, 6))
+    for q in range(vertices.shape[0]):
+        for m in range(xField.shape[1]):
+            pairblocks(pairOut, xField[:, m], vertices[q], normalstosides[q], directions[q],
+                       lengths[q], bh[q], regularization)
+            for a in range(3):
+                f0 = weightedForces[q, a, 0]
+                f1 = weightedForces[q, a, 1]
+                f2 = weightedForces[q, a, 2]
+                block = pairOut[a]
+                velocity[m, 0] += block[0] * f0 + block[3] * f1 + block[4] * f2
+                velocity[m, 1] += block[3] * f0 + block[1] * f1 + block[5] * f2
+                velocity[m, 2] += block[4] * f0 + block[5] * f1 + block[2] * f2
+
+
+@profilestage('computevelocitynumba')
+def computevelocitynumba(xField, faceData, weightedForces, regularization):
+    """
+    COMPUTEVELOCITYNUMBA contracts the packed blocks of every (face, field
+    point) pair against the forces as soon as they are computed, in the
+    compiled loop of computefaceblocksnumba, so neither the blocks nor the
+    matrix are ever stored.
+
+    Parameters:
+        xField: 3 x M array of field points
+        faceData: dictionary of stacked triangle data for Qb faces
+        weightedForces: Qb x 3 x 3 array, the forces at the three vertices of
+        every face times bh / (8 pi mu)
+        regularization: blob parameter
+
+    Output:
+        velocity: M x 3 array, sum over the faces of the blocks times forces
+    """
+    xField = np.ascontiguousarray(xField, dtype=float)
+    velocity = np.zeros((xField.shape[1], 3))
+    velocitykernel(velocity, xField,
+                   *(np.ascontiguousarray(faceData[key], dtype=float)
+                     for key in ('vertices', 'normalstosides', 'directions', 'lengths', 'bh')),
+                   float(regularization), np.ascontiguousarray(weightedForces, dtype=float))
+    return velocity
+
+
+def faceblocksbackend(backend):
+    """
+    Function computing the packed face blocks for backend 'numpy'
+    (computefaceblocks) or 'numba' (computefaceblocksnumba). Falls back to
+    NumPy with a warning when numba is not installed.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend '{backend}'")
+    if backend == 'numba':
+        if NUMBA_AVAILABLE:
+            return computefaceblocksnumba
+        warnings.warn("numba is not installed, using the NumPy backend", RuntimeWarning)
+    return computefaceblocks
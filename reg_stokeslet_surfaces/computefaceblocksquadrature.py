@@ -0,0 +1,97 @@
+from functools import lru_cache
+
+import numpy as np
+
+from reg_stokeslet_surfaces.computeblockspacked import PACKED_COMPONENTS
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+
+
+@lru_cache(maxsize=None)
+def trianglequadrature(order):
+    """
+    TRIANGLEQUADRATURE collapsed Gauss-Legendre rule on the parameter domain
+    0 <= beta <= alpha <= 1 of a face, y = pt1 - alpha*ell1*v - beta*ell2*w.
+    The order x order product rule is mapped with beta = alpha*t, so it
+    integrates polynomials of degree 2*order - 2 exactly.
+
+    Parameters:
+        order: number of Gauss points per direction
+
+    Output:
+        alpha, beta: order^2 arrays of quadrature nodes
+        weights: order^2 array of weights, summing to 1/2
+    """
+    nodes, gaussWeights = np.polynomial.legendre.leggauss(order)
+    nodes = (nodes + 1) / 2
+    gaussWeights = gaussWeights / 2
+
+    alpha = np.repeat(nodes, order)
+    beta = alpha * np.tile(nodes, order)
+    weights = np.repeat(gaussWeights, order) * np.tile(gaussWeights, order) * alpha
+
+    # cached, so the arrays are shared between calls
+    for array in (alpha, beta, weights):
+        array.flags.writeable = False
+    return alpha, beta, weights
+
+
+def packedstokesletkernel(r, regularization):
+    """
+    Regularized Stokeslet (1/R + eps^2/R^3) I + r r^T / R^3 at the
+    separations r (three arrays of the same shape), packed, with the
+    identity coefficient as a seventh component.
+
+    Output:
+        kernel: 7 x shape array
+    """
+    eps2 = regularization ** 2
+    R2 = r[0] * r[0] + r[1] * r[1] + r[2] * r[2] + eps2
+    invR3 = 1 / (R2 * np.sqrt(R2))
+
+    kernel = np.empty((7,) + R2.shape)
+    np.multiply(R2 + eps2, invR3, out=kernel[6])
+    rOverR3 = [ri * invR3 for ri in r]
+    for c, (i, j) in enumerate(PACKED_COMPONENTS):
+        np.multiply(rOverR3[i], r[j], out=kernel[c])
+    return kernel
+
+
+@profilestage('computefaceblocksquadrature')
+def computefaceblocksquadrature(xField, faceData, regularization, order):
+    """
+    COMPUTEFACEBLOCKSQUADRATURE approximates the packed blocks of
+    computefaceblocks with a trianglequadrature rule instead of the analytic
+    T_{mnq} integrals. Accurate when the field points are a few face sizes
+    away from the face (see quadratureorder).
+
+    Parameters:
+        xField: 3 x M array of field points (or Qb x 3 x M, one set per face)
+        faceData: dictionary of stacked triangle data for Qb faces
+        regularization: blob parameter
+        order: number of Gauss points per direction
+
+    Output:
+        packedBlocks: Qb x 3 x M x 6 array of the (unscaled) packed symmetric
+        blocks; packedBlocks[:, k] belongs to vertex k of every face
+    """
+    alpha, beta, weights = trianglequadrature(order)
+
+    # linear basis functions of the three vertices at the nodes
+    basis = np.stack([1 - alpha, alpha - beta, beta])                       # 3 x n
+    basisWeights = basis * weights
+
+    # quadrature points of every face, Qb x 3 x n
+    yNodes = faceData['vertices'] @ basis
+
+    if xField.ndim == 2:
+        xField = xField[np.newaxis, :, :]
+
+    # components of x - y for every face, node and field point: Qb x n x M
+    r = [xField[:, i, np.newaxis, :] - yNodes[:, i, :, np.newaxis] for i in range(3)]
+    kernel = packedstokesletkernel(r, regularization)
+
+    # contract the nodes against the weighted basis functions: 7 x Qb x 3 x M
+    packedBlocks = basisWeights @ kernel
+    packedBlocks[:3] += packedBlocks[6]
+
+    return np.moveaxis(packedBlocks[:6], 0, 3)
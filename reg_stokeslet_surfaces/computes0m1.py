@@ -1,5 +1,8 @@
 import numpy as np
 
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+
+@profilestage('computes0m1')
 def computes0m1(x0DotV, x0DotN, gamma, sideLength):
     """
     COMPUTES0m1 computes line integral S_{0,-1} for side of a triangle
@@ -1,5 +1,8 @@
 import numpy as np
 
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+
+@profilestage('computes0p1')
 def computes0p1(x0DotV, x0DotN, gamma, sideLength):
     """
     Computes the line integral S_{0,1} for side of a triangle.
@@ -1,5 +1,8 @@
 import numpy as np
 
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+
+@profilestage('computet001side')
 def computet001side(s0p1, x0DotN, sideLength):
     """
     COMPUTET001SIDE computes contribution from side in contour integral part of T001
@@ -14,8 +17,8 @@ def computet001side(s0p1, x0DotN, sideLength):
         t001Side (ndarray): M x 1 vector representing contribution from the side 
                             in the contour integral part of T001.
     """
-    s0p1 = np.asarray(s0p1).flatten()
-    x0DotN = np.asarray(x0DotN).flatten()
+    s0p1 = np.asarray(s0p1)
+    x0DotN = np.asarray(x0DotN)
 
     t001Side = sideLength * (-1) * (x0DotN * s0p1)
     t001Side[np.abs(x0DotN) < np.finfo(float).eps] = 0
@@ -1,6 +1,9 @@
 import numpy as np
 import warnings
 
+from reg_stokeslet_surfaces.assemblyprofile import countbranch, profilestage
+
+@profilestage('computet003side')
 def computet003side(x0DotV, x0DotN, gamma, sideLength):
     # COMPUTET003SIDE evaluates contribution from side in contour integral equivalent to T003
     # Parameters:
@@ -16,6 +19,11 @@ def computet003side(x0DotV, x0DotN, gamma, sideLength):
     #   t003Side: M x 1 vector representing contribution from side in the 
     #   contour integral equivalent to T003
 
+    # the special cases below are decided by comparisons with the float64
+    # machine epsilon, and 1 -/+ gamma/ellq cancel, so work in float64 even
+    # when the inputs are float32
+    x0DotV, x0DotN, gamma = (np.asarray(a, dtype=np.float64) for a in (x0DotV, x0DotN, gamma))
+
     # from analytic integration formula - for details, see paper
     p = x0DotV / sideLength
     q = np.sqrt((x0DotN / sideLength) ** 2 + (gamma ** 2) / (sideLength ** 2))
@@ -32,7 +40,8 @@ def computet003side(x0DotV, x0DotN, gamma, sideLength):
     r1, r2 = r1r2(p, q)
     ellq = sideLength * q
     onePlus = 1 + gamma / ellq
-    oneMinus = 1 - gamma / ellq 
+    # 1 - gamma/ellq without the cancellation, ellq^2 = x0DotN^2 + gamma^2
+    oneMinus = x0DotN ** 2 / (ellq * (ellq + gamma))
     
     # to avoid getting runtime warnings about dividing by zero, do it like this 
     # these issues get taken care of in the conditional pieces below
@@ -48,11 +57,15 @@ def computet003side(x0DotV, x0DotN, gamma, sideLength):
                 condSet2 * integralCoefficient * formula229(q, onePlus, sqrtOnePlusMinus, sqrtOneMinusPlus, r1, r2, p)
     
 
-    t003Side[np.abs(x0DotN) < np.finfo(float).eps] = 0
+    x0DotNeq0 = np.abs(x0DotN) < np.finfo(float).eps
+    countbranch('x0DotN=0', x0DotNeq0)
+    t003Side[x0DotNeq0] = 0
 
     # another special case is when 1 - gamma./ellq = 0 
     # in the limit as this goes to zero, the resulting expression is 0
-    t003Side[np.abs(oneMinus) < np.finfo(float).eps] = 0
+    oneMinusEq0 = oneMinus < np.finfo(float).eps
+    countbranch('1-gamma/ellq=0', oneMinusEq0)
+    t003Side[oneMinusEq0] = 0
     
     #print(t003Side[np.isnan(t003Side)])
 
@@ -76,5 +89,7 @@ def formula229(q, onePlus, sqrtOnePlusMinus, sqrtOneMinusPlus, r1, r2, p):
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=RuntimeWarning)
         sgnfac = np.sign(1 + p)
-        sgnfac[np.abs(sgnfac) < np.finfo(float).eps] = -1
+        pEqMinus1 = np.abs(sgnfac) < np.finfo(float).eps
+        countbranch('p=-1', pEqMinus1)
+        sgnfac[pEqMinus1] = -1
         return sgnfac * 2 / (q * onePlus) * sqrtOnePlusMinus * (np.arctan(r2 * sqrtOneMinusPlus) - np.arctan(r1 * sqrtOneMinusPlus))
\ No newline at end of file
@@ -0,0 +1,105 @@
+import argparse
+import time
+
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.computecurvedfaceblocks import curvedgeometry
+from reg_stokeslet_surfaces.computefaceblocksquadrature import trianglequadrature
+from reg_stokeslet_surfaces.elementbasis import elementweights
+from reg_stokeslet_surfaces.quadraticelements import quadraticelements
+from reg_stokeslet_surfaces.triangulatesphereicos import triangulatesphereicos
+
+# icosphere factors of every kind of element, about the same numbers of
+# unknowns for the linear and the quadratic elements
+DEFAULT_FACTORS = {'linear': (2, 4, 6, 8, 12),
+                   'quadratic': (1, 2, 3, 4, 6),
+                   'curved': (1, 2, 3, 4, 6)}
+# Gauss points per direction of the areas of the curved elements
+CURVED_AREA_ORDER = 6
+
+
+def nodalweights(kind, mesh, nodes, elements):
+    """
+    Weights W of the nodal forces F of the faces, the total force being
+    sum_q sum_k W[q, k] F[:, elements[q, k]]: the integrals of the basis
+    functions over the faces.
+
+    Output:
+        weights: Q x K array
+    """
+    if kind == 'linear':
+        return mesh.bh[:, np.newaxis] * elementweights(1)
+    if kind == 'quadratic':
+        return mesh.bh[:, np.newaxis] * elementweights(2)
+    s, t, quadratureWeights = trianglequadrature(CURVED_AREA_ORDER)
+    phi, _, J = curvedgeometry(np.moveaxis(nodes[:, elements], 0, 1), s, t)
+    return np.einsum('kpn,pn,n->pk', phi, J, quadratureWeights)
+
+
+def dragconvergence(factors=DEFAULT_FACTORS, regularization=1e-6, mu=1, verbose=True):
+    """
+    DRAGCONVERGENCE compares the drag errors of the linear, flat quadratic
+    and curved quadratic elements of assemblestokesletmatrix on the unit
+    sphere translating with unit velocity, whose drag is 6 pi mu, against
+    their numbers of unknowns and solve times. The nodes of the elements are
+    the collocation points. Nothing is plotted, it runs headless.
+
+    Kinds of elements:
+        linear: forces linear over the flat faces, nodes at the vertices
+        quadratic: forces quadratic over the flat faces, with nodes at the
+        midpoints of their sides (see quadraticelements)
+        curved: forces and faces quadratic, the midpoints moved onto the
+        sphere (see computecurvedfaceblocks)
+
+    Parameters:
+        factors: dictionary of the icosphere factors of every kind
+        regularization: blob parameter
+        mu: viscosity parameter
+        verbose: print every case
+
+    Output:
+        results: list of dictionaries with 'kind', 'factor', 'unknowns',
+        'errorPercent' and 'seconds' (assembly and dense solve)
+    """
+    results = []
+    for kind, kindFactors in factors.items():
+        for factor in kindFactors:
+            start = time.perf_counter()
+            mesh, spherePoints, _ = triangulatesphereicos(factor, 1)
+            if kind == 'linear':
+                nodes, elements, curvedNodes = spherePoints, mesh.indices, None
+            else:
+                projection = (lambda x: x / np.linalg.norm(x, axis=0)) if kind == 'curved' else None
+                nodes, elements = quadraticelements(mesh, projection)
+                curvedNodes = nodes if kind == 'curved' else None
+            numberNodes = nodes.shape[1]
+
+            A = assemblestokesletmatrix(nodes, mesh, numberNodes, regularization, mu,
+                                        elements=None if kind == 'linear' else elements,
+                                        nodes=curvedNodes)
+            F = np.linalg.solve(A, np.tile([1.0, 0.0, 0.0], numberNodes))
+            F = F.reshape(numberNodes, 3).T
+            drag = np.einsum('iqk,qk->i', F[:, elements],
+                             nodalweights(kind, mesh, nodes, elements))
+            seconds = time.perf_counter() - start
+
+            result = {'kind': kind, 'factor': factor, 'unknowns': 3 * numberNodes,
+                      'errorPercent': 100 * abs(1 - drag[0] / (6 * np.pi * mu)),
+                      'seconds': seconds}
+            results.append(result)
+            if verbose:
+                print(f"{kind:9s} factor {factor:3d}: {result['unknowns']:6d} unknowns, "
+                      f"drag error {result['errorPercent']:.4f}%, {seconds:.2f} s", flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=dragconvergence.__doc__.split('\n\n')[0].strip())
+    for kind, kindFactors in DEFAULT_FACTORS.items():
+        parser.add_argument(f'--{kind}', type=int, nargs='*', default=list(kindFactors),
+                            help=f'icosphere factors of the {kind} elements')
+    parser.add_argument('--regularization', type=float, default=1e-6)
+    arguments = parser.parse_args()
+    dragconvergence({kind: getattr(arguments, kind) for kind in DEFAULT_FACTORS},
+                    arguments.regularization)
@@ -0,0 +1,95 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.tmnqrecursion import tmnqindex
+
+# number of nodes of the elements of every degree: the vertices, then for
+# degree 2 the midpoints of the sides (0, 1), (1, 2) and (2, 0)
+ELEMENT_NODES = {1: 3, 2: 6}
+
+
+def elementbasis(degree):
+    """
+    ELEMENTBASIS gives the nodal (Lagrange) basis functions of the triangle
+    elements of a degree as polynomials in the parameters of the face,
+    y(s, t) = P0 + s (P1 - P0) + t (P2 - P1), 0 <= t <= s <= 1, whose
+    barycentric coordinates are 1 - s, s - t and t.
+
+    Parameters:
+        degree: 1 (linear, 3 nodes) or 2 (quadratic, 6 nodes)
+
+    Output:
+        basis: K x (degree + 1)(degree + 2)/2 array, the coefficient of
+        s^m t^n of the basis function of node k is basis[k, tmnqindex(m, n)]
+    """
+    if degree not in ELEMENT_NODES:
+        raise ValueError(f"no elements of degree {degree}, only {tuple(ELEMENT_NODES)}")
+
+    # coefficient arrays c[m, n] of s^m t^n
+    barycentric = np.zeros((3, degree + 1, degree + 1))
+    barycentric[0, 0, 0], barycentric[0, 1, 0] = 1, -1
+    barycentric[1, 1, 0], barycentric[1, 0, 1] = 1, -1
+    barycentric[2, 0, 1] = 1
+
+    def multiply(a, b):
+        product = np.zeros_like(a)
+        for m, n in zip(*np.nonzero(a)):
+            product[m:, n:] += a[m, n] * b[:degree + 1 - m, :degree + 1 - n]
+        return product
+
+    if degree == 1:
+        polynomials = barycentric
+    else:
+        constant = np.zeros((degree + 1, degree + 1))
+        constant[0, 0] = 1
+        vertices = [multiply(barycentric[i], 2 * barycentric[i] - constant) for i in range(3)]
+        midpoints = [4 * multiply(barycentric[i], barycentric[(i + 1) % 3]) for i in range(3)]
+        polynomials = np.array(vertices + midpoints)
+
+    m, n = np.divmod(np.arange((degree + 1)**2), degree + 1)
+    inElement = m + n <= degree
+    basis = np.zeros((len(polynomials), (degree + 1) * (degree + 2) // 2))
+    basis[:, tmnqindex(m[inElement], n[inElement])] = \
+        polynomials.reshape(len(polynomials), -1)[:, inElement]
+    return basis
+
+
+def elementweights(degree):
+    """
+    Integrals of the basis functions of elementbasis(degree) over a face,
+    divided by bh: the integral of s^m t^n over 0 <= t <= s <= 1 is
+    1 / ((n + 1)(m + n + 2)). The total force on a surface is the sum over
+    the faces of bh times the weighted nodal forces.
+
+    Output:
+        weights: K array
+    """
+    basis = elementbasis(degree)
+    order = np.repeat(np.arange(degree + 1), np.arange(1, degree + 2))
+    n = np.arange(order.size) - order * (order + 1) // 2
+    return basis @ (1 / ((n + 1) * (order + 2)))
+
+
+def evaluatebasis(degree, s, t):
+    """
+    Values and first derivatives of the basis functions of
+    elementbasis(degree) at the parameters (s, t) (arrays of any shape).
+
+    Output:
+        phi, phiS, phiT: K x shape arrays of the basis functions and of their
+        derivatives with respect to s and t
+    """
+    basis = elementbasis(degree)
+    s, t = np.broadcast_arrays(np.asarray(s, dtype=float), np.asarray(t, dtype=float))
+    order = np.repeat(np.arange(degree + 1), np.arange(1, degree + 2))
+    n = np.arange(order.size) - order * (order + 1) // 2
+    m = order - n
+
+    def monomials(mPower, nPower, factor):
+        # factor s^mPower t^nPower of every term, zero where the factor is
+        return np.stack([f * s**max(a, 0) * t**max(b, 0) if f else np.zeros_like(s)
+                         for a, b, f in zip(mPower, nPower, factor)])
+
+    phi = np.tensordot(basis, monomials(m, n, np.ones_like(m)), axes=1)
+    phiS = np.tensordot(basis, monomials(m - 1, n, m), axes=1)
+    phiT = np.tensordot(basis, monomials(m, n - 1, n), axes=1)
+    return phi, phiS, phiT
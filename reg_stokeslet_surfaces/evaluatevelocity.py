@@ -0,0 +1,138 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.computefaceblocksnumba import (computefaceblocksnumba,
+                                                           computevelocitynumba,
+                                                           faceblocksbackend)
+from reg_stokeslet_surfaces.computeblockspacked import PACKED_INDEX
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+from reg_stokeslet_surfaces.nearfarsplit import (DEFAULT_QUADRATURE_TOL, computefaceblocksnearfar,
+                                                 facesizes, nearfieldratio, quadratureorder,
+                                                 spatialorder)
+
+# peak memory per (face, field point) pair of the analytic blocks and their
+# contraction against the forces (measured ~600 bytes)
+BYTES_PER_PAIR = 640
+# memory budget of a tile by default, larger tiles are not faster
+DEFAULT_MAX_MEMORY = 2**24
+# smallest number of field points per tile when the faces are split
+MIN_TILE_POINTS = 64
+
+
+def packedforces(forces):
+    """
+    Expands forces (... x 3) into ... x 6 x 3 arrays G such that the velocity
+    of a packed block P is u_i = sum_c P_c G[c, i].
+    """
+    expanded = np.zeros(forces.shape[:-1] + (6, 3))
+    for i in range(3):
+        for j in range(3):
+            expanded[..., PACKED_INDEX[i][j], i] = forces[..., j]
+    return expanded
+
+
+def evaluatevelocity(xField, TriangleArray, F, regularization, mu,
+                     maxMemory=DEFAULT_MAX_MEMORY, method='batched', nearRatio=None,
+                     tol=DEFAULT_QUADRATURE_TOL, backend='numpy'):
+    """
+    EVALUATEVELOCITY computes the velocity U = A F at field points without
+    forming the 3M x 3V Stokeslet matrix A. The field points are processed
+    in tiles against blocks of faces, sized so that one tile needs about
+    maxMemory bytes, and every tile is contracted against the forces right
+    away.
+
+    Parameters:
+        xField: 3 x M array of field points, or an iterable (e.g. a
+        generator) of 3 x Mi arrays of field points, evaluated chunk by chunk
+        so the points never need to be in memory at once
+        TriangleArray: TriangleMesh, or list of triangle dictionaries
+        F: 3V vector of forces at the vertices (interleaved as in A F)
+        regularization: blob parameter
+        mu: viscosity parameter
+        maxMemory: memory budget of a tile in bytes
+        method: 'batched' (analytic integrals) or 'nearfar' (quadrature away
+        from the faces, see assemblestokesletmatrix)
+        nearRatio, tol: for 'nearfar', see computefaceblocksnearfar
+        backend: 'numpy' or 'numba' (see faceblocksbackend). With numba and
+        the 'batched' method the blocks of every (face, field point) pair
+        are contracted against the forces inside the compiled loop
+        (computevelocitynumba), so only the M x 3 velocities are stored and
+        maxMemory is not used.
+
+    Output:
+        U: 3 x M array of velocities, the chunks concatenated in order
+    """
+    if method not in ('batched', 'nearfar'):
+        raise ValueError(f"unknown evaluation method '{method}'")
+    faceblocks = faceblocksbackend(backend)
+    if faceblocks is not computefaceblocksnumba:
+        backend = 'numpy'
+    fused = backend == 'numba' and method == 'batched'
+
+    faceData = TriangleMesh.fromdicts(TriangleArray).facedata()
+    numberFaces = faceData['bh'].shape[0]
+    forces = np.reshape(F, (-1, 3)) / (8 * np.pi * mu)
+
+    if method == 'nearfar':
+        if nearRatio is None:
+            nearRatio = nearfieldratio(tol)
+        faceOrder = spatialorder(facesizes(faceData)[0].T)
+        faceData = {key: value[faceOrder] for key, value in faceData.items()}
+
+    bytesPerPair = BYTES_PER_PAIR
+    if method == 'nearfar':
+        # the far-field quadrature holds about 16 arrays per node and pair
+        bytesPerPair += 16 * 8 * int(quadratureorder(nearRatio, tol)) ** 2
+
+    # faces per block, leaving at least MIN_TILE_POINTS points per tile
+    numberPairs = max(1, int(maxMemory) // bytesPerPair)
+    blockSize = min(numberFaces, max(1, numberPairs // MIN_TILE_POINTS))
+    tileSize = max(1, numberPairs // blockSize)
+
+    if isinstance(xField, np.ndarray):
+        xField = [xField]
+
+    velocities = []
+    for chunk in xField:
+        chunk = np.asarray(chunk, dtype=float)
+        numberFieldPoints = chunk.shape[1]
+        if fused:
+            weightedForces = forces[faceData['indices']] * faceData['bh'][:, None, None]
+            velocities.append(computevelocitynumba(chunk, faceData, weightedForces,
+                                                   regularization).T)
+            continue
+        velocity = np.zeros((numberFieldPoints, 3))
+
+        for start in range(0, numberFieldPoints, tileSize):
+            tile = slice(start, min(start + tileSize, numberFieldPoints))
+            xTile = chunk[:, tile]
+            if method == 'nearfar':
+                pointOrder = spatialorder(xTile)
+                xTile = xTile[:, pointOrder]
+            tileVelocity = np.zeros((xTile.shape[1], 3))
+
+            for faceStart in range(0, numberFaces, blockSize):
+                block = slice(faceStart, min(faceStart + blockSize, numberFaces))
+                blockData = {key: value[block] for key, value in faceData.items()}
+
+                if method == 'nearfar':
+                    packedBlocks = computefaceblocksnearfar(xTile, blockData, regularization,
+                                                            nearRatio, tol, backend=backend)
+                else:
+                    packedBlocks = faceblocks(xTile, blockData, regularization)
+
+                # contract the packed components against the forces, summing
+                # over faces, vertices of the faces and packed components
+                weightedForces = forces[blockData['indices']] * blockData['bh'][:, None, None]
+                tileVelocity += np.tensordot(packedBlocks, packedforces(weightedForces),
+                                             axes=([0, 1, 3], [0, 1, 2]))
+
+            if method == 'nearfar':
+                velocity[tile][pointOrder] = tileVelocity
+            else:
+                velocity[tile] = tileVelocity
+
+        velocities.append(velocity.T)
+
+    if not velocities:
+        return np.zeros((3, 0))
+    return np.concatenate(velocities, axis=1)
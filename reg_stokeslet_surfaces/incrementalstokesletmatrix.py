@@ -0,0 +1,237 @@
+import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import (assemblestokesletmatrix,
+                                                            requirelinearelements)
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+# fraction of vertex columns above which a deformation is reassembled from scratch
+FULL_REASSEMBLY_FRACTION = 0.5
+# relative tolerance under which a vertex does not move, or a velocity is rigid
+MOTION_TOL = 1e-12
+
+
+def interleaved(vertices):
+    """Matrix rows (or columns) 3v, 3v + 1, 3v + 2 of the vertices v."""
+    return (3 * np.asarray(vertices)[:, np.newaxis] + np.arange(3)).ravel()
+
+
+def rotationmatrix(rotationVector):
+    """Rotation by the angle |w| about the axis w (Rodrigues' formula)."""
+    angle = np.linalg.norm(rotationVector)
+    if angle == 0:
+        return np.eye(3)
+    k = rotationVector / angle
+    K = np.array([[0, -k[2], k[1]], [k[2], 0, -k[0]], [-k[1], k[0], 0]])
+    return np.eye(3) + np.sin(angle) * K + (1 - np.cos(angle)) * K @ K
+
+
+class IncrementalStokesletMatrix:
+    """
+    Stokeslet matrix of a moving and deforming body on its own vertices,
+    updated incrementally instead of reassembled every time step.
+
+    The matrix is kept in the body frame, with the world coordinates of the
+    vertices x = R X + t. Moving the body rigidly (move) only updates R and
+    t: the kernel is translation invariant and rotation equivariant, so the
+    world matrix is blockdiag(R) A blockdiag(R)^T, and solves reuse the LU
+    factorization of A. Deforming the body (deform) recomputes the rows of
+    the vertices that moved and, in the other rows, only the columns of the
+    vertices of the faces touching them.
+    """
+
+    def __init__(self, TriangleArray, numberTrianglePoints, regularization, mu, **options):
+        """
+        Parameters:
+            TriangleArray: TriangleMesh, or list of triangle dictionaries
+            numberTrianglePoints: number of unique points V of the triangulation
+            regularization: blob parameter
+            mu: viscosity parameter
+            options: passed to assemblestokesletmatrix
+        """
+        requirelinearelements(options, 'IncrementalStokesletMatrix')
+        mesh = TriangleMesh.fromdicts(TriangleArray)
+        self.numberTrianglePoints = numberTrianglePoints
+        self.regularization = regularization
+        self.mu = mu
+        self.options = options
+        self.indices = mesh.indices
+        self.bodyPoints = mesh.vertexpoints(numberTrianglePoints)
+        self.rotation = np.eye(3)
+        self.translation = np.zeros(3)
+
+        self.mesh = mesh
+        self.bodyMatrix = assemblestokesletmatrix(self.bodyPoints, mesh, numberTrianglePoints,
+                                                  regularization, mu, **options)
+        self.factorization = None
+        # number of field points and vertex columns recomputed by the last update
+        self.lastUpdate = {'rows': numberTrianglePoints, 'columns': numberTrianglePoints}
+
+    @property
+    def points(self):
+        """3 x V array of the world coordinates of the vertices."""
+        return self.rotation @ self.bodyPoints + self.translation[:, np.newaxis]
+
+    @property
+    def matrix(self):
+        """3V x 3V Stokeslet matrix in the world frame."""
+        V = self.numberTrianglePoints
+        blocks = self.bodyMatrix.reshape(V, 3, V, 3)
+        return np.einsum('ij,mjvk,lk->mivl', self.rotation, blocks,
+                         self.rotation).reshape(3 * V, 3 * V)
+
+    def move(self, rotation=None, translation=None):
+        """
+        Moves the body rigidly, x -> rotation x + translation, without any
+        reassembly or refactorization.
+        """
+        if rotation is not None:
+            self.rotation = np.asarray(rotation, dtype=float) @ self.rotation
+            self.translation = np.asarray(rotation, dtype=float) @ self.translation
+        if translation is not None:
+            self.translation = self.translation + np.asarray(translation, dtype=float)
+        self.lastUpdate = {'rows': 0, 'columns': 0}
+
+    def deform(self, points, changed=None):
+        """
+        Moves the vertices to the world coordinates points and updates the
+        matrix.
+
+        Parameters:
+            points: 3 x V array of the new vertex coordinates
+            changed: indices of the vertices that moved; by default those
+            that moved by more than MOTION_TOL times the size of the body
+        """
+        bodyPoints = self.rotation.T @ (np.asarray(points, dtype=float)
+                                        - self.translation[:, np.newaxis])
+        if changed is None:
+            size = np.ptp(self.bodyPoints, axis=1).max()
+            changed = np.flatnonzero(np.abs(bodyPoints - self.bodyPoints).max(axis=0)
+                                     > MOTION_TOL * size)
+        changed = np.asarray(changed, dtype=int)
+        if changed.size == 0:
+            self.lastUpdate = {'rows': 0, 'columns': 0}
+            return
+
+        # only the moved vertices change, the others keep their coordinates
+        self.bodyPoints[:, changed] = bodyPoints[:, changed]
+        self.mesh = TriangleMesh(self.bodyPoints, self.indices.T, orient=False)
+        self.factorization = None
+
+        # every face touching a moved vertex changes all three of its columns
+        isChanged = np.zeros(self.numberTrianglePoints, dtype=bool)
+        isChanged[changed] = True
+        columns = np.unique(self.indices[isChanged[self.indices].any(axis=1)])
+        if columns.size > FULL_REASSEMBLY_FRACTION * self.numberTrianglePoints:
+            self.bodyMatrix = assemblestokesletmatrix(self.bodyPoints, self.mesh,
+                                                      self.numberTrianglePoints,
+                                                      self.regularization, self.mu,
+                                                      **self.options)
+            self.lastUpdate = {'rows': self.numberTrianglePoints,
+                               'columns': self.numberTrianglePoints}
+            return
+
+        # the columns in the rows of the vertices that did not move: the faces
+        # of the star of the columns, numbered locally, the other vertices of
+        # these faces go to a discarded last column
+        local = np.full(self.numberTrianglePoints, columns.size)
+        local[columns] = np.arange(columns.size)
+        isColumn = np.zeros(self.numberTrianglePoints, dtype=bool)
+        isColumn[columns] = True
+        star = np.flatnonzero(isColumn[self.indices].any(axis=1))
+        starMesh = self.mesh[star]
+        starMesh.indices = local[starMesh.indices]
+        rows = np.flatnonzero(~isChanged)
+        columnBlock = assemblestokesletmatrix(self.bodyPoints[:, rows], starMesh,
+                                              columns.size + 1, self.regularization, self.mu,
+                                              **self.options)
+        self.bodyMatrix[np.ix_(interleaved(rows), interleaved(columns))] = columnBlock[:, :-3]
+
+        # all columns in the rows of the moved vertices
+        self.bodyMatrix[interleaved(changed)] = assemblestokesletmatrix(
+            self.bodyPoints[:, changed], self.mesh, self.numberTrianglePoints,
+            self.regularization, self.mu, **self.options)
+        self.lastUpdate = {'rows': changed.size, 'columns': columns.size}
+
+    def solve(self, U):
+        """
+        Forces F solving A F = U in the world frame, U a 3V vector or a
+        3V x K array. The body-frame matrix is LU factored once after every
+        deformation, rigid motions reuse the factorization.
+        """
+        if self.factorization is None:
+            self.factorization = lu_factor(self.bodyMatrix, check_finite=False)
+        U = np.asarray(U, dtype=float)
+        V = self.numberTrianglePoints
+        bodyU = np.einsum('ji,vj...->vi...', self.rotation, U.reshape((V, 3) + U.shape[1:]))
+        bodyF = lu_solve(self.factorization, bodyU.reshape(U.shape), check_finite=False)
+        F = np.einsum('ij,vj...->vi...', self.rotation, bodyF.reshape((V, 3) + U.shape[1:]))
+        return F.reshape(U.shape)
+
+
+def runtimesteps(stokesletMatrix, velocity, dt, numberSteps, callback=None):
+    """
+    Advances a body with prescribed vertex velocities by explicit Euler
+    steps, solving for the forces at every step with an
+    IncrementalStokesletMatrix.
+
+    The velocities are a rigid motion about the centroid c of the vertices
+    plus a deformation, U = u + w x (x - c) + D. The rigid motion is applied
+    exactly with move, which needs no reassembly nor refactorization; only
+    the vertices where D is nonzero are deformed, reassembling their rows
+    and columns.
+
+    Parameters:
+        stokesletMatrix: IncrementalStokesletMatrix, updated in place
+        velocity: function velocity(time, points) of the 3 x V array of the
+        world vertex coordinates, returning either the tuple (u, w, D) with
+        D a 3 x V array or None, or the 3 x V vertex velocities U, split
+        with the least squares rigid motion (any local deformation then
+        spreads to all vertices, so returning the split is cheaper)
+        dt: time step
+        numberSteps: number of steps
+        callback: optional function callback(step, time, points, F) called
+        after every solve
+
+    Output:
+        F: 3V vector of the forces at the last step
+    """
+    F = None
+    for step in range(numberSteps):
+        time = step * dt
+        points = stokesletMatrix.points
+        center = points.mean(axis=1)
+        arms = (points - center[:, np.newaxis]).T
+        modes = np.zeros((arms.shape[0], 3, 6))
+        modes[:, :, :3] = np.eye(3)
+        for k in range(3):
+            modes[:, :, 3 + k] = np.cross(np.eye(3)[k], arms)
+
+        motion = velocity(time, points)
+        if isinstance(motion, tuple):
+            translational, angular, deformation = motion
+            rigid = np.concatenate([np.asarray(translational, dtype=float),
+                                    np.asarray(angular, dtype=float)])
+            remainder = np.zeros_like(points) if deformation is None else \
+                np.asarray(deformation, dtype=float)
+            U = (modes @ rigid).T + remainder
+        else:
+            U = np.asarray(motion, dtype=float)
+            rigid = np.linalg.lstsq(modes.reshape(-1, 6), U.T.ravel(), rcond=None)[0]
+            remainder = U - (modes @ rigid).T
+
+        F = stokesletMatrix.solve(U.T.ravel())
+        if callback is not None:
+            callback(step, time, points, F)
+
+        rotation = rotationmatrix(rigid[3:] * dt)
+        if np.any(rigid):
+            # exact rigid motion about the centroid over the step
+            stokesletMatrix.move(rotation, center - rotation @ center + rigid[:3] * dt)
+        scale = max(np.abs(U).max(), np.finfo(float).tiny)
+        changed = np.flatnonzero(np.abs(remainder).max(axis=0) > MOTION_TOL * scale)
+        if changed.size:
+            moved = stokesletMatrix.points
+            moved[:, changed] += dt * (rotation @ remainder[:, changed])
+            stokesletMatrix.deform(moved, changed)
+    return F
@@ -0,0 +1,239 @@
+import numpy as np
+from scipy.sparse import coo_matrix, csc_matrix, csr_matrix, issparse
+from scipy.sparse.linalg import LinearOperator, aslinearoperator, bicgstab, gmres
+
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.computeblockspacked import PACKED_INDEX
+from reg_stokeslet_surfaces.stokeslethmatrix import StokesletHMatrix
+from reg_stokeslet_surfaces.stokesletoperator import StokesletOperator
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+
+def nearfieldpattern(TriangleArray):
+    """
+    Row and column vertex indices (v, w) of all vertex pairs sharing a face,
+    i.e. the near field of every vertex: itself and its neighbouring faces.
+
+    Output:
+        rows, cols: Q x 3 x 3 int arrays, rows[q, a, b] = indices[q, a] and
+        cols[q, a, b] = indices[q, b]
+    """
+    indices = TriangleMesh.fromdicts(TriangleArray).indices
+    rows = np.broadcast_to(indices[:, :, np.newaxis], indices.shape + (3,))
+    cols = np.broadcast_to(indices[:, np.newaxis, :], indices.shape[:1] + (3, 3))
+    return rows, cols
+
+
+def nearfieldmatrix(TriangleArray, numberTrianglePoints, regularization, mu, A=None):
+    """
+    NEARFIELDMATRIX builds the sparse 3V x 3V near-field part of the
+    Stokeslet matrix on the vertices of the triangulation: the 3x3 blocks
+    (v, w) for all pairs of vertices v, w sharing a face.
+
+    Parameters:
+        TriangleArray: TriangleMesh, or list of triangle dictionaries
+        numberTrianglePoints: number of unique points V of the triangulation
+        regularization: blob parameter
+        mu: viscosity parameter
+        A: optional dense 3V x 3V Stokeslet matrix. If given its entries are
+        copied on the near-field pattern; otherwise only the contributions of
+        the faces around each vertex are computed.
+
+    Output:
+        N: 3V x 3V scipy.sparse CSC matrix
+    """
+    mesh = TriangleMesh.fromdicts(TriangleArray)
+    rows, cols = nearfieldpattern(mesh)
+
+    # 3 x 3 component offsets of every block entry
+    rowEntries = (3 * rows)[..., None, None] + np.arange(3)[:, None]
+    colEntries = (3 * cols)[..., None, None] + np.arange(3)[None, :]
+    rowEntries, colEntries = np.broadcast_arrays(rowEntries, colEntries)
+
+    if A is not None:
+        # pairs shared by several faces appear more than once, so find the
+        # distinct entries of the pattern first
+        pattern = coo_matrix((np.ones(rowEntries.size), (rowEntries.ravel(), colEntries.ravel())),
+                             shape=(3 * numberTrianglePoints, 3 * numberTrianglePoints))
+        pattern = pattern.tocsc().tocoo()
+        values = np.asarray(A)[pattern.row, pattern.col]
+        return csc_matrix((values, (pattern.row, pattern.col)), shape=pattern.shape)
+
+    # every face against its own three vertices: Q x 3 (vertex) x 3 (point) x 6
+    faceData = mesh.facedata()
+    packedBlocks = computefaceblocks(faceData['vertices'], faceData, regularization)
+    packedBlocks *= (faceData['bh'] / (8 * np.pi * mu))[:, None, None, None]
+    blocks = packedBlocks[..., PACKED_INDEX]                # Q x b x a x 3 x 3
+    values = np.swapaxes(blocks, 1, 2)                      # Q x a x b x 3 x 3
+
+    # contributions of the faces around each vertex are summed by the
+    # sparse constructor
+    N = csc_matrix((values.ravel(), (rowEntries.ravel(), colEntries.ravel())),
+                   shape=(3 * numberTrianglePoints, 3 * numberTrianglePoints))
+    return N
+
+
+def matrixentries(A, rows, cols):
+    """
+    Entries A[rows, cols] of a dense array or of a scipy.sparse matrix (zero
+    where the sparse matrix has no stored entry), for index arrays of any shape.
+    """
+    if not issparse(A):
+        return np.asarray(A)[rows, cols]
+
+    A = csr_matrix(A)
+    A.sum_duplicates()
+    storedRows = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+    storedKeys = storedRows.astype(np.int64) * A.shape[1] + A.indices
+    queryKeys = np.asarray(rows, dtype=np.int64) * A.shape[1] + cols
+    position = np.minimum(np.searchsorted(storedKeys, queryKeys), storedKeys.size - 1)
+    return np.where(storedKeys[position] == queryKeys, A.data[position], 0.0)
+
+
+def nearfieldpreconditioner(A, TriangleArray, kind='nearfield'):
+    """
+    Preconditioner M ~ A^{-1} built from the near field of every vertex.
+
+    For kind='nearfield' the near field of vertex v is its patch, v and the
+    vertices sharing a face with it. The 3P x 3P block of A on the patch is
+    inverted and the rows of v of that inverse become the rows of v of M
+    (a sparse approximate inverse, or restricted additive Schwarz). For
+    kind='blockjacobi' only the 3x3 diagonal blocks of A are inverted.
+
+    Parameters:
+        A: dense 3V x 3V Stokeslet matrix, or its sparse near-field part
+        from nearfieldmatrix
+        TriangleArray: TriangleMesh, or list of triangle dictionaries
+        kind: 'nearfield' or 'blockjacobi'
+
+    Output:
+        M: 3V x 3V scipy.sparse CSR matrix
+    """
+    numberTrianglePoints = A.shape[0] // 3
+
+    if kind == 'blockjacobi':
+        patchVertices = [np.arange(numberTrianglePoints)]
+        patches = [patchVertices[0][:, np.newaxis]]
+    elif kind == 'nearfield':
+        rows, cols = nearfieldpattern(TriangleArray)
+        adjacency = csr_matrix((np.ones(rows.size), (rows.ravel(), cols.ravel())),
+                               shape=(numberTrianglePoints, numberTrianglePoints))
+        adjacency.sum_duplicates()
+        adjacency.sort_indices()
+
+        # group the patches by size so the local inverses can be stacked
+        patchSizes = np.diff(adjacency.indptr)
+        patchVertices = [np.flatnonzero(patchSizes == size) for size in np.unique(patchSizes)]
+        patches = [adjacency.indices[adjacency.indptr[vertices][:, np.newaxis]
+                                     + np.arange(patchSizes[vertices[0]])]
+                   for vertices in patchVertices]
+    else:
+        raise ValueError(f"unknown preconditioner '{kind}'")
+
+    precRows, precCols, precValues = [], [], []
+    for vertices, patch in zip(patchVertices, patches):
+        # G x 3P indices of the entries of every patch
+        entries = (3 * patch[:, :, None] + np.arange(3)).reshape(patch.shape[0], -1)
+        localBlocks = matrixentries(A, entries[:, :, None], entries[:, None, :])
+        localInverses = np.linalg.inv(localBlocks)
+
+        # keep the three rows belonging to the vertex itself
+        position = np.argmax(patch == vertices[:, None], axis=1)
+        ownRows = 3 * position[:, None] + np.arange(3)
+        values = np.take_along_axis(localInverses, ownRows[:, :, None], axis=1)
+
+        precRows.append(np.broadcast_to((3 * vertices[:, None] + np.arange(3))[:, :, None],
+                                        values.shape).ravel())
+        precCols.append(np.broadcast_to(entries[:, None, :], values.shape).ravel())
+        precValues.append(values.ravel())
+
+    return csr_matrix((np.concatenate(precValues),
+                       (np.concatenate(precRows), np.concatenate(precCols))), shape=A.shape)
+
+
+def iterativesolve(A, uField, TriangleArray=None, method='gmres', preconditioner='nearfield',
+                   rtol=1e-10, restart=100, maxiter=None, residualHistory=False):
+    """
+    ITERATIVESOLVE solves A F = uField for the forces with preconditioned
+    GMRES or BiCGSTAB instead of a dense direct solve.
+
+    Parameters:
+        A: dense 3V x 3V Stokeslet matrix, or a StokesletOperator (e.g. a
+        StokesletHMatrix) whose field points are the vertices of its
+        triangulation, or any LinearOperator with a LinearOperator
+        preconditioner
+        uField: 3V vector of velocities at the vertices
+        TriangleArray: triangulation, needed for the near-field
+        preconditioners when A is a dense matrix
+        method: 'gmres' or 'bicgstab'
+        preconditioner: 'nearfield', 'blockjacobi', None, or a LinearOperator
+        approximating the inverse of A (e.g.
+        MultiBodyStokesletOperator.selfpreconditioner())
+        rtol: relative residual tolerance
+        restart: GMRES restart length
+        maxiter: maximum number of iterations
+        residualHistory: for BiCGSTAB, record the true relative residual
+        after every iteration, at the cost of one extra product with A per
+        iteration (GMRES records its preconditioned residual for free)
+
+    Output:
+        F: 3V vector of forces
+        info: dictionary with 'iterations', 'residuals', 'converged' and
+        'method'. 'residuals' is the array of the relative residual norms
+        after every iteration: the preconditioned residuals for GMRES, and
+        the true residuals for BiCGSTAB with residualHistory. For BiCGSTAB
+        without residualHistory it is empty, as scipy's bicgstab does not
+        pass its recursive residual to the callback; 'iterations' is
+        counted either way.
+    """
+    uField = np.asarray(uField, dtype=float)
+
+    M = None
+    if isinstance(preconditioner, LinearOperator):
+        M = preconditioner
+    elif preconditioner is not None:
+        if isinstance(A, StokesletOperator):
+            # the dense entries are not available, use the near-field part
+            if A.shape[0] != A.shape[1]:
+                raise ValueError("the near-field preconditioner needs the vertices as field points")
+            TriangleArray = A.mesh
+            if isinstance(A, StokesletHMatrix):
+                # the dense blocks hold the exact near-field entries
+                nearField = A.densepart()
+            else:
+                nearField = nearfieldmatrix(A.mesh, A.numberTrianglePoints, A.regularization, A.mu)
+        else:
+            if TriangleArray is None:
+                raise ValueError("TriangleArray is needed to precondition a dense matrix")
+            nearField = A
+        M = nearfieldpreconditioner(nearField, TriangleArray, preconditioner)
+
+    operator = aslinearoperator(A)
+    residuals = []
+    normU = np.linalg.norm(uField)
+    iterations = 0
+
+    if method == 'gmres':
+        F, exitCode = gmres(operator, uField, rtol=rtol, restart=restart, maxiter=maxiter,
+                            M=M, callback=residuals.append, callback_type='pr_norm')
+        iterations = len(residuals)
+    elif method == 'bicgstab':
+        def recordResidual(xk):
+            nonlocal iterations
+            iterations += 1
+            if residualHistory:
+                residuals.append(np.linalg.norm(uField - operator.matvec(xk)) / normU)
+
+        F, exitCode = bicgstab(operator, uField, rtol=rtol, maxiter=maxiter, M=M,
+                               callback=recordResidual)
+    else:
+        raise ValueError(f"unknown iterative method '{method}'")
+
+    info = {
+        'iterations': iterations,
+        'residuals': np.array(residuals),
+        'converged': exitCode == 0,
+        'method': method,
+    }
+
+    return F, info
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from reg_stokeslet_surfaces.sphere_grid_icos_size import sphere_grid_icos_size
+from reg_stokeslet_surfaces.sphere_gridfaces_icos2 import sphere_gridfaces_icos2
+from reg_stokeslet_surfaces.sphere_gridpoints_icos2 import sphere_gridpoints_icos2
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+# bump whenever a change to the generators or to the face geometry changes
+# the stored arrays, so stale meshes are never returned
+MESH_VERSION = 1
+DEFAULT_MESH_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'reg_stokeslet_surfaces',
+                                      'meshes')
+# power of the radius every stored array scales with
+RADIUS_POWERS = {'points': 1, 'vertices': 1, 'lengths': 1, 'heights': 1, 'bh': 2,
+                 'indices': 0, 'directions': 0, 'normaltoplane': 0, 'normalstosides': 0}
+
+
+class MeshLibrary:
+    """
+    Persistent library of icosphere meshes with all their per-face geometry.
+
+    Every (factor, generator) is generated once at radius 1 and stored as a
+    directory of .npy files, one per array of TriangleMesh (points, indices
+    and TRIANGLE_FIELDS), named after the generator, the factor and
+    MESH_VERSION. The arrays are loaded with mmap_mode='r', so all the
+    processes using a mesh share one physical copy through the page cache.
+    Other radii are obtained by scaling the lengths on load (the unit
+    directions and normals stay memory mapped), without recomputing any
+    geometry.
+    """
+
+    def __init__(self, directory=DEFAULT_MESH_DIRECTORY):
+        """
+        Parameters:
+            directory: directory of the meshes, created if needed
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, factor, symmetric=False):
+        generator = 'icos2-symmetric' if symmetric else 'icos2'
+        return os.path.join(self.directory, f'{generator}-f{int(factor)}-v{MESH_VERSION}')
+
+    def load(self, factor, symmetric=False):
+        """
+        TriangleMesh of radius 1 with read-only memory mapped arrays, or None
+        if the mesh is not stored.
+        """
+        path = self.path(factor, symmetric)
+        try:
+            arrays = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode='r')
+                      for key in RADIUS_POWERS}
+        except FileNotFoundError:
+            return None
+        return TriangleMesh.fromarrays(**arrays)
+
+    def store(self, factor, mesh, symmetric=False):
+        """
+        Writes the arrays of the radius 1 mesh. They are written to a
+        temporary directory which is then renamed, so concurrent readers never
+        see a partial mesh; if another process stored the mesh first, its copy
+        is kept.
+        """
+        temporaryPath = tempfile.mkdtemp(dir=self.directory, suffix='.tmp')
+        try:
+            for key in RADIUS_POWERS:
+                np.save(os.path.join(temporaryPath, key + '.npy'), getattr(mesh, key))
+            os.rename(temporaryPath, self.path(factor, symmetric))
+        except OSError:
+            if not os.path.isdir(self.path(factor, symmetric)):
+                raise
+        finally:
+            shutil.rmtree(temporaryPath, ignore_errors=True)
+
+    def mesh(self, factor, radius=1, symmetric=False):
+        """
+        TriangleMesh of the icosphere of triangulatesphereicos(factor, radius,
+        symmetric=symmetric), generated and stored on the first use. For
+        radius 1 all its arrays are memory mapped.
+        """
+        mesh = self.load(factor, symmetric)
+        if mesh is None:
+            number_pts = sphere_grid_icos_size(factor)[0]
+            xyzPts = sphere_gridpoints_icos2(factor, number_pts, symmetric)
+            mesh = TriangleMesh(xyzPts, sphere_gridfaces_icos2(factor)[1])
+            self.store(factor, mesh, symmetric)
+            mesh = self.load(factor, symmetric)
+        if radius == 1:
+            return mesh
+        arrays = {key: np.multiply(getattr(mesh, key), radius**power) if power else
+                  getattr(mesh, key) for key, power in RADIUS_POWERS.items()}
+        return TriangleMesh.fromarrays(**arrays)
+
+    def triangulatesphereicos(self, factor, radius, index_start=0, symmetric=False):
+        """
+        Same parameters and output as triangulatesphereicos, read from the
+        library.
+        """
+        mesh = self.mesh(factor, radius, symmetric)
+        faces = mesh.faces + index_start * np.ones((3, len(mesh)))
+        return mesh, mesh.points, faces
+
+    def entries(self):
+        """
+        List of the paths of the stored meshes.
+        """
+        return sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                      if not name.endswith('.tmp'))
+
+    def clear(self):
+        for path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,169 @@
+import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+from scipy.sparse.linalg import LinearOperator
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import (assemblestokesletmatrix,
+                                                            requirelinearelements)
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+# decimals of the relative transforms compared to find identical interactions
+TRANSFORM_DECIMALS = 12
+
+
+def pointstokesletmatrix(xField, yPoints, weights, regularization, mu):
+    """
+    3M x 3N matrix of regularized Stokeslets at the points yPoints with
+    weights, (weights_v / (8 pi mu)) S(x_m - y_v): the far-field
+    approximation of the Stokeslet matrix of a surface whose vertex basis
+    functions integrate to weights.
+    """
+    r = xField.T[:, np.newaxis, :] - yPoints.T[np.newaxis]
+    eps2 = regularization ** 2
+    R2 = np.einsum('mvi,mvi->mv', r, r) + eps2
+    invR3 = 1 / (R2 * np.sqrt(R2))
+    blocks = np.einsum('mvi,mvj->mivj', r, r * invR3[..., np.newaxis])
+    diagonal = (R2 + eps2) * invR3
+    for i in range(3):
+        blocks[:, i, :, i] += diagonal
+    blocks *= (weights / (8 * np.pi * mu))[:, np.newaxis]
+    return blocks.reshape(3 * xField.shape[1], 3 * yPoints.shape[1])
+
+
+class MultiBodyStokesletOperator(LinearOperator):
+    """
+    Stokeslet operator of N rigidly placed copies of one template body, on
+    the vertices of all bodies: U = A F with A the 3VN x 3VN block matrix of
+    the blocks A_ab (velocities on body a due to the forces on body b).
+
+    Body b has the vertices x = R_b X + t_b, X the template vertices. By the
+    rotation equivariance of the kernel, A_ab = blockdiag(R_b) Ahat
+    blockdiag(R_b)^T, with Ahat the template matrix at the field points of
+    body a seen from body b, R_b^T (x_a - t_b). So:
+
+    - the self blocks are all the same template self block, assembled once;
+    - Ahat only depends on the relative transform (R_b^T R_a,
+      R_b^T (t_a - t_b)), and is assembled once per distinct relative
+      transform (e.g. once per lattice offset for a regular array);
+    - beyond cutoff template radii between the centres, Ahat is replaced by
+      point Stokeslets at the vertices weighted by the integrals of their
+      basis functions (relative error O((h / d)^2)).
+
+    Storage and assembly scale with the number of distinct interactions.
+    """
+
+    def __init__(self, TriangleArray, numberTrianglePoints, regularization, mu, rotations=None,
+                 translations=None, cutoff=None, **options):
+        """
+        Parameters:
+            TriangleArray: TriangleMesh, or list of triangle dictionaries of
+            the template body
+            numberTrianglePoints: number of unique points V of the template
+            regularization: blob parameter
+            mu: viscosity parameter
+            rotations: N x 3 x 3 array of the body orientations (identity by
+            default)
+            translations: N x 3 array of the body positions (one body at the
+            origin by default)
+            cutoff: centre distance, in template radii, beyond which the
+            inter-body blocks use point Stokeslets; None (default) assembles
+            all blocks exactly
+            options: passed to assemblestokesletmatrix
+        """
+        requirelinearelements(options, 'MultiBodyStokesletOperator')
+        self.mesh = TriangleMesh.fromdicts(TriangleArray)
+        self.numberTrianglePoints = numberTrianglePoints
+        self.regularization = regularization
+        self.mu = mu
+        translations = np.zeros((1, 3)) if translations is None else \
+            np.asarray(translations, dtype=float)
+        if translations.ndim != 2 or translations.shape[1] != 3:
+            raise ValueError(f"translations must be an N x 3 array, not {translations.shape}")
+        numberBodies = translations.shape[0]
+        if rotations is None:
+            rotations = np.broadcast_to(np.eye(3), (numberBodies, 3, 3))
+        self.rotations = np.asarray(rotations, dtype=float)
+        if self.rotations.shape != (numberBodies, 3, 3):
+            raise ValueError(f"rotations must be an N x 3 x 3 array with N = {numberBodies}, "
+                             f"not {self.rotations.shape}")
+        self.translations = translations
+        self.numberBodies = numberBodies
+
+        V = numberTrianglePoints
+        self.points = self.mesh.vertexpoints(V)
+        centroid = self.points.mean(axis=1)
+        radius = np.linalg.norm(self.points - centroid[:, np.newaxis], axis=0).max()
+        weights = np.bincount(self.mesh.indices.ravel(), np.repeat(self.mesh.bh / 6, 3),
+                              minlength=V)
+
+        self.selfBlock = assemblestokesletmatrix(self.points, self.mesh, V, regularization, mu,
+                                                 **options)
+
+        # Ahat of every distinct relative transform, and the block of every pair
+        self.interactionBlocks = []
+        self.pairBlocks = np.full((numberBodies, numberBodies), -1)
+        self.numberFarBlocks = 0
+        transforms = {}
+        centers = np.einsum('bij,j->bi', self.rotations, centroid) + translations
+        for a in range(numberBodies):
+            for b in range(numberBodies):
+                if a == b:
+                    continue
+                relativeRotation = self.rotations[b].T @ self.rotations[a]
+                relativeTranslation = self.rotations[b].T @ (translations[a] - translations[b])
+                key = np.round(np.concatenate([relativeRotation.ravel(), relativeTranslation]),
+                               TRANSFORM_DECIMALS).tobytes()
+                if key not in transforms:
+                    xField = relativeRotation @ self.points + relativeTranslation[:, np.newaxis]
+                    distance = np.linalg.norm(centers[a] - centers[b])
+                    if cutoff is not None and distance > cutoff * radius:
+                        block = pointstokesletmatrix(xField, self.points, weights,
+                                                     regularization, mu)
+                        self.numberFarBlocks += 1
+                    else:
+                        block = assemblestokesletmatrix(xField, self.mesh, V, regularization, mu,
+                                                        **options)
+                    transforms[key] = len(self.interactionBlocks)
+                    self.interactionBlocks.append(block)
+                self.pairBlocks[a, b] = transforms[key]
+
+        super().__init__(dtype=float, shape=(3 * V * numberBodies, 3 * V * numberBodies))
+
+    def _matmat(self, F):
+        V = self.numberTrianglePoints
+        numberRHS = F.shape[1]
+        forces = F.reshape(self.numberBodies, V, 3, numberRHS)
+        # forces in the frames of their bodies, stacked as 3V x K
+        bodyForces = np.einsum('bji,bvjk->bvik', self.rotations, forces)
+        bodyForces = bodyForces.reshape(self.numberBodies, 3 * V, numberRHS)
+
+        velocities = np.zeros((self.numberBodies, V, 3, numberRHS))
+        for b in range(self.numberBodies):
+            for a in range(self.numberBodies):
+                block = self.selfBlock if a == b else self.interactionBlocks[self.pairBlocks[a, b]]
+                velocity = (block @ bodyForces[b]).reshape(V, 3, numberRHS)
+                velocities[a] += np.einsum('ij,vjk->vik', self.rotations[b], velocity)
+        return velocities.reshape(-1, numberRHS)
+
+    def _matvec(self, F):
+        return self._matmat(F.reshape(-1, 1)).ravel()
+
+    def selfpreconditioner(self):
+        """
+        Block-Jacobi preconditioner, a LinearOperator applying the inverse of
+        the self block of every body. All of them share one LU factorization
+        of the template self block.
+        """
+        V = self.numberTrianglePoints
+        factorization = lu_factor(self.selfBlock, check_finite=False)
+
+        def applyinverse(U):
+            U = np.asarray(U, dtype=float)
+            velocities = U.reshape(self.numberBodies, V, 3, -1)
+            bodyU = np.einsum('bji,bvjk->bvik', self.rotations, velocities)
+            bodyF = np.stack([lu_solve(factorization, u.reshape(3 * V, -1), check_finite=False)
+                              for u in bodyU])
+            F = np.einsum('bij,bvjk->bvik', self.rotations,
+                          bodyF.reshape(self.numberBodies, V, 3, -1))
+            return F.reshape(U.shape)
+
+        return LinearOperator(self.shape, matvec=applyinverse, matmat=applyinverse, dtype=float)
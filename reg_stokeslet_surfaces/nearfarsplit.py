@@ -0,0 +1,128 @@
+import numpy as np
+from scipy.optimize import brentq
+from scipy.spatial import cKDTree
+
+from reg_stokeslet_surfaces.computefaceblocksnumba import faceblocksbackend
+from reg_stokeslet_surfaces.computefaceblocksquadrature import computefaceblocksquadrature
+
+# relative accuracy of the far-field quadrature by default
+DEFAULT_QUADRATURE_TOL = 1e-10
+# highest quadrature order still cheaper than the analytic integrals
+MAX_QUADRATURE_ORDER = 4
+MIN_QUADRATURE_ORDER = 2
+# number of field points per spatial tile
+DEFAULT_TILE_POINTS = 64
+
+
+def quadratureorder(ratio, tol=DEFAULT_QUADRATURE_TOL):
+    """
+    Number of Gauss points per direction for trianglequadrature to reach a
+    relative error tol on a face, for field points at ratio times the face
+    radius from its centroid. Uses the error model 2 r^2 (2r)^(-2n), fitted
+    to the quadrature on icosphere faces for ratio >= 2.
+
+    Parameters:
+        ratio: distance to face radius ratio (scalar or array), > 1
+        tol: relative error tolerance
+
+    Output:
+        order: int (or int array) of Gauss points per direction
+    """
+    ratio = np.asarray(ratio, dtype=float)
+    order = np.ceil(np.log(2 * ratio ** 2 / tol) / (2 * np.log(2 * ratio)))
+    return np.maximum(order, MIN_QUADRATURE_ORDER).astype(int)
+
+
+def nearfieldratio(tol=DEFAULT_QUADRATURE_TOL, maxOrder=MAX_QUADRATURE_ORDER):
+    """
+    Smallest distance to face radius ratio at which maxOrder Gauss points per
+    direction reach the tolerance tol, i.e. where the quadrature becomes
+    cheaper than the analytic integrals.
+    """
+    def excess(logRatio):
+        ratio = np.exp(logRatio)
+        return np.log(2 * ratio ** 2 / tol) - 2 * maxOrder * np.log(2 * ratio)
+
+    return float(np.exp(brentq(excess, 0.0, 50.0)))
+
+
+def facesizes(faceData):
+    """
+    Centroids (Q x 3) and radii (Q, largest centroid to vertex distance) of
+    the faces.
+    """
+    centroids = faceData['vertices'].mean(axis=2)
+    radii = np.linalg.norm(faceData['vertices'] - centroids[:, :, np.newaxis], axis=1).max(axis=1)
+    return centroids, radii
+
+
+def spatialorder(points):
+    """
+    Permutation of the columns of a 3 x M array of points into the leaf order
+    of a cKDTree, so consecutive points are spatially close.
+    """
+    points = np.asarray(points)
+    if points.shape[1] == 0:
+        return np.zeros(0, dtype=int)
+    return cKDTree(points.T).indices
+
+
+def computefaceblocksnearfar(xField, faceData, regularization, nearRatio=None,
+                             tol=DEFAULT_QUADRATURE_TOL, tileSize=DEFAULT_TILE_POINTS,
+                             backend='numpy'):
+    """
+    COMPUTEFACEBLOCKSNEARFAR computes the same packed blocks as
+    computefaceblocks, with the analytic T_{mnq} integrals only near the
+    faces and trianglequadrature in the far field.
+
+    The field points are processed in tiles of tileSize consecutive points,
+    so they should be in spatialorder. For every tile, the faces whose
+    centroid is at least nearRatio face radii away from all points of the
+    tile are far: they use the quadrature, grouped by the order
+    quadratureorder gives for their smallest distance ratio. The other faces
+    use the analytic integrals for the whole tile.
+
+    Parameters:
+        xField: 3 x M array of field points, preferably in spatialorder
+        faceData: dictionary of stacked triangle data for Qb faces
+        regularization: blob parameter
+        nearRatio: distance to face radius ratio below which the analytic
+        integrals are used; nearfieldratio(tol) by default
+        tol: relative error tolerance of the far-field quadrature
+        tileSize: number of field points per tile
+        backend: 'numpy' or 'numba', computes the analytic integrals (see
+        faceblocksbackend)
+
+    Output:
+        packedBlocks: Qb x 3 x M x 6 array of the (unscaled) packed blocks
+    """
+    if nearRatio is None:
+        nearRatio = nearfieldratio(tol)
+    faceblocks = faceblocksbackend(backend)
+
+    numberBlockFaces = faceData['bh'].shape[0]
+    numberFieldPoints = xField.shape[1]
+    packedBlocks = np.empty((numberBlockFaces, 3, numberFieldPoints, 6))
+    centroids, radii = facesizes(faceData)
+
+    for start in range(0, numberFieldPoints, tileSize):
+        tile = slice(start, min(start + tileSize, numberFieldPoints))
+        xTile = xField[:, tile]
+
+        # smallest |x - centroid| / radius over the points of the tile
+        distance = np.linalg.norm(xTile[np.newaxis] - centroids[:, :, np.newaxis], axis=1)
+        ratio = distance.min(axis=1) / radii
+        order = np.where(ratio >= nearRatio, quadratureorder(np.maximum(ratio, nearRatio), tol), 0)
+
+        for n in np.unique(order):
+            faces = np.flatnonzero(order == n)
+            if faces.size == numberBlockFaces:
+                faces = slice(None)
+            groupData = {key: value[faces] for key, value in faceData.items()}
+            if n == 0:
+                groupBlocks = faceblocks(xTile, groupData, regularization)
+            else:
+                groupBlocks = computefaceblocksquadrature(xTile, groupData, regularization, n)
+            packedBlocks[faces, :, tile] = groupBlocks
+
+    return packedBlocks
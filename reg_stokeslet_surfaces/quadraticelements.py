@@ -0,0 +1,41 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+
+def quadraticelements(TriangleArray, projection=None):
+    """
+    QUADRATICELEMENTS adds a node at the midpoint of every side of a
+    triangulation, for the 6-node quadratic elements of
+    assemblestokesletmatrix. The midpoints are those of the straight sides,
+    shared by the two faces of every side; a projection moves them onto the
+    surface, for the curved elements through the nodes.
+
+    Parameters:
+        TriangleArray: TriangleMesh, or list of Q triangle dictionaries
+        projection: optional function mapping a 3 x E array of points to
+        the nearest points of the surface, e.g. x / |x| for the unit sphere
+
+    Output:
+        nodes: 3 x (V + E) array, the V vertices followed by the midpoints of
+        the E sides
+        elements: Q x 6 array of node indices of the faces, the vertices as in
+        the 'indices' of the faces, then the midpoints of the sides (0, 1),
+        (1, 2) and (2, 0), the node order of elementbasis(2)
+    """
+    mesh = TriangleMesh.fromdicts(TriangleArray)
+    indices = mesh.indices
+    numberVertices = mesh.points.shape[1]
+
+    # the sides of every face, numbered by their sorted vertex pair
+    sides = np.stack([indices, np.roll(indices, -1, axis=1)], axis=2)
+    uniqueSides, sideNumbers = np.unique(np.sort(sides, axis=2).reshape(-1, 2), axis=0,
+                                         return_inverse=True)
+    sideNumbers = sideNumbers.reshape(-1, 3)
+
+    midpoints = (mesh.points[:, uniqueSides[:, 0]] + mesh.points[:, uniqueSides[:, 1]]) / 2
+    if projection is not None:
+        midpoints = projection(midpoints)
+    nodes = np.concatenate([mesh.points, midpoints], axis=1)
+    elements = np.concatenate([indices, numberVertices + sideNumbers], axis=1)
+    return nodes, elements
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.assemblyprofile import AssemblyProfile
+from reg_stokeslet_surfaces.evaluatevelocity import evaluatevelocity
+from reg_stokeslet_surfaces.iterativesolve import iterativesolve
+from reg_stokeslet_surfaces.stokesletsolver import StokesletSolver
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+from reg_stokeslet_surfaces.triangulatesphereicos import triangulatesphereicos
+
+DEFAULT_FACTORS = (2, 4, 6, 8, 12, 16, 24)
+DEFAULT_FIELD_POINTS = (10**3, 10**4, 10**5, 10**6)
+# next to the package, whatever the working directory
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               'benchmark_history.jsonl')
+# relative slowdown against the best earlier commit flagged as a regression
+DEFAULT_REGRESSION_TOL = 0.2
+# cases faster than this are too noisy to be flagged
+MIN_FLAGGED_SECONDS = 1e-2
+# number of grid points evaluated together by the velocity benchmark
+VELOCITY_CHUNK_POINTS = 10**4
+
+
+def measure(function, repeat=1, traceMemory=True):
+    """
+    Best wall time of repeat untraced calls of function(), and the peak
+    memory traced by tracemalloc (NumPy reports its array allocations)
+    during one more call, so the tracing overhead never enters the times.
+
+    Output:
+        result: return value of the last timed call
+        record: dictionary with 'seconds' and 'peakBytes' (None without
+        traceMemory)
+    """
+    seconds = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    peakBytes = None
+    if traceMemory:
+        tracemalloc.start()
+        try:
+            function()
+            peakBytes = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, {'seconds': seconds, 'peakBytes': peakBytes}
+
+
+def gridchunks(numberPoints, halfWidth=3.0, chunkSize=VELOCITY_CHUNK_POINTS):
+    """
+    Generator of 3 x Mi chunks of a cubic grid of about numberPoints points
+    on [-halfWidth, halfWidth]^3, so large grids are never stored at once.
+    """
+    n = max(2, int(round(numberPoints ** (1 / 3))))
+    axis = np.linspace(-halfWidth, halfWidth, n)
+    for start in range(0, n**3, chunkSize):
+        i, j, k = np.unravel_index(np.arange(start, min(start + chunkSize, n**3)), (n, n, n))
+        yield np.stack([axis[i], axis[j], axis[k]])
+
+
+def currentcommit():
+    """Hash of the checked out git commit of the package, None outside git."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flagregressions(results, history, commit, tol=DEFAULT_REGRESSION_TOL, machine=None):
+    """
+    Cases of results slower by more than a fraction tol than the best time
+    of the same case in the earlier runs of history on other commits. With
+    machine, only the runs recorded with the same machine are compared, as
+    times from other hosts or library versions are not comparable.
+
+    Output:
+        list of dictionaries with 'case', 'seconds', 'bestSeconds',
+        'bestCommit' and 'slowdown'
+    """
+    best = {}
+    for run in history:
+        if commit is not None and run.get('commit') == commit:
+            continue
+        if machine is not None and run.get('machine') != machine:
+            continue
+        for case, record in run['results'].items():
+            if case not in best or record['seconds'] < best[case][0]:
+                best[case] = (record['seconds'], run.get('commit'))
+
+    regressions = []
+    for case, record in results.items():
+        if case not in best or record['seconds'] < MIN_FLAGGED_SECONDS:
+            continue
+        bestSeconds, bestCommit = best[case]
+        slowdown = record['seconds'] / bestSeconds - 1
+        if slowdown > tol:
+            regressions.append({'case': case, 'seconds': record['seconds'],
+                                'bestSeconds': bestSeconds, 'bestCommit': bestCommit,
+                                'slowdown': slowdown})
+    return regressions
+
+
+def runbenchmarks(factors=DEFAULT_FACTORS, fieldPoints=DEFAULT_FIELD_POINTS, regularization=1e-2,
+                  mu=1, velocityFactor=6, maxMatrixBytes=2**31, repeat=1,
+                  history=DEFAULT_HISTORY, tol=DEFAULT_REGRESSION_TOL, verbose=True):
+    """
+    RUNBENCHMARKS times the main operations of the package on icospheres of
+    radius 1, records the results in a history file and flags regressions
+    against the earlier commits in it. Nothing is plotted, it runs headless.
+
+    Cases, named '<operation>/<size>':
+        triangulate/factor=f: triangulatesphereicos
+        assemble/factor=f: assemblestokesletmatrix on the vertices
+        assemble.<stage>/factor=f: its stages, timed by an AssemblyProfile
+        solve.dense/factor=f: LU solve of a uniform translation
+        solve.mixed/factor=f: the same with a float32 LU refined to float64
+        accuracy (StokesletSolver with dtype=np.float32 and the assembled A)
+        solve.iterative/factor=f: iterativesolve (GMRES, near-field
+        preconditioner) of the same system
+        velocity/points=n: evaluatevelocity on a grid of about n points
+        around the sphere of factor velocityFactor
+
+    Parameters:
+        factors: icosphere factors of the mesh benchmarks
+        fieldPoints: numbers of grid points of the velocity benchmarks
+        regularization: blob parameter
+        mu: viscosity parameter
+        velocityFactor: icosphere factor of the velocity benchmarks
+        maxMatrixBytes: meshes whose Stokeslet matrix is larger are only
+        triangulated
+        repeat: number of timed calls of every case, the best is kept
+        history: path of the JSON lines history file, one run per line, by
+        default benchmark_history.jsonl in the directory holding the package;
+        None to neither read nor record a history
+        tol: relative slowdown flagged as a regression (see flagregressions)
+        verbose: print every case and the regressions
+
+    Output:
+        run: dictionary with 'commit', 'timestamp', 'machine' and 'results'
+        (case -> 'seconds' and 'peakBytes', except for the stages, plus the
+        sizes)
+        regressions: see flagregressions
+    """
+    if 'pyvista' in sys.modules:
+        # never open a render window, even if a plot slips in
+        sys.modules['pyvista'].OFF_SCREEN = True
+
+    results = {}
+
+    def record(case, entry, **sizes):
+        entry.update(sizes)
+        results[case] = entry
+        if verbose:
+            memory = '' if entry.get('peakBytes') is None else \
+                f"{entry['peakBytes'] / 2**20:10.1f} MiB"
+            print(f"{case:40s} {entry['seconds']:10.4f} s {memory}")
+
+    for factor in factors:
+        (TriangleArray, points, faces), entry = measure(
+            lambda: triangulatesphereicos(factor, 1), repeat)
+        V = points.shape[1]
+        record(f'triangulate/factor={factor}', entry, vertices=V)
+        if (3 * V)**2 * 8 > maxMatrixBytes:
+            continue
+
+        mesh = TriangleMesh.fromdicts(TriangleArray)
+        A, entry = measure(lambda: assemblestokesletmatrix(points, mesh, V, regularization, mu),
+                           repeat)
+        record(f'assemble/factor={factor}', entry, vertices=V)
+        with AssemblyProfile() as profile:
+            assemblestokesletmatrix(points, mesh, V, regularization, mu)
+        for stage, stageEntry in profile.stages.items():
+            record(f'assemble.{stage}/factor={factor}', {'seconds': stageEntry['seconds']},
+                   vertices=V, calls=stageEntry['calls'], outputBytes=stageEntry['outputBytes'])
+
+        U = np.tile([1.0, 0.0, 0.0], V)
+        _, entry = measure(lambda: np.linalg.solve(A, U), repeat)
+        record(f'solve.dense/factor={factor}', entry, vertices=V)
+        _, entry = measure(lambda: StokesletSolver(mesh, V, regularization, mu, A=A,
+                                                   dtype=np.float32).solve(U), repeat)
+        record(f'solve.mixed/factor={factor}', entry, vertices=V)
+        (_, info), entry = measure(lambda: iterativesolve(A, U, mesh), repeat)
+        record(f'solve.iterative/factor={factor}', entry, vertices=V,
+               iterations=info['iterations'])
+        del A
+
+    if fieldPoints:
+        TriangleArray, points, _ = triangulatesphereicos(velocityFactor, 1)
+        mesh = TriangleMesh.fromdicts(TriangleArray)
+        V = points.shape[1]
+        A = assemblestokesletmatrix(points, mesh, V, regularization, mu)
+        F = np.linalg.solve(A, np.tile([1.0, 0.0, 0.0], V))
+        del A
+        for numberPoints in fieldPoints:
+            _, entry = measure(lambda: evaluatevelocity(gridchunks(numberPoints), mesh, F,
+                                                        regularization, mu), repeat)
+            record(f'velocity/points={numberPoints}', entry, vertices=V,
+                   points=max(2, int(round(numberPoints ** (1 / 3))))**3)
+
+    run = {
+        'commit': currentcommit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'node': platform.node(), 'python': platform.python_version(),
+                    'numpy': np.__version__},
+        'results': results,
+    }
+
+    regressions = []
+    if history is not None:
+        pastRuns = []
+        if os.path.exists(history):
+            with open(history) as historyFile:
+                pastRuns = [json.loads(line) for line in historyFile if line.strip()]
+        regressions = flagregressions(results, pastRuns, run['commit'], tol, run['machine'])
+        run['regressions'] = regressions
+        with open(history, 'a') as historyFile:
+            historyFile.write(json.dumps(run) + '\n')
+
+    if verbose:
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']}: {regression['seconds']:.4f} s, "
+                  f"{100 * regression['slowdown']:.0f}% slower than "
+                  f"{regression['bestSeconds']:.4f} s at {regression['bestCommit']}")
+    return run, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=runbenchmarks.__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--factors', type=int, nargs='*', default=list(DEFAULT_FACTORS))
+    parser.add_argument('--points', type=int, nargs='*', default=list(DEFAULT_FIELD_POINTS))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--history', default=DEFAULT_HISTORY)
+    parser.add_argument('--tol', type=float, default=DEFAULT_REGRESSION_TOL)
+    arguments = parser.parse_args()
+    _, regressions = runbenchmarks(arguments.factors, arguments.points, repeat=arguments.repeat,
+                                   history=arguments.history, tol=arguments.tol)
+    # a nonzero exit status flags the regressions in CI
+    sys.exit(1 if regressions else 0)
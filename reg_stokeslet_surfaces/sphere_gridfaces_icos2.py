@@ -0,0 +1,83 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.sphere_gridpoints_icos2 import icos_shape
+
+def sphere_gridfaces_icos2(factor):
+    """
+    Triangles of the icosahedral grid of sphere_gridpoints_icos2, built
+    directly from the subdivision of the 20 faces of the icosahedron instead
+    of a convex hull of the nodes.
+
+    Face (a, b, c) of the icosahedron is subdivided as the triangular lattice
+    of the points (fa, fbc), 0 <= fbc <= fa <= factor, at the level fa from
+    vertex a and the step fbc from the side a-b towards a-c. Every lattice
+    point is a node of sphere_gridpoints_icos2: a vertex, an edge point, or a
+    face interior point.
+
+    Parameters:
+        factor (int): Subdivision factor.
+
+    Returns:
+        face_num (int): Number of triangles, 20 * factor**2.
+        face (np.ndarray): 3 x face_num array of node indices, every
+            triangle oriented with its normal pointing outward and rotated so
+            its smallest index is first.
+    """
+    point_num = 12
+    edge_num = 30
+    point_coord, edge_point, face_order, face_point = icos_shape()
+
+    # node of every edge subdivision step, from both ends of the edge
+    edge_nodes = {}
+    steps = np.arange(1, factor)
+    for edge in range(edge_num):
+        a, b = edge_point[:, edge]
+        nodes = point_num + edge * (factor - 1) + steps - 1
+        edge_nodes[a, b] = np.concatenate([[a], nodes, [b]])
+        edge_nodes[b, a] = edge_nodes[a, b][::-1]
+
+    # lattice point (fa, fbc) of a face is entry fa * (fa + 1) / 2 + fbc
+    fa = np.repeat(np.arange(factor + 1), np.arange(1, factor + 2))
+    fbc = np.arange(fa.size) - fa * (fa + 1) // 2
+    interior = (fbc > 0) & (fbc < fa) & (fa < factor)
+
+    # lattice triangles: (fa, fbc), (fa + 1, fbc), (fa + 1, fbc + 1) pointing
+    # away from vertex a, and (fa, fbc), (fa + 1, fbc + 1), (fa, fbc + 1)
+    def lattice(i, j):
+        return i * (i + 1) // 2 + j
+
+    up_a = fa[fa < factor]
+    up_b = fbc[fa < factor]
+    down = (fa < factor) & (fbc < fa)
+    down_a = fa[down]
+    down_b = fbc[down]
+    triangles = np.concatenate([
+        np.stack([lattice(up_a, up_b), lattice(up_a + 1, up_b), lattice(up_a + 1, up_b + 1)]),
+        np.stack([lattice(down_a, down_b), lattice(down_a + 1, down_b + 1),
+                  lattice(down_a, down_b + 1)]),
+    ], axis=1)
+
+    interior_num = (factor - 1) * (factor - 2) // 2
+    faces = []
+    for face in range(face_point.shape[1]):
+        a, b, c = face_point[:, face]
+        node = np.empty(fa.size, dtype=int)
+        node[fbc == 0] = edge_nodes[a, b]
+        node[fbc == fa] = edge_nodes[a, c]
+        node[fa == factor] = edge_nodes[b, c]
+        node[interior] = point_num + edge_num * (factor - 1) + face * interior_num \
+            + np.arange(interior_num)
+
+        face_nodes = node[triangles]
+        normal = np.cross(point_coord[:, b] - point_coord[:, a],
+                          point_coord[:, c] - point_coord[:, a])
+        if normal @ point_coord[:, a] < 0:
+            face_nodes = face_nodes[::-1]
+        faces.append(face_nodes)
+    face = np.concatenate(faces, axis=1)
+
+    # rotate every column so the smallest index is first
+    first = np.argmin(face, axis=0)
+    face = face[(first + np.arange(3)[:, np.newaxis]) % 3, np.arange(face.shape[1])]
+
+    return face.shape[1], face
@@ -1,21 +1,30 @@
 import numpy as np
 
-def sphere_gridpoints_icos2(factor, node_num):
+def sphere_gridpoints_icos2(factor, node_num, symmetric=False):
     """
     Return icosahedral grid points on a sphere.
 
     Parameters:
         factor (int): Subdivision factor.
         node_num (int): Expected number of nodes (for validation).
+        symmetric (bool, optional): Place the face interior points
+            symmetrically. By default they are interpolated from the first
+            vertex of every face, so the grid is invariant under the rotations
+            of the icosahedron only up to a few percent of the grid spacing;
+            with symmetric=True every interior point is the normalized mean of
+            the constructions from the three vertices of its face, and the grid
+            is exactly invariant. The nodes keep the same order.
 
     Returns:
         node_xyz (np.ndarray): Array of shape (3, node_num) with node coordinates.
+
+    All the nodes of a kind are placed at once: the great arc constructions
+    broadcast over the edges (or faces) and the subdivision steps.
     """ 
     #for icosahedron 
     point_num = 12;
     edge_num = 30;
     face_num = 20;
-    face_order_max = 3;
     face_order_max=3
     
     point_coord, edge_point, face_order, face_point = icos_shape(
@@ -23,63 +32,83 @@ def sphere_gridpoints_icos2(factor, node_num):
     )
 
     node_xyz = np.zeros((3, node_num))
-    node = 0
 
     # A. Icosahedron vertices
     node_xyz[:, :point_num] = point_coord
     node = point_num
 
-    # B. Edge points
-    for edge in range(edge_num):
-        a = edge_point[0, edge]
-        b = edge_point[1, edge]
-
-        theta = sphere_distance_xyz(point_coord[:, a], point_coord[:, b])
-        bn, _ = r8vec_polarize(point_coord[:, b], point_coord[:, a])
-        bn /= np.linalg.norm(bn)
-
-        for f in range(1, factor):
-            angle = (f * theta) / factor
-            node_xyz[:, node] = (
-                np.cos(angle) * point_coord[:, a]
-                + np.sin(angle) * bn
-            )
-            node += 1
-
-    # C. Face interior points
-    for face in range(face_num):
-        a = face_point[0, face]
-        b = face_point[1, face]
-        c = face_point[2, face]
-
-        theta_ab = sphere_distance_xyz(point_coord[:, a], point_coord[:, b])
-        theta_ac = sphere_distance_xyz(point_coord[:, a], point_coord[:, c])
-
-        bn, _ = r8vec_polarize(point_coord[:, b], point_coord[:, a])
-        bn /= np.linalg.norm(bn)
-        cn, _ = r8vec_polarize(point_coord[:, c], point_coord[:, a])
-        cn /= np.linalg.norm(cn)
-
-        for fa in range(2, factor):
-            angle_ab = (fa * theta_ab) / factor
-            ab = np.cos(angle_ab) * point_coord[:, a] + np.sin(angle_ab) * bn
-
-            angle_ac = (fa * theta_ac) / factor
-            ac = np.cos(angle_ac) * point_coord[:, a] + np.sin(angle_ac) * cn
-
-            theta_bc = sphere_distance_xyz(ab, ac)
-            acn, _ = r8vec_polarize(ac, ab)
-            acn /= np.linalg.norm(acn)
-
-            for fbc in range(1, fa):
-                angle = fbc * theta_bc / fa
-                node_xyz[:, node] = np.cos(angle) * ab + np.sin(angle) * acn
-                node += 1
+    # B. Edge points, edge by edge: 3 x edge_num x (factor - 1)
+    f = np.arange(1, factor)
+    edge_xyz = great_arc_point(point_coord[:, edge_point[0], np.newaxis],
+                               point_coord[:, edge_point[1], np.newaxis], f / factor)
+    node_xyz[:, node:node + edge_xyz[0].size] = edge_xyz.reshape(3, -1)
+    node += edge_xyz[0].size
+
+    # C. Face interior points, face by face, in the order of the levels fa
+    # (from the first vertex) and of the steps fbc along every level
+    fa, fbc = face_interior_steps(factor)
+    a, b, c = (point_coord[:, face_point[k], np.newaxis] for k in range(3))
+    if symmetric:
+        face_xyz = face_point_symmetric((a, b, c), (factor - fa, fa - fbc, fbc))
+    else:
+        ab = great_arc_point(a, b, fa / factor)
+        ac = great_arc_point(a, c, fa / factor)
+        face_xyz = great_arc_point(ab, ac, fbc / fa)
+    node_xyz[:, node:node + face_xyz[0].size] = face_xyz.reshape(3, -1)
 
     return node_xyz
 
-    
-    
+
+def face_interior_steps(factor):
+    """
+    Levels fa = 2, ..., factor - 1 and steps fbc = 1, ..., fa - 1 of the face
+    interior points, in the order of the nodes of a face.
+    """
+    fa = np.repeat(np.arange(2, factor), np.arange(1, factor - 1))
+    fbc = np.arange(fa.size) - np.repeat(np.cumsum(np.arange(0, factor - 2)),
+                                         np.arange(1, factor - 1)) + 1
+    return fa, fbc
+
+
+def great_arc_point(p, q, t):
+    """
+    Point at the fraction t of the great arc from p to q, cos(t theta) p +
+    sin(t theta) qn with theta the angle between p and q and qn the unit
+    part of q normal to p. p and q are 3 x ... arrays of unit vectors,
+    broadcast against t.
+    """
+    pDotQ = np.sum(p * q, axis=0)
+    theta = np.arctan2(np.linalg.norm(np.cross(p, q, axis=0), axis=0), pDotQ)
+    qn = q - (pDotQ / np.sum(p * p, axis=0)) * p
+    qn = qn / np.linalg.norm(qn, axis=0)
+    angle = t * theta
+    return np.cos(angle) * p + np.sin(angle) * qn
+
+
+def face_point_symmetric(corners, weights):
+    """
+    Face interior points with integer barycentric weights (wa, wb, wc) on the
+    faces with vertices corners (three 3 x ... arrays of unit vectors),
+    averaged over the constructions of sphere_gridpoints_icos2 from each of
+    the three vertices. The corners and weights broadcast against each other.
+
+    From vertex a the point is on the great arc between the points at
+    fraction (wb + wc) / factor of the arcs a-b and a-c, at fraction
+    wc / (wb + wc) from the first.
+    """
+    def slerp(p, q, t):
+        theta = np.arccos(np.clip(np.sum(p * q, axis=0), -1.0, 1.0))
+        return (np.sin((1 - t) * theta) * p + np.sin(t * theta) * q) / np.sin(theta)
+
+    factor = sum(weights)
+    point = 0
+    for k in range(3):
+        a, b, c = (k + np.arange(3)) % 3
+        level = weights[b] + weights[c]
+        ab = slerp(corners[a], corners[b], level / factor)
+        ac = slerp(corners[a], corners[c], level / factor)
+        point = point + slerp(ab, ac, weights[c] / level)
+    return point / np.linalg.norm(point, axis=0)
 
 def icos_size():
     """
@@ -166,67 +195,3 @@ def icos_shape(point_num=12, edge_num=30, face_num=20, face_order_max=3):
     ]) - 1).T  # Shape: (3, 20)
 
     return point_coord, edge_point, face_order, face_point
-
-def sphere_distance_xyz(xyz1, xyz2):
-    """
-    Computes the great circle distance between two points on a sphere
-    using their XYZ coordinates.
-
-    Parameters:
-        xyz1 (array_like): Coordinates of the first point (length 3).
-        xyz2 (array_like): Coordinates of the second point (length 3).
-
-    Returns:
-        float: Great circle distance between the two points.
-    """
-    xyz1 = np.asarray(xyz1).flatten()
-    xyz2 = np.asarray(xyz2).flatten()
-
-    r = np.linalg.norm(xyz1)
-
-    lat1 = np.arcsin(xyz1[2] / r)
-    lon1 = np.arctan2(xyz1[1], xyz1[0])
-
-    lat2 = np.arcsin(xyz2[2] / r)
-    lon2 = np.arctan2(xyz2[1], xyz2[0])
-
-    top = (np.cos(lat2) * np.sin(lon1 - lon2))**2 + \
-          (np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon1 - lon2))**2
-
-    top = np.sqrt(top)
-
-    bot = np.sin(lat1) * np.sin(lat2) + \
-          np.cos(lat1) * np.cos(lat2) * np.cos(lon1 - lon2)
-
-    dist = r * np.arctan2(top, bot)
-
-    return dist
-
-
-def r8vec_polarize(a, p):
-    """
-    Decomposes a vector `a` into components normal and parallel to a direction `p`.
-
-    Parameters:
-        a (array_like): The vector to be polarized, shape (n,) or (n,1).
-        p (array_like): The direction vector for polarization, shape (n,) or (n,1).
-
-    Returns:
-        a_normal (ndarray): The component of `a` normal (perpendicular) to `p`, shape (n,).
-        a_parallel (ndarray): The component of `a` parallel to `p`, shape (n,).
-    """
-    a = np.asarray(a).flatten()
-    p = np.asarray(p).flatten()
-
-    p_norm = np.linalg.norm(p)
-
-    if p_norm == 0.0:
-        a_normal = a.copy()
-        a_parallel = np.zeros_like(a)
-        return a_normal, a_parallel
-
-    a_dot_p = np.dot(a, p) / p_norm
-    a_parallel = (a_dot_p / p_norm) * p
-    a_normal = a - a_parallel
-
-    return a_normal, a_parallel
@@ -0,0 +1,471 @@
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.computefaceblocksquadrature import computefaceblocksquadrature
+from reg_stokeslet_surfaces.computeblockspacked import PACKED_INDEX
+from reg_stokeslet_surfaces.assemblestokesletmatrix import DEFAULT_BLOCK_PAIRS
+from reg_stokeslet_surfaces.nearfarsplit import facesizes, nearfieldratio, quadratureorder
+from reg_stokeslet_surfaces.stokesletoperator import StokesletOperator
+
+# relative accuracy of the low-rank blocks by default
+DEFAULT_HMATRIX_TOL = 1e-6
+# admissible when min(diameters) <= admissibility * distance
+DEFAULT_ADMISSIBILITY = 2.0
+# largest number of points (or vertices) of a leaf cluster
+DEFAULT_LEAF_POINTS = 32
+# number of sampled field points for the error estimate
+DEFAULT_ERROR_SAMPLES = 32
+
+
+def bisectiontree(points, leafSize):
+    """
+    BISECTIONTREE splits clusters of points in two halves at the median of
+    their longest bounding box direction, until every cluster holds at most
+    leafSize points. The points of every cluster are contiguous in the
+    returned order.
+
+    Parameters:
+        points: N x 3 array
+        leafSize: largest number of points of a leaf
+
+    Output:
+        order: permutation of the points into tree order
+        tree: dictionary of cluster arrays 'start', 'end' (C) and 'children'
+        (C x 2, -1 for leaves), clusters in breadth-first order
+    """
+    order = np.arange(points.shape[0])
+    start, end, children = [0], [points.shape[0]], [[-1, -1]]
+
+    cluster = 0
+    while cluster < len(start):
+        s, e = start[cluster], end[cluster]
+        if e - s > leafSize:
+            local = points[order[s:e]]
+            direction = np.argmax(local.max(axis=0) - local.min(axis=0))
+            half = (e - s) // 2
+            order[s:e] = order[s:e][np.argpartition(local[:, direction], half)]
+            children[cluster] = [len(start), len(start) + 1]
+            start += [s, s + half]
+            end += [s + half, e]
+            children += [[-1, -1], [-1, -1]]
+        cluster += 1
+
+    tree = {
+        'start': np.array(start),
+        'end': np.array(end),
+        'children': np.array(children),
+    }
+    return order, tree
+
+
+def clusterboxes(order, tree, low, high):
+    """
+    Bounding boxes (C x 3 corners) of the clusters of bisectiontree, from the
+    low and high corners (N x 3) of the boxes of the individual points.
+    """
+    numberClusters = tree['start'].size
+    clusterLow = np.empty((numberClusters, 3))
+    clusterHigh = np.empty((numberClusters, 3))
+    for c in range(numberClusters):
+        members = order[tree['start'][c]:tree['end'][c]]
+        clusterLow[c] = low[members].min(axis=0)
+        clusterHigh[c] = high[members].max(axis=0)
+    return clusterLow, clusterHigh
+
+
+def raggedgather(indptr, indices, rows):
+    """
+    Concatenation of the rows of a CSR-like (indptr, indices) pair.
+    """
+    starts = indptr[rows]
+    lengths = indptr[np.asarray(rows) + 1] - starts
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return indices[offsets + np.arange(lengths.sum())]
+
+
+class StokesletHMatrix(StokesletOperator):
+    """
+    Hierarchical matrix approximation of the 3M x 3V Stokeslet matrix
+    assemblestokesletmatrix would build, U = A F.
+
+    Field points and vertices are split into clusters by bisectiontree. A
+    pair of clusters is admissible when the smaller of the two bounding
+    boxes is at most admissibility times their distance, where the box of a
+    vertex cluster covers the faces around its vertices. Admissible blocks are
+    stored as low-rank products U V, found by adaptive cross approximation
+    on the 3x3 blocks: every step computes one field point against the
+    vertices of the block and one vertex against the field points of the
+    block, so only these sampled rows and columns of the per-face kernel
+    are evaluated. The factors are then recompressed by an SVD to tol. The
+    other leaf blocks are computed densely.
+
+    The kernel is evaluated as in computefaceblocksnearfar: analytic
+    integrals near a face, quadrature an order of magnitude below tol
+    further away.
+
+    matvec/rmatvec/matmat cost O(stored entries). densepart() is the sparse
+    matrix of the dense blocks, with the exact near-field entries that
+    iterativesolve uses for its preconditioner. compressionreport() gives
+    the storage and the error on sampled rows.
+
+    No H-LU factorization (or other H-matrix arithmetic) is provided: the
+    H-matrix is only applied, so solves go through iterativesolve.
+    """
+
+    def __init__(self, xField, TriangleArray, numberTrianglePoints, regularization, mu,
+                 tol=DEFAULT_HMATRIX_TOL, admissibility=DEFAULT_ADMISSIBILITY,
+                 leafSize=DEFAULT_LEAF_POINTS):
+        """
+        Parameters:
+            xField: 3 x M array of field points
+            TriangleArray: TriangleMesh, or list of triangle dictionaries
+            numberTrianglePoints: number of unique points V of the triangulation
+            regularization: blob parameter
+            mu: viscosity parameter
+            tol: relative accuracy of the low-rank blocks
+            admissibility: admissibility parameter of the cluster pairs
+            leafSize: largest number of field points (vertices) of a cluster
+        """
+        super().__init__(xField, TriangleArray, numberTrianglePoints, regularization, mu)
+        self.tol = tol
+        self.admissibility = admissibility
+        self.leafSize = leafSize
+        # the far-field quadrature is kept an order of magnitude below tol
+        self.nearRatio = nearfieldratio(tol / 10)
+
+        self.faceData = self.mesh.facedata()
+        self.scale = self.faceData['bh'] / (8 * np.pi * mu)
+
+        # faces around every vertex, CSR-like
+        indices = self.mesh.indices.ravel()
+        faceOrder = np.argsort(indices, kind='stable')
+        self.vertexFaces = faceOrder // 3
+        self.vertexFacePointer = np.concatenate(
+            [[0], np.cumsum(np.bincount(indices, minlength=numberTrianglePoints))])
+
+        self.setupclusters()
+        self.setupblocks()
+
+    def setupclusters(self):
+        """
+        Cluster trees of the field points (rows) and of the vertices
+        (columns) and the bounding boxes of their clusters.
+        """
+        points = self.xField.T
+        self.rowOrder, self.rowTree = bisectiontree(points, self.leafSize)
+        self.rowLow, self.rowHigh = clusterboxes(self.rowOrder, self.rowTree, points, points)
+
+        # a vertex influences the field through the faces around it
+        vertices = self.faceData['vertices']
+        faceLow = np.repeat(vertices.min(axis=2), 3, axis=0)
+        faceHigh = np.repeat(vertices.max(axis=2), 3, axis=0)
+        vertexLow = np.full((self.numberTrianglePoints, 3), np.inf)
+        vertexHigh = np.full((self.numberTrianglePoints, 3), -np.inf)
+        np.minimum.at(vertexLow, self.mesh.indices.ravel(), faceLow)
+        np.maximum.at(vertexHigh, self.mesh.indices.ravel(), faceHigh)
+
+        vertexPoints = np.zeros((self.numberTrianglePoints, 3))
+        vertexPoints[self.mesh.indices.ravel()] = np.swapaxes(vertices, 1, 2).reshape(-1, 3)
+        self.colOrder, self.colTree = bisectiontree(vertexPoints, self.leafSize)
+        self.colLow, self.colHigh = clusterboxes(self.colOrder, self.colTree, vertexLow, vertexHigh)
+
+    def setupblocks(self):
+        """
+        Block cluster tree: splits the cluster pairs until they are
+        admissible (low-rank blocks) or one of them is a leaf (dense blocks).
+        """
+        rowTree, colTree = self.rowTree, self.colTree
+        rowDiameter = np.linalg.norm(self.rowHigh - self.rowLow, axis=1)
+        colDiameter = np.linalg.norm(self.colHigh - self.colLow, axis=1)
+
+        admissiblePairs, densePairs = [], []
+        stack = [(0, 0)]
+        while stack:
+            r, c = stack.pop()
+            gap = np.maximum(0, np.maximum(self.rowLow[r] - self.colHigh[c],
+                                           self.colLow[c] - self.rowHigh[r]))
+            distance = np.linalg.norm(gap)
+            rowChildren = rowTree['children'][r][rowTree['children'][r] >= 0]
+            colChildren = colTree['children'][c][colTree['children'][c] >= 0]
+
+            if min(rowDiameter[r], colDiameter[c]) <= self.admissibility * distance:
+                admissiblePairs.append((r, c))
+            elif rowChildren.size == 0 or colChildren.size == 0:
+                densePairs.append((r, c))
+            else:
+                stack.extend((rc, cc) for rc in rowChildren for cc in colChildren)
+
+        self.lowRankBlocks = []
+        self.denseBlocks = []
+        densePairs += self.crossapproximation(admissiblePairs)
+
+        # the dense blocks of a row cluster are stored together, against the
+        # concatenated entries of their column clusters
+        densePairs.sort()
+        rowGroups = [[self.clustermembers(r, c) for _, c in pairs]
+                     for r, pairs in groupby(densePairs, key=itemgetter(0))]
+        groupBlocks = self.blocks([(members[0][0], np.concatenate([m[1] for m in members]))
+                                   for members in rowGroups])
+        for members, block in zip(rowGroups, groupBlocks):
+            cols = np.concatenate([np.arange(m[3].start, m[3].stop) for m in members])
+            self.denseBlocks.append((members[0][2], cols, block))
+
+    def clustermembers(self, r, c):
+        """
+        Field points of row cluster r, vertices of column cluster c and the
+        slices of their entries in the tree-ordered matrix.
+        """
+        rs, re = self.rowTree['start'][r], self.rowTree['end'][r]
+        cs, ce = self.colTree['start'][c], self.colTree['end'][c]
+        return (self.rowOrder[rs:re], self.colOrder[cs:ce],
+                slice(3 * rs, 3 * re), slice(3 * cs, 3 * ce))
+
+    def blocks(self, pairs):
+        """
+        Exact blocks of the Stokeslet matrix for a list of (points, vertices)
+        pairs, 3m x 3n for m field points against n vertices. Every block
+        comes from the faces around its vertices; the (face, point) pairs of
+        all blocks go through computefaceblocks together, in chunks of about
+        DEFAULT_BLOCK_PAIRS.
+        """
+        if not pairs:
+            return []
+        faces = [np.unique(raggedgather(self.vertexFacePointer, self.vertexFaces, vertices))
+                 for _, vertices in pairs]
+
+        # pairs with similar numbers of points share a chunk, as the points
+        # are padded to the largest number within a chunk
+        chunks, chunkPairs = [[]], 0
+        for p in np.argsort([len(points) for points, _ in pairs], kind='stable'):
+            size = faces[p].size * len(pairs[p][0])
+            if chunks[-1] and chunkPairs + size > DEFAULT_BLOCK_PAIRS:
+                chunks.append([])
+                chunkPairs = 0
+            chunks[-1].append(p)
+            chunkPairs += size
+
+        result = [None] * len(pairs)
+        for chunk in chunks:
+            chunkBlocks = self.chunkblocks([pairs[p] for p in chunk], [faces[p] for p in chunk])
+            for p, block in zip(chunk, chunkBlocks):
+                result[p] = block
+        return result
+
+    def chunkblocks(self, pairs, faces):
+        """
+        Blocks of one chunk of (points, vertices) pairs, see blocks.
+        """
+        # field points of every pair, padded to the same number for all faces
+        numberPoints = max(len(points) for points, _ in pairs)
+        paddedPoints = np.stack([np.pad(points, (0, numberPoints - len(points)), mode='edge')
+                                 for points, _ in pairs])
+        pairFaces = np.concatenate(faces)
+        pairOf = np.repeat(np.arange(len(pairs)), [face.size for face in faces])
+
+        blockData = {key: value[pairFaces] for key, value in self.faceData.items()}
+        xField = np.swapaxes(self.xField.T[paddedPoints[pairOf]], 1, 2)
+
+        # analytic integrals near the faces, quadrature as in
+        # computefaceblocksnearfar further away
+        centroids, radii = facesizes(blockData)
+        ratio = np.linalg.norm(xField - centroids[:, :, None], axis=1).min(axis=1) / radii
+        order = np.where(ratio >= self.nearRatio,
+                         quadratureorder(np.maximum(ratio, self.nearRatio), self.tol / 10), 0)
+        packedBlocks = np.empty((pairFaces.size, 3, numberPoints, 6))
+        for n in np.unique(order):
+            group = np.flatnonzero(order == n)
+            groupData = {key: value[group] for key, value in blockData.items()}
+            if n == 0:
+                packedBlocks[group] = computefaceblocks(xField[group], groupData,
+                                                        self.regularization)
+            else:
+                packedBlocks[group] = computefaceblocksquadrature(xField[group], groupData,
+                                                                  self.regularization, n)
+        packedBlocks *= self.scale[pairFaces][:, None, None, None]
+
+        # column of every (face, vertex) pair among the stacked vertex sets
+        vertexSets = [np.asarray(vertices) for _, vertices in pairs]
+        offsets = np.concatenate([[0], np.cumsum([v.size for v in vertexSets])])
+        setKeys = np.concatenate([p * self.numberTrianglePoints + v
+                                  for p, v in enumerate(vertexSets)])
+        sortOrder = np.argsort(setKeys)
+        sortedKeys = setKeys[sortOrder]
+        faceKeys = (pairOf[:, None] * self.numberTrianglePoints + blockData['indices']).ravel()
+        position = np.minimum(np.searchsorted(sortedKeys, faceKeys), sortedKeys.size - 1)
+        inside = sortedKeys[position] == faceKeys
+        gather = csr_matrix((np.ones(inside.sum()),
+                             (sortOrder[position[inside]], np.flatnonzero(inside))),
+                            shape=(offsets[-1], faceKeys.size))
+
+        # sum the face contributions of every vertex: (sum n) x (m 3 3)
+        columns = gather @ packedBlocks[..., PACKED_INDEX].reshape(faceKeys.size, -1)
+        columns = columns.reshape(-1, numberPoints, 3, 3)
+
+        result = []
+        for p, (points, _) in enumerate(pairs):
+            block = columns[offsets[p]:offsets[p + 1], :len(points)]
+            result.append(block.transpose(1, 2, 0, 3).reshape(3 * len(points), -1))
+        return result
+
+    def crossapproximation(self, pairs):
+        """
+        Adaptive cross approximation of the admissible blocks with 3x3
+        pivots, all blocks in step so every step evaluates their pivot rows
+        (and then columns) together. A block stops when the last update is
+        below tol times the Frobenius norm of the approximation, and is
+        recompressed by an SVD. Blocks whose rank passes the break-even
+        point of the dense storage are returned as dense pairs.
+        """
+        members = [self.clustermembers(r, c) for r, c in pairs]
+        state = [{'U': np.zeros((3 * len(points), 0)), 'V': np.zeros((0, 3 * len(vertices))),
+                  'usedRows': np.zeros(len(points), dtype=bool),
+                  'usedCols': np.zeros(len(vertices), dtype=bool),
+                  'normSquared': 0.0, 'row': 0}
+                 for points, vertices, _, _ in members]
+        densePairs = []
+        active = list(range(len(pairs)))
+
+        while active:
+            rowBlocks = self.blocks([(members[b][0][[state[b]['row']]], members[b][1])
+                                     for b in active])
+            pivoting = []
+            for b, rowBlock in zip(active, rowBlocks):
+                s = state[b]
+                i = s['row']
+                s['usedRows'][i] = True
+                s['rowBlock'] = rowBlock - s['U'][3 * i:3 * i + 3] @ s['V']
+                pivotNorms = np.linalg.norm(s['rowBlock'].reshape(3, -1, 3), axis=(0, 2))
+                pivotNorms[s['usedCols']] = -1
+                s['col'] = np.argmax(pivotNorms)
+                if pivotNorms[s['col']] > 0:
+                    s['usedCols'][s['col']] = True
+                    pivoting.append(b)
+
+            colBlocks = self.blocks([(members[b][0], members[b][1][[state[b]['col']]])
+                                     for b in pivoting])
+            active = []
+            for b, colBlock in zip(pivoting, colBlocks):
+                s = state[b]
+                j = s['col']
+                U, V = s['U'], s['V']
+                u = colBlock - U @ V[:, 3 * j:3 * j + 3]
+                v = np.linalg.pinv(s['rowBlock'][:, 3 * j:3 * j + 3], rcond=1e-12) @ s['rowBlock']
+
+                # Frobenius norm of the approximation, updated incrementally
+                updateSquared = np.sum((u.T @ u) * (v @ v.T))
+                s['normSquared'] += 2 * np.sum((U.T @ u) * (V @ v.T)) + updateSquared
+                s['U'] = np.hstack([U, u])
+                s['V'] = np.vstack([V, v])
+
+                m, n = s['usedRows'].size, s['usedCols'].size
+                if s['U'].shape[1] * (m + n) >= 3 * m * n:
+                    s['dense'] = True
+                    continue
+                if updateSquared <= self.tol ** 2 * s['normSquared']:
+                    continue
+
+                rowNorms = np.linalg.norm(u.reshape(m, 9), axis=1)
+                rowNorms[s['usedRows']] = -1
+                s['row'] = np.argmax(rowNorms)
+                if rowNorms[s['row']] >= 0:
+                    active.append(b)
+
+        for (r, c), (points, vertices, rows, cols), s in zip(pairs, members, state):
+            if s.get('dense'):
+                densePairs.append((r, c))
+                continue
+
+            # recompress, U V = Qu Ru Rv^T Qv^T
+            Qu, Ru = np.linalg.qr(s['U'])
+            Qv, Rv = np.linalg.qr(s['V'].T)
+            W, sigma, Zt = np.linalg.svd(Ru @ Rv.T)
+            tail = np.sqrt(np.cumsum(sigma[::-1] ** 2))[::-1]
+            rank = max(1, int(np.sum(tail > self.tol * tail[0])))
+            self.lowRankBlocks.append((rows, cols, Qu @ (W[:, :rank] * sigma[:rank]),
+                                       Zt[:rank] @ Qv.T))
+
+        return densePairs
+
+    def _matmat(self, F):
+        x = F.reshape(self.numberTrianglePoints, 3, -1)[self.colOrder].reshape(F.shape)
+        y = np.zeros((self.shape[0], F.shape[1]))
+        for rows, cols, D in self.denseBlocks:
+            y[rows] += D @ x[cols]
+        for rows, cols, U, V in self.lowRankBlocks:
+            y[rows] += U @ (V @ x[cols])
+
+        velocity = np.empty_like(y).reshape(-1, 3, F.shape[1])
+        velocity[self.rowOrder] = y.reshape(-1, 3, F.shape[1])
+        return velocity.reshape(y.shape)
+
+    def _rmatmat(self, U):
+        x = U.reshape(self.xField.shape[1], 3, -1)[self.rowOrder].reshape(U.shape)
+        y = np.zeros((self.shape[1], U.shape[1]))
+        for rows, cols, D in self.denseBlocks:
+            y[cols] += D.T @ x[rows]
+        for rows, cols, Ub, Vb in self.lowRankBlocks:
+            y[cols] += Vb.T @ (Ub.T @ x[rows])
+
+        forces = np.empty_like(y).reshape(-1, 3, U.shape[1])
+        forces[self.colOrder] = y.reshape(-1, 3, U.shape[1])
+        return forces.reshape(y.shape)
+
+    def densepart(self):
+        """
+        Sparse 3M x 3V matrix of the dense blocks, in the original ordering.
+        It is empty when all the blocks are low rank, e.g. for field points
+        far from the surface.
+        """
+        if not self.denseBlocks:
+            return csr_matrix(self.shape)
+        rowEntries = (3 * self.rowOrder[:, None] + np.arange(3)).ravel()
+        colEntries = (3 * self.colOrder[:, None] + np.arange(3)).ravel()
+        entryRows, entryCols, values = [], [], []
+        for rows, cols, D in self.denseBlocks:
+            blockRows, blockCols = np.meshgrid(rowEntries[rows], colEntries[cols], indexing='ij')
+            entryRows.append(blockRows.ravel())
+            entryCols.append(blockCols.ravel())
+            values.append(D.ravel())
+        return csr_matrix((np.concatenate(values),
+                           (np.concatenate(entryRows), np.concatenate(entryCols))),
+                          shape=self.shape)
+
+    def compressionreport(self, numberSamples=DEFAULT_ERROR_SAMPLES, seed=0):
+        """
+        Storage of the H-matrix and its error on sampled rows.
+
+        The rows of numberSamples random field points are computed exactly
+        and compared with the same rows of the H-matrix (through rmatmat).
+
+        Output:
+            report: dictionary with 'denseEntries' (9MV), 'storedEntries',
+            'compressionRatio', 'denseBlocks', 'lowRankBlocks', 'maxRank',
+            'tol' and 'relativeError' (Frobenius, on the sampled rows)
+        """
+        storedEntries = sum(D.size for _, _, D in self.denseBlocks) \
+            + sum(U.size + V.size for _, _, U, V in self.lowRankBlocks)
+        denseEntries = self.shape[0] * self.shape[1]
+
+        numberFieldPoints = self.xField.shape[1]
+        rng = np.random.default_rng(seed)
+        samples = rng.choice(numberFieldPoints, min(numberSamples, numberFieldPoints), replace=False)
+        exactRows = self.blocks([(samples, np.arange(self.numberTrianglePoints))])[0]
+        sampleEntries = (3 * samples[:, None] + np.arange(3)).ravel()
+        selector = np.zeros((self.shape[0], sampleEntries.size))
+        selector[sampleEntries, np.arange(sampleEntries.size)] = 1
+        approximateRows = self.rmatmat(selector).T
+
+        return {
+            'denseEntries': denseEntries,
+            'storedEntries': storedEntries,
+            'compressionRatio': denseEntries / storedEntries,
+            'denseBlocks': len(self.denseBlocks),
+            'lowRankBlocks': len(self.lowRankBlocks),
+            'maxRank': max((U.shape[1] for _, _, U, _ in self.lowRankBlocks), default=0),
+            'tol': self.tol,
+            'relativeError': np.linalg.norm(approximateRows - exactRows) / np.linalg.norm(exactRows),
+        }
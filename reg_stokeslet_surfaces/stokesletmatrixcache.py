@@ -0,0 +1,175 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.nearfarsplit import DEFAULT_QUADRATURE_TOL, nearfieldratio
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+# bump whenever a change to the integrals or the assembly changes the matrices,
+# so stale cache entries are never returned
+KERNEL_VERSION = 2
+# default cache location and size cap
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'reg_stokeslet_surfaces')
+DEFAULT_CACHE_BYTES = 2**33
+
+
+class StokesletMatrixCache:
+    """
+    Persistent on-disk cache of assembled Stokeslet matrices.
+
+    Every matrix is keyed by a hash of the mesh (vertices and face indices),
+    the field points, the regularization, the assembly method (with its
+    quadrature tolerance), the quadratic elements and their nodes if any,
+    the dtype of the matrix and KERNEL_VERSION, and stored as a .npy file
+    which is memory mapped when it is read back. The matrices are stored for
+    mu = 1: A is proportional to 1 / mu, so one entry serves every viscosity.
+    The total size of the entries is capped at maxBytes; the least recently
+    used entries are evicted first.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, maxBytes=DEFAULT_CACHE_BYTES):
+        """
+        Parameters:
+            directory: directory of the .npy files, created if needed
+            maxBytes: size cap of the cache in bytes
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, xField, TriangleArray, numberTrianglePoints, regularization, method='batched',
+            nearRatio=None, tol=DEFAULT_QUADRATURE_TOL, dtype=np.float64, elements=None,
+            nodes=None):
+        """
+        Hex digest identifying the matrix of the given assembly parameters.
+        The dtype of the matrix is part of the key, a float32 entry never
+        serves a float64 request, nor flat elements curved ones. A nearRatio
+        of None is keyed as its default nearfieldratio(tol), the ratio the
+        assembly uses. The execution options of assemblestokesletmatrix
+        (blockSize, workers, backend, ...) only change the result at
+        round-off level and are not part of the key.
+        """
+        mesh = TriangleMesh.fromdicts(TriangleArray)
+        digest = hashlib.sha256()
+        parameters = [KERNEL_VERSION, int(numberTrianglePoints), float(regularization), method,
+                      np.dtype(dtype).str]
+        if method == 'nearfar':
+            if nearRatio is None:
+                nearRatio = nearfieldratio(tol)
+            parameters += [float(nearRatio), float(tol)]
+        digest.update(repr(parameters).encode())
+        arrays = [np.asarray(xField, dtype=float), mesh.vertices,
+                  np.asarray(mesh.indices, dtype=np.int64)]
+        # an empty array marks the missing elements or nodes, so the keys
+        # with and without them differ
+        arrays += [np.empty(0) if elements is None else np.asarray(elements, dtype=np.int64),
+                   np.empty(0) if nodes is None else np.asarray(nodes, dtype=float)]
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            digest.update(repr(array.shape).encode())
+            digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def load(self, key):
+        """
+        Read-only np.memmap of the cached mu = 1 matrix, or None on a miss.
+        """
+        path = self.path(key)
+        try:
+            matrix = np.load(path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+        # the modification time records the last use for the eviction
+        os.utime(path)
+        return matrix
+
+    def store(self, key, matrix):
+        """
+        Writes the mu = 1 matrix of key, then evicts least recently used
+        entries above maxBytes. The file is written under a temporary name and
+        renamed, so concurrent readers never see a partial entry.
+        """
+        handle, temporaryPath = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temporaryFile:
+                np.save(temporaryFile, matrix)
+            os.replace(temporaryPath, self.path(key))
+        except BaseException:
+            os.remove(temporaryPath)
+            raise
+        self.evict(keep=key)
+
+    def entries(self):
+        """
+        List of (last use time, size in bytes, path) of the cached matrices.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                status = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((status.st_mtime, status.st_size, path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache fits in
+        maxBytes. The entry of key keep is never removed.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            if keep is not None and path == self.path(keep):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def assemble(self, xField, TriangleArray, numberTrianglePoints, regularization, mu,
+                 method='batched', nearRatio=None, tol=DEFAULT_QUADRATURE_TOL, dtype=np.float64,
+                 elements=None, nodes=None, **options):
+        """
+        Same parameters and output as assemblestokesletmatrix, with the matrix
+        read from the cache when it has been assembled before, for any mu.
+
+        On a hit with mu = 1 the output is the read-only np.memmap of the
+        entry; for another mu it is the entry scaled by 1 / mu, read from the
+        memory map into a new array. On a miss the matrix is assembled, stored
+        and returned as an array.
+        """
+        key = self.key(xField, TriangleArray, numberTrianglePoints, regularization, method,
+                       nearRatio, tol, dtype, elements, nodes)
+        matrix = self.load(key)
+        if matrix is None:
+            matrix = assemblestokesletmatrix(xField, TriangleArray, numberTrianglePoints,
+                                             regularization, 1.0, method=method,
+                                             nearRatio=nearRatio, tol=tol, dtype=dtype,
+                                             elements=elements, nodes=nodes, **options)
+            self.store(key, matrix)
+        if mu == 1:
+            return matrix
+        return np.multiply(matrix, 1 / mu)
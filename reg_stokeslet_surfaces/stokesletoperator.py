@@ -0,0 +1,105 @@
+import numpy as np
+from scipy.sparse.linalg import LinearOperator
+
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.computeblockspacked import PACKED_INDEX
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+from reg_stokeslet_surfaces.assemblestokesletmatrix import DEFAULT_BLOCK_PAIRS
+
+# number of field points evaluated together by default
+DEFAULT_TILE_POINTS = 4096
+
+
+class StokesletOperator(LinearOperator):
+    """
+    Matrix-free regularized Stokeslet surface operator, U = A F, where A is
+    the 3M x 3V matrix assemblestokesletmatrix would build. The per-face
+    blocks are recomputed tile by tile (blockSize faces x tileSize field
+    points) and contracted against the force vector on the fly, so memory is
+    O(M + V) plus one tile buffer.
+
+    Being a scipy.sparse.linalg.LinearOperator, it supports matvec, matmat,
+    rmatvec, rmatmat, A @ F and can be passed to the scipy iterative solvers.
+    """
+
+    def __init__(self, xField, TriangleArray, numberTrianglePoints, regularization, mu,
+                 blockSize=None, tileSize=None):
+        """
+        Parameters:
+            xField: 3 x M array of field points
+            TriangleArray: TriangleMesh, or list of triangle dictionaries
+            numberTrianglePoints: number of unique points V of the triangulation
+            regularization: blob parameter
+            mu: viscosity parameter
+            blockSize: number of faces per tile
+            tileSize: number of field points per tile
+        """
+        self.xField = np.asarray(xField, dtype=float)
+        self.mesh = TriangleMesh.fromdicts(TriangleArray)
+        self.numberTrianglePoints = numberTrianglePoints
+        self.regularization = regularization
+        self.mu = mu
+
+        numberFieldPoints = self.xField.shape[1]
+        if tileSize is None:
+            tileSize = min(max(numberFieldPoints, 1), DEFAULT_TILE_POINTS)
+        if blockSize is None:
+            blockSize = max(1, DEFAULT_BLOCK_PAIRS // tileSize)
+        self.tileSize = tileSize
+        self.blockSize = blockSize
+
+        super().__init__(dtype=np.float64, shape=(3 * numberFieldPoints, 3 * numberTrianglePoints))
+
+    def tiles(self):
+        """
+        Generates (fieldSlice, faceData, blocks) for every tile, where blocks is
+        the Qb x 3 x Mt x 3 x 3 array of blocks already scaled by bh/(8 pi mu).
+        """
+        faceData = self.mesh.facedata()
+        numberFaces = len(self.mesh)
+        numberFieldPoints = self.xField.shape[1]
+
+        for fieldStart in range(0, numberFieldPoints, self.tileSize):
+            fieldSlice = slice(fieldStart, min(fieldStart + self.tileSize, numberFieldPoints))
+            xTile = self.xField[:, fieldSlice]
+
+            for start in range(0, numberFaces, self.blockSize):
+                block = slice(start, min(start + self.blockSize, numberFaces))
+                blockData = {key: value[block] for key, value in faceData.items()}
+
+                packedBlocks = computefaceblocks(xTile, blockData, self.regularization)
+                packedBlocks *= (blockData['bh'] / (8 * np.pi * self.mu))[:, None, None, None]
+
+                yield fieldSlice, blockData, packedBlocks[..., PACKED_INDEX]
+
+    def _matvec(self, F):
+        return self._matmat(np.reshape(F, (-1, 1))).reshape(-1)
+
+    def _rmatvec(self, U):
+        return self._rmatmat(np.reshape(U, (-1, 1))).reshape(-1)
+
+    def _matmat(self, F):
+        numberRightHandSides = F.shape[1]
+        forces = np.reshape(F, (self.numberTrianglePoints, 3, numberRightHandSides))
+        velocity = np.zeros((self.xField.shape[1], 3, numberRightHandSides))
+
+        for fieldSlice, blockData, blocks in self.tiles():
+            # sum over faces, vertices of the faces and force components
+            velocity[fieldSlice] += np.einsum('qvmij,qvjk->mik', blocks,
+                                              forces[blockData['indices']], optimize=True)
+
+        return velocity.reshape(-1, numberRightHandSides)
+
+    def _rmatmat(self, U):
+        numberRightHandSides = U.shape[1]
+        velocity = np.reshape(U, (self.xField.shape[1], 3, numberRightHandSides))
+        forces = np.zeros((self.numberTrianglePoints, 3, numberRightHandSides))
+
+        for fieldSlice, blockData, blocks in self.tiles():
+            # transposed blocks against the velocities of the tile
+            contributions = np.einsum('qvmij,mik->qvjk', blocks,
+                                      velocity[fieldSlice], optimize=True)
+            np.add.at(forces, blockData['indices'].ravel(),
+                      contributions.reshape(-1, 3, numberRightHandSides))
+
+        return forces.reshape(-1, numberRightHandSides)
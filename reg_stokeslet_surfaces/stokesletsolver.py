@@ -0,0 +1,201 @@
+import warnings
+
+import numpy as np
+from scipy.linalg import lu_factor, lu_solve
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import (MATRIX_DTYPES, assemblestokesletmatrix,
+                                                            requirelinearelements)
+from reg_stokeslet_surfaces.stokesletoperator import StokesletOperator
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+# relative residual at which the iterative refinement of the mixed
+# precision solves stops, and its largest number of steps
+REFINEMENT_TOL = 1e-12
+MAX_REFINEMENT_STEPS = 10
+
+
+class StokesletSolver:
+    """
+    Solver for the forces on a body given the velocities at its vertices,
+    A F = U with A the 3V x 3V Stokeslet matrix of the vertices. A is LU
+    factored once (O(V^3)); every solve then costs O(V^2) per right-hand
+    side, and any number of right-hand sides are solved in one call.
+
+    The collocation matrix is not symmetric, so an LU factorization is used
+    rather than a Cholesky one.
+
+    With dtype=np.float32 the matrix is stored and factored in single
+    precision, half the memory and about twice the LAPACK throughput, and
+    every solve is iteratively refined: F += A32^-1 (U - A F) with the
+    residual in float64, until it is below REFINEMENT_TOL relative to U.
+    Every step converges by about cond(A) times the float32 epsilon, so the
+    float64 forces are recovered in a few steps while cond(A) is well below
+    1e7.
+
+    The faster solves need the float64 A for the residuals. Without it
+    every refinement step recomputes the integrals, one full assembly per
+    step, which cancels the throughput gain of the float32 factorization:
+    only the memory is saved then.
+    """
+
+    def __init__(self, TriangleArray, numberTrianglePoints, regularization, mu, A=None,
+                 center=None, dtype=np.float64, **options):
+        """
+        Parameters:
+            TriangleArray: TriangleMesh, or list of triangle dictionaries
+            numberTrianglePoints: number of unique points V of the triangulation
+            regularization: blob parameter
+            mu: viscosity parameter
+            A: optional 3V x 3V Stokeslet matrix of the vertices (e.g. from a
+            StokesletMatrixCache). By default it is assembled with
+            assemblestokesletmatrix, passing it the other options.
+            center: reference point of the rotations and torques, the
+            centroid of the vertices by default
+            dtype: precision of the factorization, np.float64 (default) or
+            np.float32 for the mixed precision solves. Their float64
+            residuals use A when it is given in float64, otherwise the
+            matrix-free StokesletOperator, which recomputes the integrals
+            (about one assembly per refinement step) but stores no float64
+            matrix. It computes the exact integrals, so the assembly options
+            may not ask for method 'nearfar' then.
+        """
+        requirelinearelements(options, 'StokesletSolver')
+        self.mesh = TriangleMesh.fromdicts(TriangleArray)
+        self.numberTrianglePoints = numberTrianglePoints
+        self.regularization = regularization
+        self.mu = mu
+
+        # vertex coordinates from the faces, TriangleMesh.points may be unknown
+        self.points = self.mesh.vertexpoints(numberTrianglePoints)
+        self.center = self.points.mean(axis=1) if center is None else np.asarray(center, float)
+
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in MATRIX_DTYPES:
+            raise ValueError(f"unsupported dtype {self.dtype}, only float32 and float64")
+        # float64 operator of the refinement residuals, None without refinement
+        self.residualOperator = None
+
+        self.resistance = None
+        self.factor(A, **options)
+
+    def factor(self, A=None, **options):
+        """
+        LU factors A in self.dtype, assembling it first if A is None.
+        """
+        if A is None:
+            if self.dtype != np.float64 and options.get('method') == 'nearfar':
+                # the refinement would converge to the exact integrals of the
+                # residual operator, not to the factored approximation
+                raise ValueError("the float32 refinement residuals use the exact integrals, "
+                                 "method 'nearfar' is not supported with dtype float32")
+            A = assemblestokesletmatrix(self.points, self.mesh, self.numberTrianglePoints,
+                                        self.regularization, self.mu, dtype=self.dtype,
+                                        **options)
+            # the assembled matrix is not needed after the factorization
+            self.factorization = lu_factor(A, overwrite_a=True, check_finite=False)
+            residualMatrix = None
+        else:
+            A = np.asarray(A)
+            self.factorization = lu_factor(A.astype(self.dtype, copy=False), check_finite=False)
+            residualMatrix = A if A.dtype == np.float64 else None
+
+        if self.dtype == np.float64:
+            self.residualOperator = None
+        elif residualMatrix is not None:
+            self.residualOperator = residualMatrix
+        else:
+            # the same exact integrals as the batched and reference
+            # assemblies, whatever their execution options
+            self.residualOperator = StokesletOperator(self.points, self.mesh,
+                                                      self.numberTrianglePoints,
+                                                      self.regularization, self.mu,
+                                                      blockSize=options.get('blockSize'))
+
+    def solve(self, U):
+        """
+        Forces F solving A F = U.
+
+        Parameters:
+            U: 3V vector, or 3V x K array of K right-hand sides, of velocities
+            at the vertices (interleaved as in A F)
+
+        Output:
+            F: forces with the shape of U
+        """
+        U = np.asarray(U, dtype=float)
+        # the right-hand side in the precision of the factors, so lu_solve
+        # does not promote a float32 factorization to a float64 copy
+        F = lu_solve(self.factorization, U.astype(self.dtype), check_finite=False)
+        if self.residualOperator is None:
+            return F
+
+        F = F.astype(np.float64)
+        normU = np.linalg.norm(U, axis=0)
+        for step in range(MAX_REFINEMENT_STEPS + 1):
+            residual = U - self.residualOperator @ F
+            relativeResidual = np.linalg.norm(residual, axis=0) / np.where(normU > 0, normU, 1)
+            if np.all(relativeResidual <= REFINEMENT_TOL) or step == MAX_REFINEMENT_STEPS:
+                break
+            F += lu_solve(self.factorization, residual.astype(self.dtype), check_finite=False)
+        if np.any(relativeResidual > REFINEMENT_TOL):
+            warnings.warn(f"iterative refinement stopped after {MAX_REFINEMENT_STEPS} steps at "
+                          f"relative residual {relativeResidual.max():.1e}", RuntimeWarning)
+        return F
+
+    def rigidbodyvelocities(self):
+        """
+        3V x 6 array of the vertex velocities of the six rigid-body modes:
+        unit translations along x, y, z, then unit rotations about the axes
+        x, y, z through center.
+        """
+        arms = self.points - self.center[:, np.newaxis]
+        velocities = np.zeros((self.numberTrianglePoints, 3, 6))
+        for k in range(3):
+            velocities[:, k, k] = 1
+            velocities[:, :, 3 + k] = np.cross(np.eye(3)[k], arms.T)
+        return velocities.reshape(3 * self.numberTrianglePoints, 6)
+
+    def forcetorque(self, F):
+        """
+        Total force and torque about center exerted by the forces F, the
+        integrals over the faces of the linearly interpolated force density f
+        and of (x - center) x f.
+
+        Parameters:
+            F: 3V vector, or 3V x K array, of forces at the vertices
+
+        Output:
+            6 vector, or 6 x K array: the force, then the torque
+        """
+        F = np.asarray(F, dtype=float)
+        forces = F.reshape((self.numberTrianglePoints, 3) + F.shape[1:])
+        indices = self.mesh.indices
+        area = self.mesh.bh / 2
+
+        # face forces f_a at the vertices a, arms x_a - center, Q x 3 x 3 (x K)
+        faceForces = forces[indices]
+        arms = np.moveaxis(self.mesh.vertices, 1, 2) - self.center
+        force = np.einsum('q,qa...->...', area / 3, faceForces)
+
+        # the mass matrix of the linear basis on a face is area/12 (1 + delta_ab)
+        massMatrix = (np.ones((3, 3)) + np.eye(3)) / 12
+        torqueArms = np.einsum('q,ab,qai->qbi', area, massMatrix, arms)
+        torqueArms = torqueArms.reshape(torqueArms.shape + (1,) * (F.ndim - 1))
+        torque = np.cross(torqueArms, faceForces, axis=2).sum(axis=(0, 1))
+        return np.concatenate([force, torque])
+
+    def resistancematrix(self):
+        """
+        6 x 6 grand resistance tensor R: column k is the force and torque on
+        the body moving in the k-th rigid-body mode of
+        rigidbodyvelocities, i.e. (force, torque) = R (velocity, angular
+        velocity). Computed with one batched solve and cached.
+        """
+        if self.resistance is None:
+            self.resistance = self.forcetorque(self.solve(self.rigidbodyvelocities()))
+        return self.resistance
+
+    # the names StokesletSolver was released with
+    rigid_body_velocities = rigidbodyvelocities
+    force_torque = forcetorque
+    resistance_matrix = resistancematrix
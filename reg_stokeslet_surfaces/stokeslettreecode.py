@@ -0,0 +1,415 @@
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.spatial import cKDTree
+
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.computefaceblocksquadrature import (computefaceblocksquadrature,
+                                                                trianglequadrature)
+from reg_stokeslet_surfaces.computeblockspacked import PACKED_INDEX
+from reg_stokeslet_surfaces.nearfarsplit import (facesizes, nearfieldratio, quadratureorder,
+                                                 spatialorder)
+from reg_stokeslet_surfaces.stokesletoperator import StokesletOperator
+from reg_stokeslet_surfaces.assemblestokesletmatrix import DEFAULT_BLOCK_PAIRS
+
+# relative accuracy of the treecode by default
+DEFAULT_TREECODE_TOL = 1e-6
+# multipole acceptance criterion (batch radius + cluster radius) / distance
+DEFAULT_MAC = 0.6
+# number of field points per target batch
+DEFAULT_BATCH_POINTS = 64
+# number of (target, source) pairs evaluated together
+DEFAULT_INTERACTION_PAIRS = 2**18
+# number of octree levels at most
+MAX_TREE_LEVEL = 30
+
+
+def chebyshevnodes(degree):
+    """
+    Chebyshev points of the second kind on [-1, 1] and their barycentric
+    interpolation weights.
+    """
+    k = np.arange(degree + 1)
+    nodes = np.cos(np.pi * k / degree)
+    weights = (-1.0) ** k
+    weights[[0, -1]] *= 0.5
+    return nodes, weights
+
+
+def lagrangebasis(x, nodes, weights):
+    """
+    Barycentric Lagrange basis polynomials of the interpolation nodes,
+    evaluated at the points x: len(x) x len(nodes) array.
+    """
+    difference = np.asarray(x, dtype=float)[:, np.newaxis] - nodes
+    exact = difference == 0
+    difference[exact] = 1
+    terms = weights / difference
+    basis = terms / terms.sum(axis=1, keepdims=True)
+
+    # points on a node
+    onNode = exact.any(axis=1)
+    basis[onNode] = exact[onNode]
+    return basis
+
+
+def buildoctree(points, leafSize):
+    """
+    BUILDOCTREE splits the bounding cube of the points into octants until
+    every cluster holds at most leafSize points. The points of every cluster
+    are contiguous in the returned order.
+
+    Parameters:
+        points: N x 3 array
+        leafSize: largest number of points of a leaf
+
+    Output:
+        order: permutation of the points into tree order
+        tree: dictionary of cluster arrays 'centre' (C x 3), 'halfWidth',
+        'start', 'end', 'level', 'parent', 'octant' (C) and 'children'
+        (C x 8, -1 where there is no child), clusters in breadth-first order
+    """
+    low, high = points.min(axis=0), points.max(axis=0)
+    rootHalfWidth = max((high - low).max() / 2, np.finfo(float).tiny) * (1 + 1e-12)
+
+    order = np.arange(points.shape[0])
+    centre, halfWidth, start, end = [(low + high) / 2], [rootHalfWidth], [0], [points.shape[0]]
+    level, parent, octant = [0], [-1], [0]
+    children = [[-1] * 8]
+
+    signs = np.array([[(o >> d) & 1 for d in range(3)] for o in range(8)]) * 2 - 1
+
+    cluster = 0
+    while cluster < len(start):
+        s, e = start[cluster], end[cluster]
+        if e - s > leafSize and level[cluster] < MAX_TREE_LEVEL:
+            local = points[order[s:e]] > centre[cluster]
+            octants = local[:, 0] + 2 * local[:, 1] + 4 * local[:, 2]
+            order[s:e] = order[s:e][np.argsort(octants, kind='stable')]
+            bounds = s + np.concatenate([[0], np.cumsum(np.bincount(octants, minlength=8))])
+
+            for o in range(8):
+                if bounds[o + 1] > bounds[o]:
+                    children[cluster][o] = len(start)
+                    centre.append(centre[cluster] + signs[o] * halfWidth[cluster] / 2)
+                    halfWidth.append(halfWidth[cluster] / 2)
+                    start.append(bounds[o])
+                    end.append(bounds[o + 1])
+                    level.append(level[cluster] + 1)
+                    parent.append(cluster)
+                    octant.append(o)
+                    children.append([-1] * 8)
+        cluster += 1
+
+    tree = {
+        'centre': np.array(centre),
+        'halfWidth': np.array(halfWidth),
+        'start': np.array(start),
+        'end': np.array(end),
+        'level': np.array(level),
+        'parent': np.array(parent),
+        'octant': np.array(octant),
+        'children': np.array(children),
+    }
+    return order, tree
+
+
+def pointstokeslets(x, y, strengths, regularization):
+    """
+    Velocities at the targets x of regularized Stokeslets at the sources y.
+
+    Parameters:
+        x: n x 3 array of target points
+        y: S x 3 array of source points
+        strengths: S x 3 x k array of Stokeslet strengths
+        regularization: blob parameter
+
+    Output:
+        n x 3 x k array of the sums over the sources of
+        (R^2 + eps^2)/R^3 s + (r . s) r / R^3, r = x - y
+    """
+    r = [x[:, i, np.newaxis] - y[np.newaxis, :, i] for i in range(3)]       # n x S
+    eps2 = regularization ** 2
+    R2 = r[0] * r[0] + r[1] * r[1] + r[2] * r[2] + eps2
+    invR3 = 1 / (R2 * np.sqrt(R2))
+
+    numberSources, _, numberRightHandSides = strengths.shape
+    velocity = (((R2 + eps2) * invR3) @ strengths.reshape(numberSources, -1)) \
+        .reshape(x.shape[0], 3, numberRightHandSides)
+
+    for k in range(numberRightHandSides):
+        rDotS = (r[0] * strengths[:, 0, k] + r[1] * strengths[:, 1, k]
+                 + r[2] * strengths[:, 2, k]) * invR3
+        for i in range(3):
+            velocity[:, i, k] += np.einsum('ns,ns->n', r[i], rDotS)
+
+    return velocity
+
+
+class StokesletTreecode(StokesletOperator):
+    """
+    Treecode approximation of the regularized Stokeslet surface operator,
+    U = A F, with an O(N log N) matvec.
+
+    The single layer is split as in computefaceblocksnearfar. For (face,
+    field point) pairs closer than nearRatio face radii the exact analytic
+    blocks are used. Every other pair goes through trianglequadrature, so
+    the faces become regularized point Stokeslets at the quadrature nodes.
+    Their sum is evaluated with a barycentric Lagrange treecode: an octree on
+    the nodes, tensor Chebyshev proxies in every cluster, and particle-cluster
+    interactions for target batches that satisfy the acceptance criterion
+    (batch radius + cluster radius) / distance < mac.
+
+    The near-field part is kept as a sparse correction (analytic minus
+    quadrature blocks), so the matvec is treecode sum + sparse product.
+    rmatvec/rmatmat are inherited from StokesletOperator and are exact.
+    """
+
+    def __init__(self, xField, TriangleArray, numberTrianglePoints, regularization, mu,
+                 tol=DEFAULT_TREECODE_TOL, nearRatio=None, mac=DEFAULT_MAC,
+                 interpolationDegree=None, leafSize=None, batchSize=DEFAULT_BATCH_POINTS):
+        """
+        Parameters:
+            xField: 3 x M array of field points
+            TriangleArray: TriangleMesh, or list of triangle dictionaries
+            numberTrianglePoints: number of unique points V of the triangulation
+            regularization: blob parameter
+            mu: viscosity parameter
+            tol: relative accuracy of the quadrature and of the interpolation
+            nearRatio: distance to face radius ratio below which the analytic
+            blocks are used; nearfieldratio(tol) by default
+            mac: multipole acceptance parameter
+            interpolationDegree: degree of the Chebyshev interpolation in every
+            direction, from tol and mac by default
+            leafSize: largest number of quadrature nodes in a leaf cluster,
+            the number of proxies of a cluster by default
+            batchSize: number of field points per target batch
+        """
+        super().__init__(xField, TriangleArray, numberTrianglePoints, regularization, mu)
+
+        if nearRatio is None:
+            nearRatio = nearfieldratio(tol)
+        if interpolationDegree is None:
+            # fitted on icospheres, error ~ 10^-1 (10^0.9 / mac)^-degree
+            interpolationDegree = max(2, int(np.ceil((-np.log10(tol) - 1)
+                                                     / (0.9 - np.log10(mac)))))
+        self.tol = tol
+        self.nearRatio = nearRatio
+        self.mac = mac
+        self.interpolationDegree = interpolationDegree
+        self.quadratureOrder = int(quadratureorder(nearRatio, tol))
+
+        numberProxies = (interpolationDegree + 1) ** 3
+        if leafSize is None:
+            leafSize = numberProxies
+        self.leafSize = leafSize
+        self.batchSize = batchSize
+
+        self.setupsources()
+        self.setuptree()
+        self.setupinteractions()
+        self.setupnearfield()
+
+    def setupsources(self):
+        """
+        Quadrature nodes of all faces as point Stokeslets, with the weights
+        mapping the vertex forces to their strengths.
+        """
+        faceData = self.mesh.facedata()
+        alpha, beta, weights = trianglequadrature(self.quadratureOrder)
+        basis = np.stack([1 - alpha, alpha - beta, beta])                       # 3 x n
+
+        # Q x n x 3 nodes, Q x n x 3 (vertex) weights
+        self.sourcePoints = np.swapaxes(faceData['vertices'] @ basis, 1, 2).reshape(-1, 3)
+        scale = faceData['bh'] / (8 * np.pi * self.mu)
+        self.sourceWeights = (scale[:, None, None] * (basis * weights).T).reshape(-1, 3)
+        self.sourceIndices = np.repeat(self.mesh.indices, weights.size, axis=0)
+
+    def setuptree(self):
+        """
+        Octree of the sources, Chebyshev proxies of the clusters and the
+        interpolation matrices of the upward pass.
+        """
+        order, tree = buildoctree(self.sourcePoints, self.leafSize)
+        self.sourcePoints = self.sourcePoints[order]
+        self.sourceWeights = self.sourceWeights[order]
+        self.sourceIndices = self.sourceIndices[order]
+        self.tree = tree
+
+        nodes, weights = chebyshevnodes(self.interpolationDegree)
+        numberNodes = nodes.size
+
+        # proxy points, C x P x 3 with the x node varying slowest
+        grid = np.stack(np.meshgrid(nodes, nodes, nodes, indexing='ij'), axis=-1).reshape(-1, 3)
+        self.proxyPoints = tree['centre'][:, None, :] + tree['halfWidth'][:, None, None] * grid
+
+        # leaves, with their sources padded to the largest leaf
+        isLeaf = (tree['children'] < 0).all(axis=1)
+        self.leaves = np.flatnonzero(isLeaf)
+        leafCounts = tree['end'][self.leaves] - tree['start'][self.leaves]
+        padding = np.arange(max(leafCounts.max(), 1))
+        self.leafMask = padding < leafCounts[:, None]
+        self.leafSources = np.where(self.leafMask, tree['start'][self.leaves][:, None] + padding, 0)
+
+        # Lagrange basis of the leaf clusters at their sources, L x n x 3 x (p+1)
+        local = (self.sourcePoints[self.leafSources] - tree['centre'][self.leaves][:, None, :]) \
+            / tree['halfWidth'][self.leaves][:, None, None]
+        self.leafBasis = lagrangebasis(local.ravel(), nodes, weights) \
+            .reshape(local.shape + (numberNodes,))
+        self.leafBasis *= self.leafMask[:, :, None, None]
+
+        # parent basis at the child nodes, for the two halves of every direction
+        self.childBasis = np.stack([lagrangebasis((nodes + sign) / 2, nodes, weights)
+                                    for sign in (-1, 1)])
+
+    def setupinteractions(self):
+        """
+        Traverses the tree for every target batch and records the sources of
+        its direct interactions and the proxies of its approximated ones.
+        """
+        tree = self.tree
+        numberProxies = self.proxyPoints.shape[1]
+
+        # field points in spatially compact batches
+        self.targetOrder = spatialorder(self.xField)
+        targets = self.xField[:, self.targetOrder].T
+        batchStart = np.arange(0, targets.shape[0], self.batchSize)
+        batchEnd = np.minimum(batchStart + self.batchSize, targets.shape[0])
+        batchCentre = np.array([targets[s:e].mean(axis=0) for s, e in zip(batchStart, batchEnd)])
+        batchRadius = np.array([np.linalg.norm(targets[s:e] - c, axis=1).max()
+                                for s, e, c in zip(batchStart, batchEnd, batchCentre)])
+        self.targets = targets
+
+        clusterRadius = np.sqrt(3) * tree['halfWidth']
+        clusterCount = tree['end'] - tree['start']
+        isLeaf = (tree['children'] < 0).all(axis=1)
+
+        direct, approximated = [], []
+        batches = np.arange(batchStart.size)
+        clusters = np.zeros(batchStart.size, dtype=int)
+        while batches.size:
+            distance = np.linalg.norm(batchCentre[batches] - tree['centre'][clusters], axis=1)
+            accept = batchRadius[batches] + clusterRadius[clusters] < self.mac * distance
+            small = clusterCount[clusters] <= numberProxies
+
+            isApproximated = accept & ~small
+            isDirect = ~isApproximated & (small | isLeaf[clusters])
+            approximated.append((batches[isApproximated], clusters[isApproximated]))
+            direct.append((batches[isDirect], clusters[isDirect]))
+
+            # split the other clusters into their children
+            refine = ~isApproximated & ~isDirect
+            childClusters = tree['children'][clusters[refine]]
+            batches = np.repeat(batches[refine], 8)[childClusters.ravel() >= 0]
+            clusters = childClusters.ravel()[childClusters.ravel() >= 0]
+
+        # source lists of the batches, indices into the sources followed by
+        # the proxies of all clusters
+        numberSources = self.sourcePoints.shape[0]
+        proxyStart = numberSources + np.arange(tree['start'].size) * numberProxies
+        entryBatch = np.concatenate([pair[0] for pair in direct + approximated])
+        entryCluster = [pair[1] for pair in direct + approximated]
+        numberDirect = sum(pair[0].size for pair in direct)
+        entryCluster = np.concatenate(entryCluster)
+        entryStart = np.where(np.arange(entryBatch.size) < numberDirect,
+                              tree['start'][entryCluster], proxyStart[entryCluster])
+        entryEnd = np.where(np.arange(entryBatch.size) < numberDirect,
+                            tree['end'][entryCluster], proxyStart[entryCluster] + numberProxies)
+
+        byBatch = np.argsort(entryBatch, kind='stable')
+        entryStart, entryEnd = entryStart[byBatch], entryEnd[byBatch]
+        entryLength = entryEnd - entryStart
+        entryOffset = np.cumsum(entryLength) - entryLength
+        entry = np.repeat(np.arange(entryLength.size), entryLength)
+        self.batchSources = entryStart[entry] + np.arange(entry.size) - entryOffset[entry]
+        self.batchPointer = np.concatenate(
+            [[0], np.cumsum(np.bincount(entryBatch, weights=entryLength[np.argsort(byBatch)],
+                                        minlength=batchStart.size)).astype(int)])
+        self.batchStart, self.batchEnd = batchStart, batchEnd
+        self.numberDirect = numberDirect
+        self.numberApproximated = entryBatch.size - numberDirect
+
+    def setupnearfield(self):
+        """
+        Sparse correction, analytic minus quadrature blocks, for the (face,
+        field point) pairs closer than nearRatio face radii.
+        """
+        faceData = self.mesh.facedata()
+        centroids, radii = facesizes(faceData)
+        neighbours = cKDTree(self.xField.T).query_ball_point(centroids, r=self.nearRatio * radii)
+        counts = np.array([len(points) for points in neighbours], dtype=int)
+        faceIndex = np.repeat(np.arange(counts.size), counts)
+        pointIndex = np.array([point for points in neighbours for point in points], dtype=int)
+
+        values, rows, cols = [], [], []
+        for start in range(0, faceIndex.size, DEFAULT_BLOCK_PAIRS):
+            pairs = slice(start, start + DEFAULT_BLOCK_PAIRS)
+            pairData = {key: value[faceIndex[pairs]] for key, value in faceData.items()}
+            xPairs = self.xField.T[pointIndex[pairs]][:, :, np.newaxis]
+
+            correction = computefaceblocks(xPairs, pairData, self.regularization) \
+                - computefaceblocksquadrature(xPairs, pairData, self.regularization,
+                                              self.quadratureOrder)
+            correction *= (pairData['bh'] / (8 * np.pi * self.mu))[:, None, None, None]
+
+            # P x 3 (vertex) x 3 x 3 blocks
+            blocks = correction[:, :, 0][..., PACKED_INDEX]
+            values.append(blocks.ravel())
+            rows.append(np.broadcast_to(3 * pointIndex[pairs][:, None, None, None]
+                                        + np.arange(3)[:, None], blocks.shape).ravel())
+            cols.append(np.broadcast_to(3 * pairData['indices'][:, :, None, None]
+                                        + np.arange(3), blocks.shape).ravel())
+
+        self.nearField = coo_matrix((np.concatenate(values) if values else np.zeros(0),
+                                     (np.concatenate(rows) if rows else np.zeros(0, dtype=int),
+                                      np.concatenate(cols) if cols else np.zeros(0, dtype=int))),
+                                    shape=self.shape).tocsr()
+
+    def proxycharges(self, strengths):
+        """
+        Upward pass: proxy charges C x P x 3 x k of all clusters from the
+        source strengths N x 3 x k (in tree order).
+        """
+        tree = self.tree
+        p1 = self.interpolationDegree + 1
+        numberRightHandSides = strengths.shape[2]
+        charges = np.zeros((tree['start'].size, p1, p1, p1, 3, numberRightHandSides))
+
+        # leaves straight from their sources
+        leafStrengths = strengths[self.leafSources] * self.leafMask[:, :, None, None]
+        basis = self.leafBasis
+        charges[self.leaves] = np.einsum('lna,lnb,lnc,lnik->labcik',
+                                         basis[:, :, 0], basis[:, :, 1], basis[:, :, 2],
+                                         leafStrengths, optimize=True)
+
+        # parents from their children, deepest level first
+        for level in range(tree['level'].max(), 0, -1):
+            atLevel = tree['level'] == level
+            for octant in range(8):
+                group = np.flatnonzero(atLevel & (tree['octant'] == octant))
+                if group.size == 0:
+                    continue
+                bx, by, bz = (self.childBasis[(octant >> d) & 1] for d in range(3))
+                charges[tree['parent'][group]] += np.einsum(
+                    'xa,yb,zc,gxyzik->gabcik', bx, by, bz, charges[group], optimize=True)
+
+        return charges.reshape(tree['start'].size * p1 ** 3, 3, numberRightHandSides)
+
+    def _matmat(self, F):
+        numberRightHandSides = F.shape[1]
+        forces = np.reshape(F, (self.numberTrianglePoints, 3, numberRightHandSides))
+
+        # strengths of the quadrature nodes followed by the proxy charges
+        strengths = np.einsum('nv,nvik->nik', self.sourceWeights, forces[self.sourceIndices])
+        strengths = np.concatenate([strengths, self.proxycharges(strengths)])
+        points = np.concatenate([self.sourcePoints, self.proxyPoints.reshape(-1, 3)])
+
+        velocity = np.empty((self.targets.shape[0], 3, numberRightHandSides))
+        for batch, (start, end) in enumerate(zip(self.batchStart, self.batchEnd)):
+            sources = self.batchSources[self.batchPointer[batch]:self.batchPointer[batch + 1]]
+            velocity[start:end] = pointstokeslets(self.targets[start:end], points[sources],
+                                                  strengths[sources], self.regularization)
+
+        # back to the original order of the field points
+        unsorted = np.empty_like(velocity)
+        unsorted[self.targetOrder] = velocity
+        return unsorted.reshape(-1, numberRightHandSides) + self.nearField @ F
@@ -14,6 +14,7 @@ sys.path.append('..')
 
 from reg_stokeslet_surfaces.triangulatesphereicos import triangulatesphereicos
 from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.evaluatevelocity import evaluatevelocity
 
 def test_drag_sphere():
     regularization = 1e-6
@@ -100,11 +101,8 @@ def test_drag_sphere():
         
         xFieldStream = np.vstack([Xflatten,Yflatten,Zflatten]) 
         
-        Astream = assemblestokesletmatrix(xFieldStream, TriangleArray, 
-                                          number_triangle_points, regularization, mu)
-        
-        uStream = Astream @ F
-        uStream = uStream.reshape((Ng ** 3, 3 )).T 
+        # velocities on the grid without forming the 3M x 3V matrix
+        uStream = evaluatevelocity(xFieldStream, TriangleArray, F, regularization, mu)
         #U,V,W 
         U = uStream[0,:].reshape(original_shape) - unit_x[0]
         V = uStream[1,:].reshape(original_shape) - unit_x[1]
@@ -0,0 +1,175 @@
+from math import comb
+
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblyprofile import profilestage
+
+
+def tmnqindex(m, n):
+    """
+    Position of T_{m,n,q} (or A_{m,n,q}, B_{m,n,q}) in the tables of
+    tmnqrecursion: the terms are stored by increasing order m + n, and by
+    increasing n within an order.
+    """
+    order = m + n
+    return order * (order + 1) // 2 + n
+
+
+def tmnqlevels(maxOrder):
+    """
+    The q of the T and of the line integral tables needed for the T_{m,n,3}
+    up to m + n = maxOrder, with the largest order of each: T_{m,n,q} up to
+    maxOrder - 3 + q, S_{p,q} (and A_{m,n,q}, B_{m,n,q}) up to maxOrder - 2 + q.
+
+    Output:
+        tLevels, sLevels: dictionaries q -> largest order, q decreasing
+    """
+    tLevels = {q: maxOrder - 3 + q for q in range(3, 2 - maxOrder, -2)}
+    sLevels = {q: maxOrder - 2 + q for q in range(1, 1 - maxOrder, -2)}
+    return tLevels, sLevels
+
+
+@profilestage('tmnqrecursion')
+def tmnqrecursion(maxOrder, t003, t001, s0p1, s0m1, geometryData):
+    """
+    TMNQRECURSION computes all the T_{m,n,3} with m + n <= maxOrder, and the
+    T_{m,n,q}, A_{m,n,q}, B_{m,n,q} and line integrals S_{p,q} of lower q
+    they need, in one sweep over preallocated (term, ...) tables.
+
+    The T_{m,n,q} of order m + n are computed together from those of order
+    m + n - 1 with formula (2.17) for T_{m,0,q} and (2.18) for the others;
+    the line integrals S_{p+1,q} of every side with (2.24) and the A and B
+    from them with (2.22) and (2.23). The base cases of q < 1 not computed
+    by computebasecases follow from S_{0,q+2} and T_{0,0,q+2}:
+
+        S_{0,q} = ([u R^-q] / ell - q c^2 S_{0,q+2}) / (1 - q)
+        T_{0,0,q} = (sum_sides ell (-x.n) S_{0,q} / bh - q gamma^2 T_{0,0,q+2}) / (2 - q)
+
+    with u = x.v along the side and c^2 = R^2 - u^2 (from the divergence of
+    rho R^-q in the plane of the face). maxOrder = 3 is the linear element
+    (tqequals1 and tqequals3).
+
+    Parameters:
+        maxOrder: largest m + n of the T_{m,n,3}
+        t003, t001: base cases T_{0,0,3}, T_{0,0,1}
+        s0p1, s0m1: the line integrals S_{0,1} and S_{0,-1} of the sides
+        (e1, e2, d)
+        geometryData: from computebasecases or computebasecasesbatch
+
+    Output:
+        integrals: dictionary with, for every q of tmnqlevels(maxOrder),
+        'T': q -> array of the T_{m,n,q}, the term axis first and indexed
+        by tmnqindex, then the shape of t003
+        'A', 'B': q -> arrays of the A_{m,n,q}, B_{m,n,q}, same layout
+        'S': q -> 3 x (order + 1) x ... array of the S_{p,q} of the sides
+    """
+    tLevels, sLevels = tmnqlevels(maxOrder)
+    shape = np.shape(t003)
+    # scratch for the products added to the tables in place
+    work = np.empty((maxOrder + 1,) + shape)
+
+    ell = (geometryData['ell1'], geometryData['ell2'], geometryData['ell3'])
+    R = (geometryData['R0'], geometryData['R1'], geometryData['R2'])
+    # u = x.v at the start of every side, v the direction of the side
+    u = (geometryData['x0DotV'], geometryData['x1DotW'], geometryData['x2DotD'])
+
+    # S_{0,q} of the sides
+    S = {q: np.empty((3, order + 1) + shape) for q, order in sLevels.items()}
+    for q in sLevels:
+        for side in range(3):
+            if q == 1:
+                S[q][side, 0] = s0p1[side]
+            elif q == -1:
+                S[q][side, 0] = s0m1[side]
+            else:
+                start, end = R[side], R[(side + 1) % 3]
+                cSquared = start**2 - u[side]**2
+                S[q][side, 0] = (((u[side] + ell[side]) * end**-q - u[side] * start**-q)
+                                 / ell[side] - q * cSquared * S[q + 2][side, 0]) / (1 - q)
+
+    # S_{p,q} from the lowest q up, formula (2.24)
+    for q in sorted(sLevels):
+        for side in range(3):
+            if sLevels[q] == 0:
+                continue
+            start, end = R[side], R[(side + 1) % 3]
+            endPower = end**(2 - q) / ((2 - q) * ell[side]**2)
+            drift = -u[side] / ell[side]
+            for p in range(sLevels[q]):
+                target = S[q][side, p + 1]
+                np.multiply(drift, S[q][side, p], out=target)
+                target += endPower
+                if p == 0:
+                    target -= start**(2 - q) / ((2 - q) * ell[side]**2)
+                else:
+                    target -= p / (2 - q) / ell[side]**2 * S[q - 2][side, p - 1]
+
+    # A_{m,n,q} = S^e2_{n,q} - D_{m+n,q}, B_{m,n,q} = -delta_{n0} S^e1_{m,q} + D_{m+n,q},
+    # with D_{k,q} = sum_j C(k, j) (-1)^j S^d_{j,q} the integral of (1 - t)^k along d
+    A = {q: np.empty(((order + 1) * (order + 2) // 2,) + shape) for q, order in sLevels.items()}
+    B = {q: np.empty_like(A[q]) for q in sLevels}
+    for q, order in sLevels.items():
+        for o in range(order + 1):
+            block = slice(tmnqindex(o, 0), tmnqindex(o + 1, 0))
+            D = B[q][tmnqindex(o, 0)]
+            D[...] = S[q][2, 0]
+            for j in range(1, o + 1):
+                D += comb(o, j) * (-1)**j * S[q][2, j]
+            B[q][block] = D
+            np.subtract(S[q][1, :o + 1], D, out=A[q][block])
+            D -= S[q][0, o]
+
+    # T_{0,0,q}
+    T = {q: np.empty(((order + 1) * (order + 2) // 2,) + shape) for q, order in tLevels.items()}
+    for q in tLevels:
+        if q == 3:
+            T[q][0] = t003
+        elif q == 1:
+            T[q][0] = t001
+        else:
+            sideNormals = (geometryData['x0DotN1'], geometryData['x1DotN2'],
+                           geometryData['x2DotN3'])
+            contour = sum(ell[side] * (-sideNormals[side]) * S[q][side, 0] for side in range(3))
+            T[q][0] = (contour / geometryData['bh']
+                       - q * geometryData['gamma']**2 * T[q + 2][0]) / (2 - q)
+
+    # T_{m,n,q} from the lowest q up, formulas (2.17) and (2.18), with the
+    # per-face coefficients and 1 / (v.w^2 - 1) folded together
+    vDotW = geometryData['vDotW']
+    ell1, ell2 = geometryData['ell1'], geometryData['ell2']
+    scale = 1 / (vDotW**2 - 1)
+    driftV = scale * (geometryData['x0DotV'] - vDotW * geometryData['x0DotW']) / ell1
+    driftW = scale * (geometryData['x0DotW'] - vDotW * geometryData['x0DotV']) / ell2
+    expand = (slice(None),) + (np.newaxis,) * len(shape)
+    for q in sorted(tLevels):
+        k = q - 2
+        coefficientV = scale / (ell1**2 * k)
+        coefficientW = scale / (ell2**2 * k)
+        coefficientVW = -scale * vDotW / (ell1 * ell2 * k)
+        for order in range(1, tLevels[q] + 1):
+            # the sources, T_{m,n,q} of order - 1, give T_{m+1,0,q} and T_{m,n+1,q}
+            sources = slice(tmnqindex(order - 1, 0), tmnqindex(order, 0))
+            n = np.arange(order)
+            m = order - 1 - n
+            a, b, t = A[k][sources], B[k][sources], T[q][sources]
+
+            tmp1 = T[q][tmnqindex(order, 0)]
+            np.multiply(driftV, t[0], out=tmp1)
+            tmp1 += coefficientV * a[0]
+            tmp1 += coefficientVW * b[0]
+
+            tnp1 = T[q][tmnqindex(order - 1, 1):tmnqindex(order + 1, 0)]
+            np.multiply(driftW, t, out=tnp1)
+            tnp1 += np.multiply(coefficientW, b, out=work[:order])
+            tnp1 += np.multiply(coefficientVW, a, out=work[:order])
+
+            if order > 1:
+                # T_{m-1,n,q-2} of the sources with m > 0 and T_{m,n-1,q-2} of
+                # those with n > 0 are both the T_{m,n,q-2} of order - 2
+                lower = T[k][tmnqindex(order - 2, 0):tmnqindex(order - 1, 0)]
+                scratch = work[:order - 1]
+                tmp1 -= m[0] * coefficientV * lower[0]
+                tnp1[:-1] -= np.multiply(m[:-1][expand] * coefficientVW, lower, out=scratch)
+                tnp1[1:] -= np.multiply(n[1:][expand] * coefficientW, lower, out=scratch)
+
+    return {'T': T, 'A': A, 'B': B, 'S': S}
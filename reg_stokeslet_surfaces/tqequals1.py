@@ -1,7 +1,9 @@
 import numpy as np
 from .tmp1recursion import tmp1recursion
 from .tnp1recursion import tnp1recursion
+from .assemblyprofile import profilestage
 
+@profilestage('tqequals1')
 def tqequals1(se1m1, se2m1, sdm1, t001, geometryData):
     """
     TQEQUALS1 outputs T101, T011 from recursion formula.
@@ -18,20 +20,18 @@ def tqequals1(se1m1, se2m1, sdm1, t001, geometryData):
         t101 (ndarray): M x 1 vector storing T_{1,0,1}.
         t011 (ndarray): M x 1 vector storing T_{0,1,1}.
     """
-    se1m1 = np.asarray(se1m1).flatten()
-    se2m1 = np.asarray(se2m1).flatten()
-    sdm1 = np.asarray(sdm1).flatten()
-    t001 = np.asarray(t001).flatten()
-    
-    M = len(t001)
+    se1m1 = np.asarray(se1m1)
+    se2m1 = np.asarray(se2m1)
+    sdm1 = np.asarray(sdm1)
+    t001 = np.asarray(t001)
 
     # Formulas (2.22) and (2.23)
     a00m1 = se2m1 - sdm1
     b00m1 = -se1m1 + sdm1
 
     # These are not used in this recursion step
-    tm10m2 = np.zeros(M)
-    t0m1m2 = np.zeros(M)
+    tm10m2 = np.zeros_like(t001)
+    t0m1m2 = np.zeros_like(t001)
 
     # Recursion indices
     m = 0
@@ -2,7 +2,9 @@ import numpy as np
 from .tmp1recursion import tmp1recursion
 from .tnp1recursion import tnp1recursion
 from .abmnq import abmnq
+from .assemblyprofile import profilestage
 
+@profilestage('tqequals3')
 def tqequals3(se10p1, se20p1, sd0p1,
               se10m1, se20m1, sd0m1,
               t001, t003, t101, t011,
@@ -19,8 +21,6 @@ def tqequals3(se10p1, se20p1, sd0p1,
     Returns:
         Tuple of arrays: t103, t013, t203, t023, t113, t303, t033, t213, t123
     """
-    M = t001.shape[0]
-
     # Formulas (2.22) and (2.23)
     a001 = se20p1 - sd0p1
     b001 = -se10p1 + sd0p1
@@ -31,8 +31,8 @@ def tqequals3(se10p1, se20p1, sd0p1,
     )
 
     # Initialize dummy values for t_{m-1,q-2} or t_{n-1,q-2}
-    tmm1qm2Dummy = np.zeros(M)
-    tnm1qm2Dummy = np.zeros(M)
+    tmm1qm2Dummy = np.zeros_like(t001)
+    tnm1qm2Dummy = np.zeros_like(t001)
 
     # Recursion step m+n=1
     m, n, q = 0, 0, 3
@@ -0,0 +1,165 @@
+import numpy as np
+
+# per-face fields, in the layout of the triangle dictionaries
+TRIANGLE_FIELDS = ('vertices', 'indices', 'directions', 'normaltoplane',
+                   'normalstosides', 'lengths', 'heights', 'bh')
+
+
+class TriangleMesh:
+    """
+    Triangulation stored as contiguous arrays with a leading face axis
+    (struct of arrays), replacing the list of triangle dictionaries.
+
+    Indexing with an integer returns the dictionary of that face exactly as
+    create_triangle_dict builds it, so a TriangleMesh can be used wherever a
+    TriangleArray is expected (len, iteration, TriangleArray[q]['bh'], ...).
+    Indexing with a slice or an index array returns a TriangleMesh of the
+    selected faces.
+
+    Attributes:
+        points: 3 x V array of vertex coordinates (None if unknown)
+        vertices: Q x 3 x 3 array, columns are the three vertices of the face
+        indices: Q x 3 int array of vertex indices (0-based)
+        directions: Q x 3 x 3 array of unit side directions (columns)
+        normaltoplane: Q x 3 array of unit normals to the faces
+        normalstosides: Q x 3 x 3 array of unit in-plane normals to the sides
+        lengths: Q x 3 array of side lengths
+        heights: Q x 3 array of heights onto the sides
+        bh: Q array of base times height (twice the area) of the faces
+    """
+
+    def __init__(self, xyzPts, faces, indexStart=0, orient=True):
+        """
+        Parameters:
+            xyzPts: 3 x V array of vertex coordinates
+            faces: 3 x Q array of face indices (1-based or 0-based depending
+            on indexStart)
+            indexStart: 0 for Python-style indexing, 1 for MATLAB-style indexing
+            orient: flip faces whose normal points towards the origin, as
+            create_triangle_dict does for a body centred at the origin
+        """
+        xyzPts = np.asarray(xyzPts, dtype=float)
+        indices = np.array(np.asarray(faces).T - int(indexStart), dtype=int).reshape(-1, 3)
+
+        pts = np.moveaxis(xyzPts[:, indices], 0, 1)  # Q x 3 x 3, columns are vertices
+
+        if orient:
+            # Flip orientation if normal points inward
+            normal = np.cross(pts[:, :, 0] - pts[:, :, 1], pts[:, :, 1] - pts[:, :, 2])
+            flip = (normal[:, np.newaxis, :] @ pts[:, :, 0:1])[:, 0, 0] < 0
+            indices[flip] = indices[flip][:, ::-1]
+            pts[flip] = pts[flip][:, :, ::-1]
+
+        self.points = xyzPts
+        self.indices = indices
+        self.vertices = pts
+        self.computegeometry()
+
+    def computegeometry(self):
+        """
+        Computes all derived per-face geometry from self.vertices at once.
+        """
+        pt1 = self.vertices[:, :, 0]
+        pt2 = self.vertices[:, :, 1]
+        pt3 = self.vertices[:, :, 2]
+
+        directions = np.stack([pt1 - pt2, pt2 - pt3, pt3 - pt1], axis=2)
+        lengths = np.linalg.norm(directions, axis=1)
+        directions = directions / lengths[:, np.newaxis, :]
+
+        def dot(a, b):
+            # row-wise dot products of Q x 3 arrays, rounded like np.dot
+            return (a[:, np.newaxis, :] @ b[:, :, np.newaxis])[:, 0, 0]
+
+        normaltoplane = np.cross(directions[:, :, 0], directions[:, :, 1])
+        normaltoplane /= np.sqrt(dot(normaltoplane, normaltoplane))[:, np.newaxis]
+
+        normalstosides = np.cross(normaltoplane[:, :, np.newaxis], directions, axis=1)
+
+        ht1 = lengths[:, 1] * dot(directions[:, :, 1], normalstosides[:, :, 0])
+        bh = lengths[:, 0] * ht1
+        heights = np.column_stack([ht1, bh / lengths[:, 1], bh / lengths[:, 2]])
+
+        self.directions = directions
+        self.normaltoplane = normaltoplane
+        self.normalstosides = normalstosides
+        self.lengths = lengths
+        self.heights = heights
+        self.bh = bh
+
+    @classmethod
+    def fromarrays(cls, points=None, **fields):
+        """
+        Builds a TriangleMesh from already computed per-face arrays (all of
+        TRIANGLE_FIELDS), without recomputing any geometry.
+        """
+        mesh = cls.__new__(cls)
+        mesh.points = points
+        for key in TRIANGLE_FIELDS:
+            setattr(mesh, key, fields[key])
+        return mesh
+
+    @classmethod
+    def fromdicts(cls, TriangleArray):
+        """
+        Stacks a list of triangle dictionaries into a TriangleMesh.
+        """
+        if isinstance(TriangleArray, cls):
+            return TriangleArray
+
+        fields = {key: np.array([Triangle[key] for Triangle in TriangleArray], dtype=float)
+                  for key in TRIANGLE_FIELDS if key != 'indices'}
+        fields['indices'] = np.array([Triangle['indices'] for Triangle in TriangleArray],
+                                     dtype=int).reshape(-1, 3)
+
+        mesh = cls.fromarrays(None, **fields)
+        # recover the vertex coordinates from the faces
+        mesh.points = mesh.vertexpoints(fields['indices'].max() + 1 if len(TriangleArray) else 0)
+        return mesh
+
+    def vertexpoints(self, numberPoints=None):
+        """
+        3 x numberPoints array of the vertex coordinates rebuilt from the
+        faces (zero for the points no face uses), for when self.points may be
+        unknown. numberPoints defaults to the largest vertex index plus one.
+        """
+        if numberPoints is None:
+            numberPoints = self.indices.max() + 1 if self.indices.size else 0
+        points = np.zeros((3, numberPoints))
+        points[:, self.indices.ravel()] = np.moveaxis(self.vertices, 1, 0).reshape(3, -1)
+        return points
+
+    @property
+    def faces(self):
+        """3 x Q array of (oriented, 0-based) face indices."""
+        return self.indices.T
+
+    @property
+    def numberPoints(self):
+        """Number of vertices V of the triangulation."""
+        return self.points.shape[1]
+
+    def facedata(self):
+        """
+        Dictionary of the per-face arrays, the input of the batched routines.
+        """
+        return {key: getattr(self, key) for key in TRIANGLE_FIELDS}
+
+    def __len__(self):
+        return self.bh.shape[0]
+
+    def __getitem__(self, q):
+        if isinstance(q, (int, np.integer)):
+            return {key: getattr(self, key)[q] for key in TRIANGLE_FIELDS}
+        return self.fromarrays(self.points, **{key: getattr(self, key)[q]
+                                               for key in TRIANGLE_FIELDS})
+
+    def __iter__(self):
+        for q in range(len(self)):
+            yield self[q]
+
+    def todicts(self):
+        """
+        List of triangle dictionaries, the old TriangleArray layout.
+        """
+        return [Triangle for Triangle in self]
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.triangulatesphereicos import triangulatesphereicos
+
+
+@pytest.fixture(scope='session')
+def sphere():
+    """
+    Unit icosphere of factor 3 (92 vertices) with its dense batched
+    Stokeslet matrix on the vertices.
+    """
+    regularization, mu = 1e-2, 1.5
+    TriangleArray, points, faces = triangulatesphereicos(3, 1)
+    A = assemblestokesletmatrix(points, TriangleArray, points.shape[1], regularization, mu)
+    return SimpleNamespace(TriangleArray=TriangleArray, points=points, faces=faces,
+                           numberTrianglePoints=points.shape[1], regularization=regularization,
+                           mu=mu, A=A)
+
+
+@pytest.fixture(scope='session')
+def relativeerror():
+    """Largest entry of the difference relative to the largest exact entry."""
+    def relativeerror(approximation, exact):
+        return np.abs(approximation - exact).max() / np.abs(exact).max()
+    return relativeerror
@@ -0,0 +1,22 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrices import assemblestokesletmatrices
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+
+REGULARIZATIONS = [5e-3, 1e-2, 5e-2]
+
+
+def test_sweep_matches_separate_assemblies(sphere, relativeerror):
+    arguments = (sphere.points, sphere.TriangleArray, sphere.numberTrianglePoints)
+    separate = [assemblestokesletmatrix(*arguments, regularization, sphere.mu)
+                for regularization in REGULARIZATIONS]
+    stacked = assemblestokesletmatrices(*arguments, REGULARIZATIONS, sphere.mu)
+    assert stacked.shape == (len(REGULARIZATIONS),) + sphere.A.shape
+    assert relativeerror(stacked[1], sphere.A) < 1e-14
+    for A, exact in zip(stacked, separate):
+        assert relativeerror(A, exact) < 1e-14
+    generated = list(assemblestokesletmatrices(*arguments, REGULARIZATIONS, sphere.mu,
+                                               stacked=False, sweepSize=2))
+    assert len(generated) == len(REGULARIZATIONS)
+    for A, exact in zip(generated, separate):
+        assert relativeerror(A, exact) < 1e-14
@@ -0,0 +1,138 @@
+import sys
+
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.computecurvedfaceblocks import computecurvedfaceblocks
+from reg_stokeslet_surfaces.computefaceblocks import computefaceblocks
+from reg_stokeslet_surfaces.computefaceblocksnumba import computefaceblocksnumba, numba
+from reg_stokeslet_surfaces.quadraticelements import quadraticelements
+
+
+def test_batched_matches_reference(sphere, relativeerror):
+    reference = assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                        sphere.numberTrianglePoints, sphere.regularization,
+                                        sphere.mu, method='reference')
+    assert relativeerror(sphere.A, reference) < 1e-12
+
+
+def test_block_sizes_agree(sphere, relativeerror):
+    small = assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                    sphere.numberTrianglePoints, sphere.regularization,
+                                    sphere.mu, blockSize=7)
+    assert relativeerror(small, sphere.A) < 1e-14
+
+
+def test_nearfar_matches_batched(sphere, relativeerror):
+    tol = 1e-8
+    nearFar = assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                      sphere.numberTrianglePoints, sphere.regularization,
+                                      sphere.mu, method='nearfar', tol=tol)
+    assert relativeerror(nearFar, sphere.A) < 10 * tol
+
+
+def test_nearfar_tolerance(sphere, relativeerror):
+    # field points a few radii away, mostly far field
+    xField = 3 * sphere.points[:, :40]
+    exact = assemblestokesletmatrix(xField, sphere.TriangleArray, sphere.numberTrianglePoints,
+                                    sphere.regularization, sphere.mu)
+    for tol in (1e-4, 1e-8):
+        nearFar = assemblestokesletmatrix(xField, sphere.TriangleArray,
+                                          sphere.numberTrianglePoints, sphere.regularization,
+                                          sphere.mu, method='nearfar', tol=tol)
+        assert relativeerror(nearFar, exact) < 10 * tol
+
+
+def test_parallel_matches_serial(sphere, relativeerror):
+    def parallel(workers):
+        return assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                       sphere.numberTrianglePoints, sphere.regularization,
+                                       sphere.mu, workers=workers, tileSize=16)
+
+    one = parallel(1)
+    # the same tiles summed in the same order, whatever the number of workers
+    assert np.array_equal(parallel(3), one)
+    assert relativeerror(one, sphere.A) < 1e-14
+
+
+def test_parallel_returns_shared_matrix(sphere, tmp_path, monkeypatch):
+    # the module, the package re-exports the function under the same name
+    module = sys.modules[assemblestokesletmatrix.__module__]
+    monkeypatch.setattr(module, 'SHARED_MEMORY_DIRECTORY', str(tmp_path))
+    A = assemblestokesletmatrix(sphere.points, sphere.TriangleArray, sphere.numberTrianglePoints,
+                                sphere.regularization, sphere.mu, workers=2, tileSize=16)
+    # the mapping the workers wrote is returned without a copy, and its file is gone
+    assert isinstance(A, np.memmap)
+    assert list(tmp_path.iterdir()) == []
+    assert np.array_equal(A, sphere.A)
+
+
+def test_parallel_nearfar(sphere, relativeerror):
+    serial = assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                     sphere.numberTrianglePoints, sphere.regularization,
+                                     sphere.mu, method='nearfar')
+    parallel = assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                       sphere.numberTrianglePoints, sphere.regularization,
+                                       sphere.mu, method='nearfar', workers=2, tileSize=16)
+    assert relativeerror(parallel, serial) < 1e-12
+
+
+@pytest.mark.skipif(numba is None, reason="numba is not installed")
+@pytest.mark.parametrize('method', ['batched', 'nearfar'])
+def test_numba_matches_numpy(sphere, relativeerror, method):
+    def assemble(backend):
+        return assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                       sphere.numberTrianglePoints, sphere.regularization,
+                                       sphere.mu, method=method, backend=backend)
+
+    assert relativeerror(assemble('numba'), assemble('numpy')) < 1e-12
+
+
+def test_quadratic_blocks_partition_of_unity(sphere, relativeerror):
+    faceData = sphere.TriangleArray[:20].facedata()
+    linear = computefaceblocks(sphere.points, faceData, sphere.regularization)
+    quadratic = computefaceblocks(sphere.points, faceData, sphere.regularization, degree=2)
+    # the basis functions of both degrees sum to one over a face
+    assert relativeerror(quadratic.sum(axis=1), linear.sum(axis=1)) < 1e-12
+
+
+def test_curved_blocks_match_flat_quadratic(sphere, relativeerror):
+    # flat midpoints, so the curved elements are the flat faces
+    nodes, elements = quadraticelements(sphere.TriangleArray)
+    faces = slice(0, 20)
+    faceData = sphere.TriangleArray[faces].facedata()
+    flat = computefaceblocks(nodes, faceData, sphere.regularization, degree=2)
+    curvedData = {'nodes': np.moveaxis(nodes[:, elements[faces]], 0, 1), 'bh': faceData['bh']}
+    curved = computecurvedfaceblocks(nodes, curvedData, sphere.regularization)
+    assert relativeerror(curved, flat) < 1e-6
+
+
+def test_float32_matrix(sphere, relativeerror):
+    single = assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                     sphere.numberTrianglePoints, sphere.regularization,
+                                     sphere.mu, dtype=np.float32)
+    assert single.dtype == np.float32
+    assert relativeerror(single, sphere.A) < 1e-6
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'numba'])
+def test_points_on_side_extension(sphere, relativeerror, backend):
+    if backend == 'numba' and numba is None:
+        pytest.skip("numba is not installed")
+    faceblocks = computefaceblocksnumba if backend == 'numba' else computefaceblocks
+    faceData = sphere.TriangleArray[:1].facedata()
+    start, end = faceData['vertices'][0, :, 0], faceData['vertices'][0, :, 1]
+    sideNormal = faceData['normalstosides'][0, :, 0]
+    # above the line of the first side, beyond its end, where x0.n ~ 1e-8 makes
+    # 1 - gamma/(ell q) round to -eps
+    rng = np.random.default_rng(1)
+    s, h = rng.uniform(1.2, 3, 500), rng.uniform(0.05, 1, 500)
+    xField = start[:, np.newaxis] + s * (end - start)[:, np.newaxis] \
+        + h * faceData['normaltoplane'][0][:, np.newaxis]
+    onLine = faceblocks(xField + rng.uniform(-1e-8, 1e-8, 500) * sideNormal[:, np.newaxis],
+                        faceData, sphere.regularization)
+    assert np.isfinite(onLine).all()
+    offLine = faceblocks(xField + 1e-6 * sideNormal[:, np.newaxis], faceData,
+                         sphere.regularization)
+    assert relativeerror(onLine, offLine) < 1e-4
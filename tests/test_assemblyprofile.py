@@ -0,0 +1,25 @@
+import json
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.assemblyprofile import ACTIVE_PROFILES, AssemblyProfile
+
+
+def test_profile_records_stages_and_branches(sphere):
+    calls = []
+    with AssemblyProfile(callback=lambda stage, *_: calls.append(stage)) as profile:
+        A = assemblestokesletmatrix(sphere.points, sphere.TriangleArray,
+                                    sphere.numberTrianglePoints, sphere.regularization, sphere.mu)
+    assert not ACTIVE_PROFILES
+    # profiling does not change the matrix
+    assert (A == sphere.A).all()
+
+    assert {'computebasecasesbatch', 'computet003side', 'tmnqrecursion'} <= set(profile.stages)
+    assert sum(entry['calls'] for entry in profile.stages.values()) == len(calls)
+    assert all(entry['seconds'] <= profile.seconds for entry in profile.stages.values())
+    # only the new arrays a stage returns count, not those updated in place
+    assert profile.stages['computebasecasesbatch']['outputBytes'] > 0
+    assert profile.stages['addpackedblockcolumns']['outputBytes'] == 0
+    # the vertices lie in the planes of their own faces
+    assert profile.branches['x0DotN=0'] > 0
+    assert json.loads(profile.tojson())['branches'] == profile.branches
+    assert 'total' in profile.report()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.computefaceblocksnumba import numba
+from reg_stokeslet_surfaces.evaluatevelocity import evaluatevelocity
+
+
+@pytest.fixture(scope='module')
+def flow(sphere):
+    """Field points around the sphere, their exact velocities and the forces."""
+    rng = np.random.default_rng(0)
+    xField = rng.uniform(-2, 2, (3, 200))
+    F = np.linalg.solve(sphere.A, np.tile([1.0, 0.0, 0.0], sphere.numberTrianglePoints))
+    A = assemblestokesletmatrix(xField, sphere.TriangleArray, sphere.numberTrianglePoints,
+                                sphere.regularization, sphere.mu)
+    return xField, F, (A @ F).reshape(-1, 3).T
+
+
+def test_untiled_matches_dense(sphere, relativeerror, flow):
+    xField, F, U = flow
+    untiled = evaluatevelocity(xField, sphere.TriangleArray, F, sphere.regularization, sphere.mu,
+                               maxMemory=2**32)
+    assert untiled.shape == U.shape
+    assert relativeerror(untiled, U) < 1e-13
+
+
+def test_tiles_and_chunks_match_untiled(sphere, relativeerror, flow):
+    xField, F, U = flow
+    # a budget of a few pairs forces many small tiles
+    tiled = evaluatevelocity(xField, sphere.TriangleArray, F, sphere.regularization, sphere.mu,
+                             maxMemory=2**16)
+    assert relativeerror(tiled, U) < 1e-13
+    chunks = (xField[:, start:start + 37] for start in range(0, xField.shape[1], 37))
+    chunked = evaluatevelocity(chunks, sphere.TriangleArray, F, sphere.regularization,
+                               sphere.mu, maxMemory=2**16)
+    assert relativeerror(chunked, U) < 1e-13
+
+
+def test_nearfar_velocity(sphere, relativeerror, flow):
+    xField, F, U = flow
+    tol = 1e-8
+    nearFar = evaluatevelocity(xField, sphere.TriangleArray, F, sphere.regularization,
+                               sphere.mu, method='nearfar', tol=tol)
+    assert relativeerror(nearFar, U) < 10 * tol
+
+
+@pytest.mark.skipif(numba is None, reason="numba is not installed")
+def test_fused_numba_velocity(sphere, relativeerror, flow):
+    xField, F, U = flow
+    fused = evaluatevelocity(xField, sphere.TriangleArray, F, sphere.regularization, sphere.mu,
+                             maxMemory=2**16, backend='numba')
+    assert relativeerror(fused, U) < 1e-10
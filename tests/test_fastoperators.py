@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.stokeslethmatrix import StokesletHMatrix
+from reg_stokeslet_surfaces.stokeslettreecode import StokesletTreecode
+from reg_stokeslet_surfaces.triangulatesphereicos import triangulatesphereicos
+
+
+def relativeproducterror(operator, A):
+    F = np.random.default_rng(0).standard_normal(A.shape[1])
+    exact = A @ F
+    return np.linalg.norm(operator @ F - exact) / np.linalg.norm(exact)
+
+
+@pytest.mark.parametrize('tol', [1e-3, 1e-6])
+def test_treecode_matches_dense(sphere, tol):
+    treecode = StokesletTreecode(sphere.points, sphere.TriangleArray,
+                                 sphere.numberTrianglePoints, sphere.regularization, sphere.mu,
+                                 tol=tol, leafSize=16)
+    error = relativeproducterror(treecode, sphere.A)
+    # within the tolerance, but an approximation: the far field is used
+    assert 1e-14 < error < 10 * tol
+
+
+@pytest.fixture(scope='module')
+def finesphere():
+    """Icosphere of factor 6, large enough for low-rank blocks."""
+    TriangleArray, points, _ = triangulatesphereicos(6, 1)
+    V = points.shape[1]
+    return TriangleArray, points, assemblestokesletmatrix(points, TriangleArray, V, 1e-2, 1.5)
+
+
+@pytest.mark.parametrize('tol', [1e-3, 1e-6])
+def test_hmatrix_matches_dense(finesphere, tol):
+    TriangleArray, points, A = finesphere
+    hMatrix = StokesletHMatrix(points, TriangleArray, points.shape[1], 1e-2, 1.5, tol=tol)
+    if tol == 1e-3:
+        assert hMatrix.lowRankBlocks
+    assert 1e-14 < relativeproducterror(hMatrix, A) < 10 * tol
+    assert relativeproducterror(hMatrix.T, A.T) < 10 * tol
+    assert hMatrix.compressionreport()['relativeError'] < 10 * tol
+
+
+def test_hmatrix_dense_part_is_exact(sphere):
+    hMatrix = StokesletHMatrix(sphere.points, sphere.TriangleArray,
+                               sphere.numberTrianglePoints, sphere.regularization, sphere.mu,
+                               leafSize=16)
+    densePart = hMatrix.densepart().tocoo()
+    assert densePart.nnz > 0
+    assert np.allclose(densePart.data, sphere.A[densePart.row, densePart.col], rtol=1e-12)
+
+
+def test_hmatrix_without_dense_blocks(sphere):
+    # field points far from the sphere: the root block is already low rank
+    xField = sphere.points[:, :40] + np.array([[50.0], [0.0], [0.0]])
+    tol = 1e-6
+    hMatrix = StokesletHMatrix(xField, sphere.TriangleArray, sphere.numberTrianglePoints,
+                               sphere.regularization, sphere.mu, tol=tol)
+    assert hMatrix.denseBlocks == []
+    densePart = hMatrix.densepart()
+    assert densePart.shape == hMatrix.shape and densePart.nnz == 0
+    A = assemblestokesletmatrix(xField, sphere.TriangleArray, sphere.numberTrianglePoints,
+                                sphere.regularization, sphere.mu)
+    assert relativeproducterror(hMatrix, A) < 10 * tol
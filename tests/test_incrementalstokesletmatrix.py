@@ -0,0 +1,37 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.incrementalstokesletmatrix import (IncrementalStokesletMatrix,
+                                                               rotationmatrix)
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+
+def freshmatrix(incremental, sphere):
+    points = incremental.points
+    mesh = TriangleMesh(points, incremental.indices.T, orient=False)
+    return assemblestokesletmatrix(points, mesh, sphere.numberTrianglePoints,
+                                   sphere.regularization, sphere.mu)
+
+
+def test_move_matches_fresh_assembly(sphere, relativeerror):
+    incremental = IncrementalStokesletMatrix(sphere.TriangleArray, sphere.numberTrianglePoints,
+                                             sphere.regularization, sphere.mu)
+    incremental.move(rotationmatrix(np.array([0.3, -0.2, 0.5])), np.array([1.0, 2.0, -0.5]))
+    assert incremental.lastUpdate == {'rows': 0, 'columns': 0}
+    A = freshmatrix(incremental, sphere)
+    assert relativeerror(incremental.matrix, A) < 1e-12
+    U = np.random.default_rng(0).standard_normal(A.shape[0])
+    assert relativeerror(incremental.solve(U), np.linalg.solve(A, U)) < 1e-10
+
+
+def test_deform_matches_fresh_assembly(sphere, relativeerror):
+    incremental = IncrementalStokesletMatrix(sphere.TriangleArray, sphere.numberTrianglePoints,
+                                             sphere.regularization, sphere.mu)
+    incremental.move(translation=np.array([0.5, 0, 0]))
+    points = incremental.points
+    changed = np.array([0, 7, 30])
+    points[:, changed] *= 1.1
+    incremental.deform(points)
+    assert incremental.lastUpdate['rows'] == changed.size
+    assert incremental.lastUpdate['columns'] < sphere.numberTrianglePoints
+    assert relativeerror(incremental.matrix, freshmatrix(incremental, sphere)) < 1e-12
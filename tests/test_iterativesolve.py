@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.iterativesolve import iterativesolve
+from reg_stokeslet_surfaces.stokesletoperator import StokesletOperator
+
+
+@pytest.mark.parametrize('method', ['gmres', 'bicgstab'])
+@pytest.mark.parametrize('preconditioner', ['nearfield', 'blockjacobi', None])
+def test_converges_to_dense_solve(sphere, relativeerror, method, preconditioner):
+    U = np.tile([1.0, 0.0, 0.0], sphere.numberTrianglePoints)
+    F, info = iterativesolve(sphere.A, U, sphere.TriangleArray, method=method,
+                             preconditioner=preconditioner, rtol=1e-10)
+    assert info['converged'] and info['method'] == method
+    assert 0 < info['iterations'] < 100
+    assert np.linalg.norm(U - sphere.A @ F) < 1e-9 * np.linalg.norm(U)
+    assert relativeerror(F, np.linalg.solve(sphere.A, U)) < 1e-7
+    if method == 'gmres':
+        # the preconditioned residual norms, one per iteration
+        assert len(info['residuals']) == info['iterations']
+        assert info['residuals'][-1] < 1e-3 * info['residuals'][0]
+    else:
+        # no residual history by default, the iterations are still counted
+        assert len(info['residuals']) == 0
+
+
+def test_preconditioner_reduces_iterations(sphere):
+    U = np.tile([0.0, 0.0, 1.0], sphere.numberTrianglePoints)
+    _, plain = iterativesolve(sphere.A, U, sphere.TriangleArray, preconditioner=None)
+    _, nearField = iterativesolve(sphere.A, U, sphere.TriangleArray)
+    assert nearField['iterations'] <= plain['iterations']
+
+
+def test_matrix_free_operator(sphere, relativeerror):
+    operator = StokesletOperator(sphere.points, sphere.TriangleArray,
+                                 sphere.numberTrianglePoints, sphere.regularization, sphere.mu)
+    U = np.tile([1.0, 0.0, 0.0], sphere.numberTrianglePoints)
+    F, info = iterativesolve(operator, U)
+    assert info['converged']
+    assert relativeerror(F, np.linalg.solve(sphere.A, U)) < 1e-7
+
+
+def test_bicgstab_residual_history(sphere):
+    U = np.tile([1.0, 0.0, 0.0], sphere.numberTrianglePoints)
+    _, info = iterativesolve(sphere.A, U, sphere.TriangleArray, method='bicgstab')
+    assert len(info['residuals']) == 0
+    _, history = iterativesolve(sphere.A, U, sphere.TriangleArray, method='bicgstab',
+                                residualHistory=True)
+    assert history['iterations'] == info['iterations']
+    assert len(history['residuals']) == history['iterations']
+    assert history['residuals'][-1] < 1e-9
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.meshlibrary import RADIUS_POWERS, MeshLibrary
+from reg_stokeslet_surfaces.triangulatesphereicos import triangulatesphereicos
+
+
+@pytest.mark.parametrize('symmetric', [False, True])
+def test_round_trip_matches_triangulatesphereicos(tmp_path, symmetric):
+    library = MeshLibrary(str(tmp_path))
+    assert library.load(3, symmetric) is None
+    radius = 2.5
+    TriangleArray, points, faces = triangulatesphereicos(3, radius, 1, symmetric=symmetric)
+    stored = library.triangulatesphereicos(3, radius, 1, symmetric=symmetric)
+    assert len(library.entries()) == 1
+    # the unit mesh is memory mapped, the rescaled one is read from it
+    assert isinstance(library.load(3, symmetric).bh, np.memmap)
+    library = MeshLibrary(str(tmp_path))
+    mesh, loadedPoints, loadedFaces = library.triangulatesphereicos(3, radius, 1,
+                                                                    symmetric=symmetric)
+    for loaded in (stored[0], mesh):
+        for key in RADIUS_POWERS:
+            assert np.allclose(getattr(loaded, key), getattr(TriangleArray, key),
+                               rtol=0, atol=1e-14 * radius**2), key
+    assert np.array_equal(loadedPoints, points)
+    assert np.array_equal(loadedFaces, faces)
+    library.clear()
+    assert library.entries() == []
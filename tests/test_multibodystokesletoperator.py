@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.incrementalstokesletmatrix import rotationmatrix
+from reg_stokeslet_surfaces.multibodystokesletoperator import MultiBodyStokesletOperator
+from reg_stokeslet_surfaces.trianglemesh import TriangleMesh
+
+
+def test_two_bodies_match_dense_assembly(sphere, relativeerror):
+    rotations = np.stack([np.eye(3), rotationmatrix(np.array([0.4, 0.1, -0.7]))])
+    translations = np.array([[0.0, 0.0, 0.0], [2.5, 0.5, -0.3]])
+    operator = MultiBodyStokesletOperator(sphere.TriangleArray, sphere.numberTrianglePoints,
+                                          sphere.regularization, sphere.mu,
+                                          rotations=rotations, translations=translations)
+
+    # both bodies as one surface, vertex v of body b numbered b V + v
+    V = sphere.numberTrianglePoints
+    points = np.hstack([rotation @ sphere.points + translation[:, np.newaxis]
+                        for rotation, translation in zip(rotations, translations)])
+    indices = np.vstack([sphere.TriangleArray.indices, sphere.TriangleArray.indices + V])
+    mesh = TriangleMesh(points, indices.T, orient=False)
+    A = assemblestokesletmatrix(points, mesh, 2 * V, sphere.regularization, sphere.mu)
+
+    F = np.random.default_rng(0).standard_normal((6 * V, 2))
+    assert relativeerror(operator @ F, A @ F) < 1e-12
+    assert relativeerror(operator @ F[:, 0], A @ F[:, 0]) < 1e-12
+
+
+def test_default_is_one_body_at_origin(sphere, relativeerror):
+    operator = MultiBodyStokesletOperator(sphere.TriangleArray, sphere.numberTrianglePoints,
+                                          sphere.regularization, sphere.mu)
+    assert operator.numberBodies == 1
+    F = np.random.default_rng(1).standard_normal(sphere.A.shape[1])
+    assert relativeerror(operator @ F, sphere.A @ F) < 1e-12
+
+
+@pytest.mark.parametrize('translations, rotations', [
+    (np.zeros(3), None),
+    (np.zeros((2, 2)), None),
+    (np.zeros((2, 3)), np.eye(3)),
+])
+def test_rejects_malformed_placements(sphere, translations, rotations):
+    with pytest.raises(ValueError):
+        MultiBodyStokesletOperator(sphere.TriangleArray, sphere.numberTrianglePoints,
+                                   sphere.regularization, sphere.mu, rotations=rotations,
+                                   translations=translations)
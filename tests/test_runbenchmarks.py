@@ -0,0 +1,43 @@
+import os
+
+import reg_stokeslet_surfaces
+from reg_stokeslet_surfaces.runbenchmarks import DEFAULT_HISTORY, flagregressions, runbenchmarks
+
+
+def run(commit, seconds, machine=None):
+    return {'commit': commit, 'machine': machine,
+            'results': {'assemble/factor=8': {'seconds': seconds}}}
+
+
+def test_flagregressions_against_best_other_commit():
+    history = [run('a', 1.0), run('b', 0.5), run('c', 0.1)]
+    regressions = flagregressions(run('c', 0.7)['results'], history, 'c')
+    assert len(regressions) == 1
+    assert regressions[0]['bestCommit'] == 'b'
+    assert abs(regressions[0]['slowdown'] - 0.4) < 1e-12
+    assert flagregressions(run('c', 0.55)['results'], history, 'c') == []
+
+
+def test_flagregressions_compares_the_same_machine():
+    laptop, server = {'node': 'laptop'}, {'node': 'server'}
+    history = [run('a', 1.0, laptop), run('b', 0.2, server)]
+    results = run('c', 1.1, laptop)['results']
+    assert len(flagregressions(results, history, 'c')) == 1
+    assert flagregressions(results, history, 'c', machine=laptop) == []
+    assert len(flagregressions(run('c', 1.5)['results'], history, 'c', machine=laptop)) == 1
+
+
+def test_default_history_is_next_to_the_package():
+    packageDirectory = os.path.dirname(os.path.abspath(reg_stokeslet_surfaces.__file__))
+    assert os.path.dirname(DEFAULT_HISTORY) == os.path.dirname(packageDirectory)
+
+
+def test_runbenchmarks_appends_history(tmp_path):
+    history = str(tmp_path / 'history.jsonl')
+    for _ in range(2):
+        result, _ = runbenchmarks(factors=(2,), fieldPoints=(10**3,), velocityFactor=2,
+                                  history=history, verbose=False)
+    assert 'assemble/factor=2' in result['results']
+    assert 'velocity/points=1000' in result['results']
+    with open(history) as historyFile:
+        assert len(historyFile.readlines()) == 2
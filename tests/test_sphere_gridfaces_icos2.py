@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.sphere_delaunay_python import sphere_delaunay_python
+from reg_stokeslet_surfaces.sphere_grid_icos_size import sphere_grid_icos_size
+from reg_stokeslet_surfaces.sphere_gridfaces_icos2 import sphere_gridfaces_icos2
+from reg_stokeslet_surfaces.sphere_gridpoints_icos2 import sphere_gridpoints_icos2
+
+
+@pytest.mark.parametrize('factor', range(1, 18))
+def test_faces_match_convex_hull(factor):
+    node_num, _, face_num = sphere_grid_icos_size(factor)
+    xyz = sphere_gridpoints_icos2(factor, node_num)
+    number, face = sphere_gridfaces_icos2(factor)
+    assert number == face_num == face.shape[1]
+
+    hull = sphere_delaunay_python(xyz)[1]
+    assert set(map(tuple, np.sort(face, axis=0).T)) == set(map(tuple, np.sort(hull, axis=0).T))
+
+    a, b, c = xyz[:, face]
+    normals = np.cross(b - a, c - a, axis=0)
+    assert (np.einsum('ij,ij->j', normals, a + b + c) > 0).all()
+    assert (face[0] < face[1:]).all()
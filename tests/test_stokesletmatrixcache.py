@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+from reg_stokeslet_surfaces.nearfarsplit import nearfieldratio
+from reg_stokeslet_surfaces.quadraticelements import quadraticelements
+from reg_stokeslet_surfaces.stokesletmatrixcache import StokesletMatrixCache
+
+
+def assemble(cache, sphere, mu=None, **options):
+    return cache.assemble(sphere.points, sphere.TriangleArray, sphere.numberTrianglePoints,
+                          sphere.regularization, sphere.mu if mu is None else mu, **options)
+
+
+def test_hit_scales_with_mu(sphere, relativeerror, tmp_path):
+    cache = StokesletMatrixCache(str(tmp_path))
+    assert relativeerror(assemble(cache, sphere), sphere.A) < 1e-14
+    hit = assemble(cache, sphere, mu=2 * sphere.mu)
+    assert len(cache.entries()) == 1
+    assert relativeerror(hit, sphere.A / 2) < 1e-14
+    # a hit at mu = 1 is the memory map of the entry
+    assert isinstance(assemble(cache, sphere, mu=1), np.memmap)
+
+
+def test_key_depends_on_parameters(sphere, tmp_path):
+    cache = StokesletMatrixCache(str(tmp_path))
+    arguments = (sphere.points, sphere.TriangleArray, sphere.numberTrianglePoints)
+    keys = {cache.key(*arguments, sphere.regularization),
+            cache.key(*arguments, 2 * sphere.regularization),
+            cache.key(*arguments, sphere.regularization, method='nearfar'),
+            cache.key(*arguments, sphere.regularization, method='nearfar', tol=1e-4),
+            cache.key(1.5 * sphere.points, *arguments[1:], sphere.regularization)}
+    assert len(keys) == 5
+    # execution options are not part of the key
+    assemble(cache, sphere, blockSize=5)
+    assemble(cache, sphere)
+    assert len(cache.entries()) == 1
+
+
+def test_eviction_keeps_newest(sphere, tmp_path):
+    entryBytes = sphere.A.nbytes + 128
+    cache = StokesletMatrixCache(str(tmp_path), maxBytes=int(1.5 * entryBytes))
+    assemble(cache, sphere)
+    first = cache.entries()[0][2]
+    os.utime(first, (0, 0))
+    assemble(cache, sphere, method='nearfar')
+    assert len(cache.entries()) == 1
+    assert not os.path.exists(first)
+
+
+def test_key_depends_on_dtype(sphere, tmp_path):
+    cache = StokesletMatrixCache(str(tmp_path))
+    assert assemble(cache, sphere, mu=1, dtype=np.float32).dtype == np.float32
+    assert assemble(cache, sphere, mu=1).dtype == np.float64
+    assert len(cache.entries()) == 2
+
+
+def test_key_depends_on_elements(sphere, tmp_path):
+    cache = StokesletMatrixCache(str(tmp_path))
+    nodes, elements = quadraticelements(sphere.TriangleArray,
+                                        lambda x: x / np.linalg.norm(x, axis=0))
+    arguments = (nodes, sphere.TriangleArray, nodes.shape[1], sphere.regularization)
+    keys = {cache.key(*arguments),
+            cache.key(*arguments, elements=elements),
+            cache.key(*arguments, elements=elements, nodes=nodes)}
+    assert len(keys) == 3
+
+
+def test_default_near_ratio_shares_the_entry(sphere, tmp_path):
+    cache = StokesletMatrixCache(str(tmp_path))
+    arguments = (sphere.points, sphere.TriangleArray, sphere.numberTrianglePoints,
+                 sphere.regularization)
+    tol = 1e-6
+    assert cache.key(*arguments, method='nearfar', tol=tol) == \
+        cache.key(*arguments, method='nearfar', nearRatio=nearfieldratio(tol), tol=tol)
+    assemble(cache, sphere, method='nearfar', tol=tol)
+    assemble(cache, sphere, method='nearfar', nearRatio=nearfieldratio(tol), tol=tol)
+    assert len(cache.entries()) == 1
@@ -0,0 +1,27 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.stokesletoperator import StokesletOperator
+
+
+def test_products_match_dense(sphere, relativeerror):
+    # small tiles, so the products are summed over several of them
+    operator = StokesletOperator(sphere.points, sphere.TriangleArray,
+                                 sphere.numberTrianglePoints, sphere.regularization, sphere.mu,
+                                 blockSize=13, tileSize=20)
+    rng = np.random.default_rng(0)
+    F = rng.standard_normal((sphere.A.shape[1], 2))
+    assert relativeerror(operator @ F[:, 0], sphere.A @ F[:, 0]) < 1e-13
+    assert relativeerror(operator @ F, sphere.A @ F) < 1e-13
+    assert relativeerror(operator.rmatvec(F[:, 1]), sphere.A.T @ F[:, 1]) < 1e-13
+
+
+def test_other_field_points(sphere, relativeerror):
+    xField = 1.5 * sphere.points[:, :30]
+    A = assemblestokesletmatrix(xField, sphere.TriangleArray, sphere.numberTrianglePoints,
+                                sphere.regularization, sphere.mu)
+    operator = StokesletOperator(xField, sphere.TriangleArray, sphere.numberTrianglePoints,
+                                 sphere.regularization, sphere.mu)
+    F = np.random.default_rng(1).standard_normal(A.shape[1])
+    assert operator.shape == A.shape
+    assert relativeerror(operator @ F, A @ F) < 1e-13
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.incrementalstokesletmatrix import IncrementalStokesletMatrix
+from reg_stokeslet_surfaces.multibodystokesletoperator import MultiBodyStokesletOperator
+from reg_stokeslet_surfaces.quadraticelements import quadraticelements
+from reg_stokeslet_surfaces.stokesletsolver import StokesletSolver
+
+
+def test_solve_matches_dense(sphere):
+    solver = StokesletSolver(sphere.TriangleArray, sphere.numberTrianglePoints,
+                             sphere.regularization, sphere.mu, A=sphere.A)
+    U = np.random.default_rng(0).standard_normal((sphere.A.shape[0], 2))
+    assert np.allclose(solver.solve(U), np.linalg.solve(sphere.A, U), rtol=0, atol=1e-10)
+
+
+def test_resistance_of_sphere(sphere):
+    solver = StokesletSolver(sphere.TriangleArray, sphere.numberTrianglePoints,
+                             sphere.regularization, sphere.mu)
+    resistance = solver.resistancematrix()
+    # Stokes drag 6 pi mu and torque 8 pi mu of the unit sphere, within the
+    # discretization error of the coarse mesh
+    assert np.allclose(np.diag(resistance)[:3], 6 * np.pi * sphere.mu, rtol=0.05)
+    assert np.allclose(np.diag(resistance)[3:], 8 * np.pi * sphere.mu, rtol=0.1)
+    assert np.allclose(resistance, resistance.T, rtol=0, atol=0.05 * np.abs(resistance).max())
+
+
+def test_float32_refined_matches_float64(sphere, relativeerror):
+    arguments = (sphere.TriangleArray, sphere.numberTrianglePoints, sphere.regularization,
+                 sphere.mu)
+    V = sphere.numberTrianglePoints
+    U = np.stack([np.tile([1.0, 0.0, 0.0], V), np.tile([0.0, 0.0, 2.0], V)], axis=1)
+    F = np.linalg.solve(sphere.A, U)
+
+    # residuals from the matrix-free operator, then from the given float64 A
+    matrixFree = StokesletSolver(*arguments, dtype=np.float32)
+    assert matrixFree.factorization[0].dtype == np.float32
+    assert relativeerror(matrixFree.solve(U), F) < 1e-10
+    given = StokesletSolver(*arguments, A=sphere.A, dtype=np.float32)
+    assert relativeerror(given.solve(U[:, 0]), F[:, 0]) < 1e-10
+
+
+def test_vertex_collocation_rejects_quadratic_elements(sphere):
+    nodes, elements = quadraticelements(sphere.TriangleArray)
+    arguments = (sphere.TriangleArray, nodes.shape[1], sphere.regularization, sphere.mu)
+    for collocation in (StokesletSolver, IncrementalStokesletMatrix):
+        with pytest.raises(ValueError):
+            collocation(*arguments, elements=elements)
+    with pytest.raises(ValueError):
+        MultiBodyStokesletOperator(*arguments, translations=np.zeros((1, 3)), elements=elements)
+
+
+def test_float32_rejects_nearfar(sphere):
+    with pytest.raises(ValueError):
+        StokesletSolver(sphere.TriangleArray, sphere.numberTrianglePoints, sphere.regularization,
+                        sphere.mu, dtype=np.float32, method='nearfar')
+
+
+def test_released_method_names(sphere):
+    solver = StokesletSolver(sphere.TriangleArray, sphere.numberTrianglePoints,
+                             sphere.regularization, sphere.mu, A=sphere.A)
+    assert np.array_equal(solver.rigid_body_velocities(), solver.rigidbodyvelocities())
+    F = solver.solve(solver.rigidbodyvelocities())
+    assert np.array_equal(solver.force_torque(F), solver.forcetorque(F))
+    assert solver.resistance_matrix() is solver.resistancematrix()
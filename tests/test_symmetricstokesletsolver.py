@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from reg_stokeslet_surfaces.stokesletsolver import StokesletSolver
+from reg_stokeslet_surfaces.symmetricstokesletsolver import SymmetricStokesletSolver
+from reg_stokeslet_surfaces.triangulatesphereicos import triangulatesphereicos
+
+
+@pytest.mark.parametrize('factor', [2, 3])
+def test_matches_dense_solver(sphere, relativeerror, factor):
+    TriangleArray, points, _ = triangulatesphereicos(factor, 1, symmetric=True)
+    arguments = (TriangleArray, points.shape[1], sphere.regularization, sphere.mu)
+    U = np.random.default_rng(factor).standard_normal((3 * points.shape[1], 3))
+    F = SymmetricStokesletSolver(*arguments).solve(U)
+    assert relativeerror(F, StokesletSolver(*arguments).solve(U)) < 1e-12
+    assert F.shape == U.shape
+
+
+def test_rejects_nonsymmetric_grid(sphere):
+    with pytest.raises(ValueError):
+        SymmetricStokesletSolver(sphere.TriangleArray, sphere.numberTrianglePoints,
+                                 sphere.regularization, sphere.mu)
+
+
+def test_rejects_float32(sphere):
+    TriangleArray, points, _ = triangulatesphereicos(2, 1, symmetric=True)
+    with pytest.raises(ValueError):
+        SymmetricStokesletSolver(TriangleArray, points.shape[1], sphere.regularization,
+                                 sphere.mu, dtype=np.float32)
@@ -0,0 +1,77 @@
+import numpy as np
+from scipy.integrate import dblquad
+
+from reg_stokeslet_surfaces.abmnq import abmnq
+from reg_stokeslet_surfaces.computebasecasesbatch import computebasecasesbatch
+from reg_stokeslet_surfaces.computet003side import computet003side
+from reg_stokeslet_surfaces.tmnqrecursion import tmnqindex, tmnqrecursion
+from reg_stokeslet_surfaces.tqequals1 import tqequals1
+from reg_stokeslet_surfaces.tqequals3 import tqequals3
+
+REGULARIZATION = 0.05
+
+
+def basecases(sphere):
+    """Base cases of three faces at four field points around them."""
+    faceData = sphere.TriangleArray[0:3].facedata()
+    xField = np.random.default_rng(0).normal(size=(3, 4)) * 0.6
+    return faceData, xField, computebasecasesbatch(xField, faceData, REGULARIZATION)
+
+
+def test_linear_order_matches_tqequals(sphere, relativeerror):
+    _, _, (t003, t001, se1m1, se2m1, sdm1, se1p1, se2p1, sdp1, geometryData) = basecases(sphere)
+    T = tmnqrecursion(3, t003, t001, (se1p1, se2p1, sdp1), (se1m1, se2m1, sdm1),
+                      geometryData)['T']
+    t101, t011 = tqequals1(se1m1, se2m1, sdm1, t001, geometryData)
+    assert relativeerror(T[1][tmnqindex(1, 0)], t101) < 1e-13
+    assert relativeerror(T[1][tmnqindex(0, 1)], t011) < 1e-13
+    exact = tqequals3(se1p1, se2p1, sdp1, se1m1, se2m1, sdm1, t001, t003, t101, t011,
+                      geometryData)
+    terms = [(1, 0), (0, 1), (2, 0), (0, 2), (1, 1), (3, 0), (0, 3), (2, 1), (1, 2)]
+    for (m, n), t in zip(terms, exact):
+        assert relativeerror(T[3][tmnqindex(m, n)], t) < 1e-12, (m, n)
+
+
+def test_higher_orders_match_quadrature(sphere):
+    faceData, xField, (t003, t001, se1m1, se2m1, sdm1, se1p1, se2p1, sdp1, geometryData) = \
+        basecases(sphere)
+    maxOrder = 5
+    T = tmnqrecursion(maxOrder, t003, t001, (se1p1, se2p1, sdp1), (se1m1, se2m1, sdm1),
+                      geometryData)['T']
+    face, point = 1, 2
+    vertices = faceData['vertices'][face]
+    x = xField[:, point]
+
+    def y(s, t):
+        return vertices[:, 0] + s * (vertices[:, 1] - vertices[:, 0]) \
+            + t * (vertices[:, 2] - vertices[:, 1])
+
+    for q, table in T.items():
+        for order in range(maxOrder - 3 + q + 1):
+            for n in range(order + 1):
+                m = order - n
+                exact = dblquad(lambda t, s: s**m * t**n * (np.sum((x - y(s, t))**2)
+                                                            + REGULARIZATION**2)**(-q / 2),
+                                0, 1, 0, lambda s: s, epsabs=1e-13, epsrel=1e-12)[0]
+                assert abs(table[tmnqindex(m, n), face, point] - exact) < 1e-10 * abs(exact), \
+                    (m, n, q)
+
+
+def test_side_integrals_guard_float32_inputs(sphere):
+    _, _, (t003, t001, se1m1, se2m1, sdm1, se1p1, se2p1, sdp1, geometryData) = basecases(sphere)
+    lineIntegrals = (se2p1 - sdp1, se1p1, se2p1, sdp1, se1m1, se2m1, sdm1)
+    # inputs rounded to float32, and the same values in float64
+    single = [value.astype(np.float32) for value in lineIntegrals]
+    singleGeometry = {key: np.asarray(value, dtype=np.float32)
+                      for key, value in geometryData.items()}
+    rounded = [value.astype(float) for value in single]
+    roundedGeometry = {key: value.astype(float) for key, value in singleGeometry.items()}
+
+    # both guards compute in float64
+    for value, exact in zip(abmnq(*single, singleGeometry), abmnq(*rounded, roundedGeometry)):
+        assert value.dtype == np.float64
+        assert np.array_equal(value, exact)
+    sides = [singleGeometry[key] for key in ('x0DotV', 'x0DotN1', 'gamma')]
+    side = computet003side(*sides, 0.3)
+    assert side.dtype == np.float64
+    assert np.array_equal(side, computet003side(*[value.astype(float) for value in sides], 0.3))
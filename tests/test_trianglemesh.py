@@ -0,0 +1,60 @@
+import numpy as np
+
+from reg_stokeslet_surfaces.assemblestokesletmatrix import assemblestokesletmatrix
+from reg_stokeslet_surfaces.trianglemesh import TRIANGLE_FIELDS, TriangleMesh
+from reg_stokeslet_surfaces.triangulatesphereicos import create_triangle_dict
+
+
+def facedictionary(xyzPts, indices):
+    """
+    Triangle dictionary of one face computed on its own, as the loop of
+    create_triangle_dict did before TriangleMesh.
+    """
+    pt1, pt2, pt3 = (xyzPts[:, i] for i in indices)
+    if np.dot(np.cross(pt1 - pt2, pt2 - pt3), pt1) < 0:
+        pt1, pt3 = pt3, pt1
+        indices = indices[::-1]
+    directions = np.column_stack([pt1 - pt2, pt2 - pt3, pt3 - pt1])
+    lengths = np.linalg.norm(directions, axis=0)
+    directions = directions / lengths
+    normaltoplane = np.cross(directions[:, 0], directions[:, 1])
+    normaltoplane /= np.linalg.norm(normaltoplane)
+    normalstosides = np.column_stack([np.cross(normaltoplane, directions[:, i])
+                                      for i in range(3)])
+    ht1 = lengths[1] * np.dot(directions[:, 1], normalstosides[:, 0])
+    bh = lengths[0] * ht1
+    return {'vertices': np.column_stack([pt1, pt2, pt3]), 'indices': indices,
+            'directions': directions, 'normaltoplane': normaltoplane,
+            'normalstosides': normalstosides, 'lengths': lengths,
+            'heights': np.array([ht1, bh / lengths[1], bh / lengths[2]]), 'bh': bh}
+
+
+def test_todicts_matches_per_face_dictionaries(sphere):
+    faces = np.array(sphere.faces, dtype=int)
+    # unoriented faces, so the flips are exercised
+    faces[:, ::2] = faces[::-1, ::2]
+    mesh = TriangleMesh(sphere.points, faces)
+    dicts = create_triangle_dict(sphere.points, faces.astype(float))
+    assert len(mesh) == len(dicts) == faces.shape[1]
+    for q, (Triangle, fromDicts) in enumerate(zip(mesh.todicts(), dicts)):
+        expected = facedictionary(sphere.points, faces[:, q])
+        for key in TRIANGLE_FIELDS:
+            assert np.allclose(Triangle[key], expected[key], rtol=1e-13, atol=1e-15), key
+            assert np.array_equal(fromDicts[key], Triangle[key]), key
+
+
+def test_fromdicts_round_trip(sphere):
+    mesh = TriangleMesh(sphere.points, sphere.faces)
+    stacked = TriangleMesh.fromdicts(mesh.todicts())
+    for key in TRIANGLE_FIELDS:
+        assert np.array_equal(getattr(stacked, key), getattr(mesh, key)), key
+    assert np.array_equal(stacked.points, sphere.points)
+    # slicing keeps the faces
+    assert np.array_equal(mesh[5:9].indices, mesh.indices[5:9])
+
+
+def test_mesh_and_dicts_assemble_alike(sphere, relativeerror):
+    dicts = sphere.TriangleArray.todicts()
+    A = assemblestokesletmatrix(sphere.points, dicts, sphere.numberTrianglePoints,
+                                sphere.regularization, sphere.mu)
+    assert relativeerror(A, sphere.A) < 1e-14